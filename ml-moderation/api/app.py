@@ -3,10 +3,20 @@ Flask API Server for Moderation Service
 Expose moderation service qua REST API
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from moderation_service import ModerationService
+from rule_validators import TextValidator
+from job_queue import JobQueue, QueueFull, QueueClosed, check_callback_url
+from model_reloader import ModelReloader
+from moderation_service import ModelReloadError
+from request_log import RequestLogger
+from profiler import StackProfiler
+from runtime_config import RuntimeConfig
+import metrics
 import os
+import time
+import uuid
 from datetime import datetime
 
 
@@ -15,13 +25,91 @@ CORS(app)  # Enable CORS cho tất cả origins
 
 # Initialize moderation service
 models_dir = os.path.join(os.path.dirname(__file__), '..', 'models')
-moderation_service = ModerationService(models_dir=models_dir)
+moderation_service = ModerationService(
+    models_dir=models_dir,
+    cache_size=int(os.getenv('MODERATION_CACHE_SIZE', 1024)),
+    cache_ttl=float(os.getenv('MODERATION_CACHE_TTL', 300)),
+    batch_max_size=int(os.getenv('MODERATION_BATCH_MAX_SIZE', 32)),
+    batch_max_wait_ms=float(os.getenv('MODERATION_BATCH_MAX_WAIT_MS', 2)),
+    price_backend=os.getenv('ML_PRICE_BACKEND', 'xgboost'),
+    predict_threads=int(os.getenv('ML_PREDICT_THREADS', 1))
+)
+
+# Queue cho /api/moderate/async (threads start lazy trong từng worker process)
+job_queue = JobQueue(
+    handler=moderation_service.moderate,
+    workers=int(os.getenv('MODERATION_ASYNC_WORKERS', 2)),
+    max_size=int(os.getenv('MODERATION_QUEUE_SIZE', 256)),
+    result_ttl=float(os.getenv('MODERATION_JOB_TTL', 600)),
+    callback_hosts=os.getenv('MODERATION_CALLBACK_HOSTS', '').split(',')
+)
+
+# Hot reload models (watcher bật khi ML_MODEL_WATCH_INTERVAL > 0)
+model_reloader = ModelReloader(
+    moderation_service,
+    watch_interval=float(os.getenv('ML_MODEL_WATCH_INTERVAL', 0))
+)
+
+# Request log JSON (ghi ở background thread, sample request thành công)
+request_logger = RequestLogger(
+    sample_rate=float(os.getenv('ML_LOG_SAMPLE_RATE', 0.1)),
+    queue_size=int(os.getenv('ML_LOG_QUEUE_SIZE', 10000))
+)
+
+# Thresholds / keywords của POST /api/config: lưu ở file chung để mọi worker
+# dùng cùng config (áp dụng config đã lưu ngay lúc khởi động)
+runtime_config = RuntimeConfig(
+    moderation_service,
+    os.getenv('MODERATION_CONFIG_PATH', os.path.join(models_dir, 'runtime_config.json'))
+)
+runtime_config.sync()
+
+# Profiler lấy mẫu stack (header X-Profile: 1 hoặc theo ML_PROFILE_SAMPLE_RATE).
+# Mặc định tắt: header X-Profile bị bỏ qua và /api/debug/profile trả 404,
+# bật bằng ML_PROFILE_ENABLED=1 (chỉ nên bật khi API không public)
+request_profiler = StackProfiler(
+    enabled=os.getenv('ML_PROFILE_ENABLED', '0') in ('1', 'true'),
+    sample_rate=float(os.getenv('ML_PROFILE_SAMPLE_RATE', 0)),
+    interval_ms=float(os.getenv('ML_PROFILE_INTERVAL_MS', 5)),
+    max_stacks=int(os.getenv('ML_PROFILE_MAX_STACKS', 2000))
+)
 
 print('=' * 60)
 print('🤖 ML Moderation Service Started')
 print('=' * 60)
 
 
+@app.before_request
+def start_model_watcher():
+    # Watcher thread phải start trong worker process (sau fork), không phải master
+    model_reloader.ensure_watching()
+    # Config do worker khác đổi qua POST /api/config
+    runtime_config.sync()
+    g.request_start = time.perf_counter()
+    # Dùng request id của client (Node.js backend) nếu có, để nối log 2 bên
+    g.request_id = request.headers.get('X-Request-ID', '')[:128] or uuid.uuid4().hex
+
+
+@app.after_request
+def add_model_version(response):
+    """Model version đang phục vụ, trả về trong header của mọi response"""
+    version = moderation_service.ml_predictor.model_version
+    if version:
+        response.headers['X-Model-Version'] = version
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    if g.get('profiled'):
+        response.headers['X-Profiled'] = '1'
+    
+    # Latency + status theo endpoint (tên route, không phải URL, để job_id
+    # không tạo ra label mới)
+    endpoint = request.endpoint or 'unknown'
+    if 'request_start' in g:
+        metrics.REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - g.request_start)
+    metrics.REQUESTS.labels(endpoint, response.status_code).inc()
+    return response
+
+
 @app.route('/')
 def home():
     """Health check endpoint"""
@@ -70,25 +158,114 @@ def moderate():
         
         property_data = data['property']
         
-        # Moderate
-        result = moderation_service.moderate(property_data)
+        # Moderate (trace ghi thời gian từng stage cho request log)
+        trace = metrics.start_trace()
+        try:
+            with request_profiler.profile(request.headers.get('X-Profile'), 'moderate') as profiled:
+                result = moderation_service.moderate(property_data)
+            g.profiled = profiled
+        finally:
+            metrics.stop_trace()
         
-        # Log request
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Moderated property")
-        print(f"  Title: {property_data.get('title', 'N/A')[:50]}")
-        print(f"  Score: {result['overall_score']}")
-        print(f"  Decision: {result['decision']}")
+        request_logger.log_moderation(
+            g.request_id, property_data, result, trace,
+            (time.perf_counter() - g.request_start) * 1000
+        )
         
         return jsonify(result), 200
     
     except Exception as e:
-        print(f"Error in /api/moderate: {e}")
+        request_logger.log_error(g.request_id, '/api/moderate', e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/moderate/async', methods=['POST'])
+def moderate_async():
+    """
+    Moderate bất đồng bộ: trả về job_id ngay, kết quả lấy qua
+    GET /api/moderate/jobs/<job_id> hoặc POST về callback_url
+    
+    Request Body:
+    {
+        "property": {...},
+        "callback_url": "https://..."   (optional)
+    }
+    
+    Response (202):
+    {
+        "success": true,
+        "job_id": "...",
+        "status": "queued",
+        "status_url": "/api/moderate/jobs/..."
+    }
+    
+    429 khi queue đầy (kèm header Retry-After)
+    400 khi callback_url không hợp lệ: host phải nằm trong
+    MODERATION_CALLBACK_HOSTS, hoặc (khi không đặt biến này) là địa chỉ public
+    
+    Job chỉ nằm trong memory của worker process nhận request: với
+    ML_WORKERS > 1, poll status_url có thể rơi vào worker khác và trả 404.
+    Khi chạy nhiều workers nên dùng callback_url (hoặc 1 worker riêng cho
+    endpoint này).
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or 'property' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Missing property data in request body'
+            }), 400
+        
+        callback_url = data.get('callback_url')
+        if callback_url is not None:
+            error = check_callback_url(callback_url, job_queue.callback_hosts)
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
+        
+        try:
+            job = job_queue.submit(data['property'], callback_url=callback_url)
+        except QueueFull as e:
+            response = jsonify({'success': False, 'error': str(e)})
+            response.headers['Retry-After'] = '1'
+            return response, 429
+        except QueueClosed as e:
+            return jsonify({'success': False, 'error': str(e)}), 503
+        
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'status_url': f"/api/moderate/jobs/{job['job_id']}"
+        }), 202
+    
+    except Exception as e:
+        request_logger.log_error(g.request_id, '/api/moderate/async', e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
+@app.route('/api/moderate/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Trạng thái job: queued / running / done / failed
+    Khi status = done, field result chứa response giống /api/moderate
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found or expired'
+        }), 404
+    
+    return jsonify({'success': True, **job}), 200
+
+
 @app.route('/api/moderate/batch', methods=['POST'])
 def moderate_batch():
     """
@@ -126,9 +303,18 @@ def moderate_batch():
             }), 400
         
         # Batch moderate
-        results = moderation_service.batch_moderate(properties)
+        trace = metrics.start_trace()
+        try:
+            with request_profiler.profile(request.headers.get('X-Profile'), 'moderate_batch') as profiled:
+                results = moderation_service.batch_moderate(properties)
+            g.profiled = profiled
+        finally:
+            metrics.stop_trace()
         
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Batch moderated {len(properties)} properties")
+        request_logger.log_batch(
+            g.request_id, results, trace,
+            (time.perf_counter() - g.request_start) * 1000
+        )
         
         return jsonify({
             'success': True,
@@ -137,7 +323,7 @@ def moderate_batch():
         }), 200
     
     except Exception as e:
-        print(f"Error in /api/moderate/batch: {e}")
+        request_logger.log_error(g.request_id, '/api/moderate/batch', e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -155,14 +341,132 @@ def health():
             'anomaly_model': moderation_service.ml_predictor.anomaly_model is not None,
             'scaler': moderation_service.ml_predictor.scaler is not None
         },
+        'models': {
+            'version': moderation_service.ml_predictor.model_version,
+            'load_ms': moderation_service.ml_predictor.load_times,
+            'price_backend': moderation_service.price_backend,
+            'predict_threads': moderation_service.predict_threads
+        },
         'thresholds': {
             'auto_approve': moderation_service.AUTO_APPROVE_THRESHOLD,
             'reject': moderation_service.REJECT_THRESHOLD
         },
+        'cache': moderation_service.result_cache.stats(),
+        'stage_memos': moderation_service.stage_memo_stats(),
+        'micro_batching': moderation_service.price_batcher.stats(),
+        'job_queue': job_queue.stats(),
+        'stage_latency': metrics.STAGE_SECONDS.summary(),
+        'request_log': request_logger.stats(),
+        'profiler': request_profiler.stats(),
         'timestamp': datetime.now().isoformat()
     }), 200
 
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Metrics dạng Prometheus text format: latency từng stage của pipeline,
+    số kết quả theo decision, latency / status từng endpoint, models đang
+    phục vụ (xem metrics.py)
+    """
+    predictor = moderation_service.ml_predictor
+    metrics.update_model_gauges(predictor, model_reloader.status())
+    metrics.update_cache_counters({
+        'result': moderation_service.result_cache.stats(),
+        **moderation_service.stage_memo_stats()
+    })
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.route('/api/debug/profile', methods=['GET', 'DELETE'])
+def debug_profile():
+    """
+    Kết quả của profiler lấy mẫu stack (profiler.py), cộng dồn từ lần xóa
+    trước, của worker process trả lời request
+    
+    Query:
+    - format=folded (mặc định): text `frame;frame;... count`, dùng thẳng với
+      flamegraph.pl / speedscope
+    - format=json: stats, top frames và các stacks
+    - reset=1: xóa dữ liệu sau khi đọc
+    
+    DELETE: xóa dữ liệu
+    
+    404 khi profiler tắt (ML_PROFILE_ENABLED không bật)
+    """
+    if not request_profiler.enabled:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    
+    if request.method == 'DELETE':
+        request_profiler.clear()
+        return jsonify({'success': True}), 200
+    
+    if request.args.get('format') == 'json':
+        body = jsonify({
+            'stats': request_profiler.stats(),
+            'top_frames': request_profiler.top_functions(),
+            'stacks': request_profiler.folded().splitlines()
+        })
+    else:
+        body = Response(request_profiler.folded(), mimetype='text/plain')
+    
+    if request.args.get('reset') in ('1', 'true'):
+        request_profiler.clear()
+    return body
+
+
+@app.route('/api/models', methods=['GET'])
+def models_status():
+    """Model version đang chạy + trạng thái reload gần nhất"""
+    return jsonify({
+        'success': True,
+        'load_ms': moderation_service.ml_predictor.load_times,
+        **model_reloader.status()
+    }), 200
+
+
+@app.route('/api/models/reload', methods=['POST'])
+def reload_models():
+    """
+    Load models mới từ models/ mà không restart server
+    
+    Models mới được load + smoke test ở background, xong mới swap;
+    request đang chạy vẫn xong trên models cũ.
+    
+    Query: ?wait=1 để chờ reload xong rồi mới trả response
+    
+    Response:
+    - 202: đã bắt đầu reload (xem kết quả ở GET /api/models)
+    - 200: (wait=1) reload thành công
+    - 409: đang có reload khác chạy
+    - 422: (wait=1) models mới lỗi, vẫn giữ models cũ
+    """
+    if request.args.get('wait') in ('1', 'true'):
+        try:
+            result = model_reloader.reload(trigger='api')
+        except RuntimeError as e:
+            return jsonify({'success': False, 'error': str(e)}), 409
+        except ModelReloadError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'version': moderation_service.ml_predictor.model_version
+            }), 422
+        return jsonify({'success': True, **result}), 200
+    
+    if not model_reloader.start(trigger='api'):
+        return jsonify({
+            'success': False,
+            'error': 'A model reload is already in progress'
+        }), 409
+    
+    return jsonify({
+        'success': True,
+        'status': 'reloading',
+        'status_url': '/api/models'
+    }), 202
+
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """Get current configuration"""
@@ -178,29 +482,43 @@ def get_config():
         'models_status': {
             'price_model_loaded': moderation_service.ml_predictor.price_model is not None,
             'anomaly_model_loaded': moderation_service.ml_predictor.anomaly_model is not None
+        },
+        'keywords': {
+            'spam': TextValidator.SPAM_KEYWORDS,
+            'forbidden': TextValidator.FORBIDDEN_WORDS
         }
     }), 200
 
 
 @app.route('/api/config', methods=['POST'])
 def update_config():
-    """Update configuration (thresholds)"""
+    """
+    Update configuration (thresholds, keyword lists)
+    
+    Config được ghi vào file chung (runtime_config.py) rồi mới áp dụng, các
+    worker khác áp dụng trước request kế tiếp của chúng
+    """
     try:
         data = request.get_json()
+        changes = {}
+        
+        for key in ('auto_approve_threshold', 'reject_threshold'):
+            if key in data:
+                threshold = float(data[key])
+                if not 0 <= threshold <= 1:
+                    return jsonify({'error': 'Threshold must be between 0 and 1'}), 400
+                changes[key] = threshold
         
-        if 'auto_approve_threshold' in data:
-            threshold = float(data['auto_approve_threshold'])
-            if 0 <= threshold <= 1:
-                moderation_service.AUTO_APPROVE_THRESHOLD = threshold
-            else:
-                return jsonify({'error': 'Threshold must be between 0 and 1'}), 400
+        # Hot-reload keyword lists (build lại matcher, không cần restart)
+        for key in ('spam_keywords', 'forbidden_words'):
+            if key in data:
+                words = data[key]
+                if not isinstance(words, list) or not all(isinstance(w, str) for w in words):
+                    return jsonify({'error': f'{key} must be an array of strings'}), 400
+                changes[key] = words
         
-        if 'reject_threshold' in data:
-            threshold = float(data['reject_threshold'])
-            if 0 <= threshold <= 1:
-                moderation_service.REJECT_THRESHOLD = threshold
-            else:
-                return jsonify({'error': 'Threshold must be between 0 and 1'}), 400
+        if changes:
+            runtime_config.update(changes)
         
         return jsonify({
             'success': True,
@@ -208,6 +526,10 @@ def update_config():
             'thresholds': {
                 'auto_approve': moderation_service.AUTO_APPROVE_THRESHOLD,
                 'reject': moderation_service.REJECT_THRESHOLD
+            },
+            'keywords': {
+                'spam': len(TextValidator.SPAM_KEYWORDS),
+                'forbidden': len(TextValidator.FORBIDDEN_WORDS)
             }
         }), 200
     
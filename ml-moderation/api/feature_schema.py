@@ -0,0 +1,606 @@
+"""
+Feature schema dùng chung cho training scripts và API
+
+Mỗi feature được khai báo 1 lần ở đây (đọc từ field nào của document,
+encode ra sao, tính từ features nào). Cả 1_data_preparation, 2_train,
+3_train lẫn MLPredictor đều lấy features qua FEATURE_SCHEMA.compile(...),
+nên training và serving luôn ra cùng giá trị.
+
+Encoding ổn định giữa các process/máy: category dùng bảng cố định, các
+giá trị không có trong bảng (district) dùng crc32 (hash() của Python bị
+salt theo process nên không dùng được).
+
+Đổi cách tính của feature đã có -> tăng SCHEMA_VERSION. Version được
+ghi vào model bundle, API cảnh báo / từ chối models train bằng schema khác.
+"""
+
+import zlib
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+SCHEMA_VERSION = 1
+
+
+# ============================================================
+# Encoding helpers
+# ============================================================
+
+# Tiền tố hành chính bỏ đi khi so khớp tên ('Quận Bình Thạnh' == 'Bình Thạnh')
+_ADMIN_PREFIXES = ('thành phố ', 'tp. ', 'tp.', 'tp ', 'tỉnh ', 'quận ', 'huyện ', 'thị xã ')
+
+
+def normalize_text(value) -> str:
+    """Chuẩn hoá tên địa danh: NFC, lowercase, bỏ khoảng trắng thừa và tiền tố hành chính"""
+    if value is None:
+        return ''
+    text = ' '.join(unicodedata.normalize('NFC', str(value)).lower().split())
+    for prefix in _ADMIN_PREFIXES:
+        if text.startswith(prefix) and not text[len(prefix):].strip().isdigit():
+            return text[len(prefix):].strip()
+    return text
+
+
+def stable_bucket(value, buckets: int) -> int:
+    """crc32 của tên đã chuẩn hoá, 1..buckets (0 = rỗng)"""
+    text = normalize_text(value)
+    if not text:
+        return 0
+    return zlib.crc32(text.encode('utf-8')) % buckets + 1
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """numerator / denominator, bằng 0 khi denominator <= 0 (hoặc NaN)"""
+    result = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=result, where=denominator > 0)
+    return result
+
+
+# ============================================================
+# Feature definitions
+# ============================================================
+
+class Feature:
+    """
+    Base class: 1 cột feature
+    
+    Source features đọc từng document (value), derived features tính từ
+    các cột khác (compute). Text features chỉ dùng cho DataFrame, không đưa
+    vào ma trận numeric.
+    """
+    
+    numeric = True
+    inputs: Sequence[str] = ()
+    
+    def __init__(self, name: str):
+        self.name = name
+    
+    def value(self, record: Dict):
+        """Giá trị của feature cho 1 document (số, hoặc str với Text)"""
+        raise NotImplementedError
+    
+    def from_column(self, column) -> np.ndarray:
+        """Cột feature đã có sẵn trong DataFrame"""
+        return np.asarray(column, dtype=np.float64 if self.numeric else object)
+
+
+def _first_getter(paths: Sequence[str]) -> Callable[[Dict], object]:
+    """
+    Hàm lấy giá trị của path đầu tiên khác None. Các path liền nhau cùng
+    dict cha (amenities.wifi, amenities.hasWifi) chỉ đi xuống dict cha 1 lần.
+    """
+    groups = []
+    for path in paths:
+        *parent, key = path.split('.')
+        if groups and groups[-1][0] == parent:
+            groups[-1][1].append(key)
+        else:
+            groups.append((parent, [key]))
+    
+    # Trường hợp thường gặp: 'price', 'amenities.wifi', ('amenities.wifi', 'amenities.hasWifi')
+    if len(groups) == 1 and len(groups[0][0]) <= 1:
+        parent, keys = groups[0]
+        if not parent and len(keys) == 1:
+            (key,) = keys
+            return lambda record: record.get(key)
+        if len(keys) == 1:
+            (parent_key,), (key,) = parent, keys
+            
+            def get(record):
+                value = record.get(parent_key)
+                return value.get(key) if isinstance(value, dict) else None
+            return get
+        if parent:
+            (parent_key,) = parent
+            
+            def get_any(record):
+                value = record.get(parent_key)
+                if isinstance(value, dict):
+                    for key in keys:
+                        item = value.get(key)
+                        if item is not None:
+                            return item
+                return None
+            return get_any
+    
+    def first(record):
+        for parent, keys in groups:
+            value = record
+            for parent_key in parent:
+                value = value.get(parent_key) if isinstance(value, dict) else None
+            if isinstance(value, dict):
+                for key in keys:
+                    item = value.get(key)
+                    if item is not None:
+                        return item
+        return None
+    
+    return first
+
+
+class _SourceFeature(Feature):
+    """Đọc giá trị từ path đầu tiên có giá trị (hỗ trợ nhiều schema document)"""
+    
+    def __init__(self, name: str, paths: Sequence[str]):
+        super().__init__(name)
+        self.paths = tuple(paths)
+        self._first = _first_getter(self.paths)
+
+
+class Number(_SourceFeature):
+    """Giá trị số, thiếu -> default (NaN = missing, XGBoost/IsolationForest xử lý được)"""
+    
+    def __init__(self, name: str, paths: Sequence[str], default: float = np.nan):
+        super().__init__(name, paths)
+        self.default = default
+    
+    def value(self, record):
+        value = self._first(record)
+        return self.default if value is None else value
+
+
+class Coordinate(_SourceFeature):
+    """1 phần tử của GeoJSON coordinates [longitude, latitude]"""
+    
+    def __init__(self, name: str, index: int, default: float, path: str = 'location.coordinates'):
+        super().__init__(name, (path,))
+        self.index = index
+        self.default = default
+    
+    def value(self, record):
+        value = self._first(record)
+        if isinstance(value, (list, tuple)) and len(value) > self.index:
+            return value[self.index]
+        return self.default
+
+
+class Text(_SourceFeature):
+    """Chuỗi gốc (province, district...) để báo cáo/group, không phải input của model"""
+    
+    numeric = False
+    
+    def value(self, record):
+        value = self._first(record)
+        return '' if value is None else str(value)
+
+
+class _LookupFeature(_SourceFeature):
+    """
+    Encode tên -> mã số, có bảng tra cứu theo giá trị gốc dùng chung cho
+    mọi lần extract (normalize_text/crc32 chỉ chạy 1 lần cho mỗi tên)
+    """
+    
+    MAX_CACHED = 10000
+    
+    def __init__(self, name: str, paths: Sequence[str]):
+        super().__init__(name, paths)
+        self._codes: Dict = {}
+    
+    def encode(self, value) -> int:
+        raise NotImplementedError
+    
+    def value(self, record):
+        value = self._first(record)
+        try:
+            return self._codes[value]
+        except KeyError:
+            pass
+        except TypeError:
+            # Giá trị không hash được (list, dict...)
+            return self.encode(value)
+        code = self.encode(value)
+        if len(self._codes) >= self.MAX_CACHED:
+            self._codes.clear()
+        self._codes[value] = code
+        return code
+
+
+class Category(_LookupFeature):
+    """
+    Encode theo bảng cố định {code: [tên, alias...]}, so khớp sau normalize_text;
+    không có trong bảng -> default
+    """
+    
+    def __init__(self, name: str, paths: Sequence[str], table: Dict[int, Sequence[str]], default: int = 0):
+        super().__init__(name, paths)
+        self.default = default
+        self.lookup = {
+            normalize_text(alias): code for code, aliases in table.items() for alias in aliases
+        }
+    
+    def encode(self, value) -> int:
+        return self.lookup.get(normalize_text(value), self.default)
+
+
+class HashBucket(_LookupFeature):
+    """Encode tên tự do (không có bảng cố định) bằng stable_bucket"""
+    
+    def __init__(self, name: str, paths: Sequence[str], buckets: int):
+        super().__init__(name, paths)
+        self.buckets = buckets
+    
+    def encode(self, value) -> int:
+        return stable_bucket(value, self.buckets)
+
+
+class Flag(_SourceFeature):
+    """Tiện nghi có/không (1/0), đọc từ amenities.<key> theo nhiều tên"""
+    
+    def __init__(self, name: str, keys: Sequence[str]):
+        super().__init__(name, [f'amenities.{key}' for key in keys])
+    
+    def value(self, record):
+        return 1.0 if self._first(record) else 0.0
+
+
+class Input(Feature):
+    """Giá trị truyền vào lúc extract (vd. predicted_price từ price model)"""
+    
+    def value(self, record):
+        raise KeyError(f'Feature {self.name!r} must be passed in inputs')
+
+
+class Derived(Feature):
+    """Tính vector hoá từ các cột khác: fn(*input_columns)"""
+    
+    def __init__(self, name: str, inputs: Sequence[str], fn: Callable[..., np.ndarray]):
+        super().__init__(name)
+        self.inputs = tuple(inputs)
+        self.fn = fn
+    
+    def compute(self, columns: Sequence[np.ndarray], stats: Dict) -> np.ndarray:
+        return self.fn(*columns)
+
+
+class ZScore(Derived):
+    """(x - mean) / std, mean/std lấy từ training (stats[source])"""
+    
+    def __init__(self, name: str, source: str):
+        super().__init__(name, (source,), None)
+        self.source = source
+    
+    def compute(self, columns, stats):
+        if self.source not in stats:
+            raise KeyError(f'Feature {self.name!r} needs stats for {self.source!r}')
+        mean, std = stats[self.source]['mean'], stats[self.source]['std']
+        return (columns[0] - mean) / std if std else 0.0
+
+
+# ============================================================
+# Schema
+# ============================================================
+
+class FeatureSchema:
+    """Tập feature definitions theo tên"""
+    
+    def __init__(self, features: Iterable[Feature], version: int = SCHEMA_VERSION):
+        self.version = version
+        self.features = {}
+        for feature in features:
+            if feature.name in self.features:
+                raise ValueError(f'Duplicate feature {feature.name!r}')
+            self.features[feature.name] = feature
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self.features
+    
+    def compile(
+        self,
+        feature_names: Sequence[str],
+        stats: Optional[Dict] = None,
+        dtype=np.float64
+    ) -> 'FeatureExtractor':
+        """
+        Extractor cho đúng feature_names (theo thứ tự), kèm các cột trung gian
+        mà derived features cần
+        
+        dtype: kiểu của ma trận transform trả về (float32 cho models tự ép
+        input về float32 như XGBoost / IsolationForest)
+        
+        Raises:
+            KeyError: feature không có trong schema, hoặc thiếu stats
+        """
+        return FeatureExtractor(self, feature_names, stats or {}, dtype=dtype)
+
+
+class FeatureExtractor:
+    """
+    Extractor đã compile, tạo 1 lần khi load model
+    
+    Mỗi cột numeric có 1 slot cố định trong buffer (n_slots, n_rows):
+    source features được đọc theo row (1 lượt qua mỗi document, không tạo
+    dict trung gian), derived features là phép NumPy trên cả slot, cuối
+    cùng các slot output được copy vào ma trận (n_rows, n_features) theo
+    thứ tự feature_names. Dùng chung cho list document (request batch,
+    cursor MongoDB) và DataFrame training.
+    """
+    
+    # Batch tới từng này rows thì đọc source features theo row
+    ROW_READ_MAX = 16
+    
+    def __init__(self, schema: FeatureSchema, feature_names: Sequence[str], stats: Dict, dtype=np.float64):
+        self.schema = schema
+        self.feature_names = list(feature_names)
+        self.stats = stats
+        self.dtype = np.dtype(dtype)
+        self.plan: List[Feature] = []
+        self.required_inputs: List[str] = []
+        seen = set()
+        
+        def visit(name):
+            if name in seen:
+                return
+            if name not in schema.features:
+                raise KeyError(f'Unknown feature {name!r} (schema v{schema.version})')
+            feature = schema.features[name]
+            for dependency in feature.inputs:
+                visit(dependency)
+            seen.add(name)
+            self.plan.append(feature)
+            if isinstance(feature, Input):
+                self.required_inputs.append(name)
+            if isinstance(feature, ZScore) and feature.source not in stats:
+                raise KeyError(f'Feature {name!r} needs stats for {feature.source!r}')
+        
+        for name in self.feature_names:
+            visit(name)
+        
+        # Slot: source features trước (buffer[:n_sources]), sau đó inputs/derived
+        numeric = [feature for feature in self.plan if feature.numeric]
+        self._sources = [feature for feature in numeric if isinstance(feature, _SourceFeature)]
+        computed = [feature for feature in numeric if not isinstance(feature, _SourceFeature)]
+        self.slots = {feature.name: slot for slot, feature in enumerate(self._sources + computed)}
+        self.text_features = [feature for feature in self.plan if not feature.numeric]
+        self._values = [feature.value for feature in self._sources]
+        self._inputs = [(self.slots[name], name) for name in self.required_inputs]
+        self._derived = [
+            (self.slots[f.name], f, [self.slots[name] for name in f.inputs])
+            for f in numeric if isinstance(f, Derived)
+        ]
+        self._output_slots = None
+        if all(name in self.slots for name in self.feature_names):
+            self._output_slots = np.array([self.slots[name] for name in self.feature_names], dtype=np.intp)
+    
+    def source_paths(self) -> List[str]:
+        """Các path của document mà source features đọc (projection khi query MongoDB)"""
+        paths = []
+        for feature in self.plan:
+            if isinstance(feature, _SourceFeature):
+                paths.extend(path for path in feature.paths if path not in paths)
+        return paths
+    
+    def _fill(self, n_rows: int, read_sources: Callable[[np.ndarray], None], inputs: Optional[Dict]) -> np.ndarray:
+        """Buffer (n_slots, n_rows) float64: source slots qua read_sources, rồi inputs và derived"""
+        buffer = np.empty((len(self.slots), n_rows), dtype=np.float64)
+        read_sources(buffer)
+        inputs = inputs or {}
+        for slot, name in self._inputs:
+            if name not in inputs:
+                raise KeyError(f'Feature {name!r} must be passed in inputs')
+            column = np.asarray(inputs[name], dtype=np.float64)
+            if column.shape != (n_rows,):
+                raise ValueError(f'Feature {name!r} has {len(column)} rows, expected {n_rows}')
+            buffer[slot] = column
+        for slot, feature, input_slots in self._derived:
+            buffer[slot] = feature.compute([buffer[i] for i in input_slots], self.stats)
+        return buffer
+    
+    def _reader(self, records: List[Dict]) -> Callable[[np.ndarray], None]:
+        """
+        Ghi source features của records vào buffer: batch nhỏ đọc theo row
+        (1 lần chuyển sang NumPy), batch lớn đọc theo cột thẳng vào slot
+        """
+        values = self._values
+        n_rows = len(records)
+        
+        def read_rows(buffer):
+            buffer[:len(values)].T[...] = [[value(record) for value in values] for record in records]
+        
+        def read_columns(buffer):
+            for slot, value in enumerate(values):
+                buffer[slot] = np.fromiter(map(value, records), dtype=np.float64, count=n_rows)
+        
+        return read_rows if n_rows <= self.ROW_READ_MAX else read_columns
+    
+    def _named(self, buffer: np.ndarray) -> Dict[str, np.ndarray]:
+        return {name: buffer[slot] for name, slot in self.slots.items()}
+    
+    def columns(self, records: List[Dict], inputs: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+        """Tất cả cột (kể cả trung gian và Text) cho list document"""
+        columns = self._named(self._fill(len(records), self._reader(records), inputs))
+        for feature in self.text_features:
+            columns[feature.name] = np.array([feature.value(record) for record in records], dtype=object)
+        return columns
+    
+    def frame_columns(self, df, inputs: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+        """
+        Tất cả cột cho DataFrame: source features lấy từ cột cùng tên
+        (DataFrame do 1_data_preparation tạo), derived features tính lại
+        """
+        def read(feature):
+            if feature.name not in df.columns:
+                raise KeyError(f'DataFrame has no column {feature.name!r}')
+            return feature.from_column(df[feature.name].to_numpy())
+        
+        def read_sources(buffer):
+            for slot, feature in enumerate(self._sources):
+                buffer[slot] = read(feature)
+        
+        columns = self._named(self._fill(len(df), read_sources, inputs))
+        for feature in self.text_features:
+            columns[feature.name] = read(feature)
+        return columns
+    
+    def _matrix(self, buffer: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+        if self._output_slots is None:
+            raise TypeError(f'Features {self.feature_names} are not all numeric')
+        n_rows = buffer.shape[1]
+        if out is None:
+            out = np.empty((n_rows, len(self.feature_names)), dtype=self.dtype)
+        elif out.shape != (n_rows, len(self.feature_names)):
+            raise ValueError(f'out has shape {out.shape}, expected {(n_rows, len(self.feature_names))}')
+        out[...] = buffer[self._output_slots].T
+        return out
+    
+    def transform(
+        self,
+        records: List[Dict],
+        inputs: Optional[Dict] = None,
+        out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Ma trận (n_records, n_features) theo thứ tự feature_names
+        
+        out: buffer có sẵn (float32/float64) để ghi vào, mặc định tạo mới
+        với dtype của extractor
+        """
+        return self._matrix(self._fill(len(records), self._reader(records), inputs), out)
+    
+    def transform_frame(self, df, inputs: Optional[Dict] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+        columns = self.frame_columns(df, inputs)
+        buffer = np.array([columns[name] for name in self.slots], dtype=np.float64).reshape(len(self.slots), len(df))
+        return self._matrix(buffer, out)
+    
+    def frame(self, records: List[Dict], inputs: Optional[Dict] = None):
+        """pandas DataFrame với đúng các cột feature_names (kể cả Text)"""
+        import pandas as pd
+        columns = self.columns(records, inputs)
+        return pd.DataFrame({name: columns[name] for name in self.feature_names})
+
+
+# ============================================================
+# Features của hệ thống
+# ============================================================
+
+PROVINCES = {
+    1: ['Hồ Chí Minh', 'TP. Hồ Chí Minh', 'Thành phố Hồ Chí Minh', 'TP.HCM', 'HCM'],
+    2: ['Hà Nội'],
+    3: ['Đà Nẵng'],
+    4: ['Cần Thơ'],
+    5: ['Hải Phòng'],
+    6: ['Bình Dương'],
+    7: ['Đồng Nai'],
+    8: ['Khánh Hòa', 'Khánh Hoà'],
+    9: ['Lâm Đồng'],
+    10: ['Quảng Nam']
+}
+
+PROPERTY_TYPES = {
+    1: ['phong-tro'],
+    2: ['nha-nguyen-can'],
+    3: ['can-ho'],
+    4: ['chung-cu-mini'],
+    5: ['homestay']
+}
+
+# (feature, các tên field trong amenities: schema hiện tại trước, schema cũ sau)
+AMENITIES = [
+    ('has_wifi', ('wifi', 'hasWifi')),
+    ('has_parking', ('parking', 'hasParking')),
+    ('has_air_conditioner', ('ac', 'hasAirConditioner')),
+    ('has_water_heater', ('water', 'hasWaterHeater')),
+    ('has_kitchen', ('kitchen', 'hasKitchen')),
+    ('has_fridge', ('fridge', 'hasFridge')),
+    ('has_washing_machine', ('washing', 'laundry', 'hasWashingMachine')),
+    ('has_tv', ('tv', 'hasTV')),
+    ('has_bed', ('bed', 'hasBed')),
+    ('has_wardrobe', ('wardrobe', 'hasWardrobe')),
+    ('has_balcony', ('balcony', 'hasBalcony')),
+    ('has_security', ('security', 'hasSecurity'))
+]
+
+# Tiện nghi tính vào total_amenities / amenity_score
+SCORED_AMENITIES = [name for name, _ in AMENITIES[:10]]
+
+FEATURE_SCHEMA = FeatureSchema([
+    # Định danh / text
+    Text('property_id', ('_id',)),
+    Text('province', ('address.city', 'location.province')),
+    Text('district', ('address.district', 'location.district')),
+    
+    # Location
+    Category('province_encoded', ('address.city', 'location.province'), PROVINCES),
+    HashBucket('district_encoded', ('address.district', 'location.district'), buckets=1000),
+    Coordinate('longitude', 0, default=106.7),
+    Coordinate('latitude', 1, default=10.8),
+    
+    # Property
+    Number('price', ('price',)),
+    Number('area', ('area',)),
+    Number('bedrooms', ('bedrooms',), default=1),
+    Number('bathrooms', ('bathrooms',), default=1),
+    Number('floor', ('floor',), default=1),
+    Category('property_type_encoded', ('propertyType',), PROPERTY_TYPES, default=1),
+    
+    # Amenities
+    *[Flag(name, keys) for name, keys in AMENITIES],
+    
+    # Engineered
+    Derived('total_amenities', SCORED_AMENITIES, lambda *flags: sum(flags)),
+    Derived('amenity_score', ('total_amenities',), lambda total: total / len(SCORED_AMENITIES)),
+    Derived('area_rooms', ('area', 'bedrooms'), lambda area, bedrooms: area * bedrooms),
+    Derived('area_amenities', ('area', 'amenity_score'), lambda area, score: area * score),
+    Derived('price_per_sqm', ('price', 'area'), _safe_divide),
+    
+    # Anomaly (cần predicted_price của price model)
+    Input('predicted_price'),
+    Derived('price_diff', ('price', 'predicted_price'), lambda price, predicted: price - predicted),
+    Derived('price_diff_percent', ('price_diff', 'predicted_price'),
+            lambda diff, predicted: _safe_divide(diff, predicted) * 100),
+    Derived('predicted_price_per_sqm', ('predicted_price', 'area'), _safe_divide),
+    ZScore('price_diff_zscore', 'price_diff')
+])
+
+# Cột 1_data_preparation ghi ra (training_data)
+PREP_COLUMNS = [
+    'property_id', 'price', 'province', 'district',
+    'province_encoded', 'district_encoded',
+    'area', 'bedrooms', 'bathrooms', 'floor',
+    *SCORED_AMENITIES
+]
+
+# Input của price model (2_train)
+PRICE_FEATURES = [
+    # Location
+    'province_encoded', 'district_encoded',
+    # Property
+    'area', 'bedrooms', 'bathrooms', 'floor',
+    # Amenities
+    *SCORED_AMENITIES,
+    # Engineered
+    'total_amenities', 'amenity_score', 'area_rooms', 'area_amenities'
+]
+
+# Input của Isolation Forest (3_train)
+ANOMALY_FEATURES = [
+    # Price-related
+    'price', 'predicted_price', 'price_diff', 'price_diff_percent',
+    'price_per_sqm', 'predicted_price_per_sqm', 'price_diff_zscore',
+    # Property
+    'area', 'bedrooms', 'bathrooms',
+    # Location
+    'province_encoded', 'district_encoded',
+    # Amenities
+    'total_amenities', 'amenity_score'
+]
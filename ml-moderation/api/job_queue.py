@@ -0,0 +1,346 @@
+"""
+Job queue cho moderation bất đồng bộ
+Client nhận job_id ngay, worker threads chạy moderation ở background
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import weakref
+import ipaddress
+import threading
+import http.client
+from collections import deque
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+class QueueFull(Exception):
+    """Queue đã đầy, client nên thử lại sau (HTTP 429)"""
+
+
+class QueueClosed(Exception):
+    """Queue đang shutdown, không nhận job mới"""
+
+
+_STOP = object()
+
+
+def _reset_in_child(ref: weakref.ref):
+    obj = ref()
+    if obj is not None:
+        obj._reset()
+
+
+def reset_after_fork(obj):
+    """
+    Gọi obj._reset() 1 lần trong process con ngay lúc fork (gunicorn fork
+    worker sau khi import app), trước khi có request thread nào. Reset lazy
+    theo pid ở mỗi lần gọi thì 2 request thread có thể cùng reset và làm mất
+    việc đã đưa vào state cũ. Giữ weakref: không giữ obj sống mãi
+    """
+    os.register_at_fork(after_in_child=partial(_reset_in_child, weakref.ref(obj)))
+
+
+def _resolve_callback(url: Any, allowed_hosts: Sequence[str] = ()) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (lý do callback_url không được dùng hoặc None, địa chỉ IP để kết nối)
+    
+    - Phải là http(s) URL có host
+    - allowed_hosts khác rỗng (MODERATION_CALLBACK_HOSTS): host phải nằm
+      trong danh sách, vd backend nội bộ (địa chỉ None: kết nối theo tên)
+    - Không có allowed_hosts: mọi địa chỉ host resolve ra phải là địa chỉ
+      public, chặn loopback / private / link-local (client không dùng được
+      server để gọi vào mạng nội bộ)
+    """
+    if not isinstance(url, str):
+        return 'callback_url must be an http(s) URL', None
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if parsed.scheme not in ('http', 'https') or not host:
+        return 'callback_url must be an http(s) URL', None
+    
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            return f'callback_url host {host!r} is not allowed', None
+        return None, None
+    
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)]
+    except (OSError, ValueError):
+        return f'callback_url host {host!r} cannot be resolved', None
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if getattr(ip, 'ipv4_mapped', None):
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            return f'callback_url host {host!r} resolves to a non-public address', None
+    return None, addresses[0]
+
+
+def check_callback_url(url: Any, allowed_hosts: Sequence[str] = ()) -> Optional[str]:
+    """Lý do callback_url không được dùng, None nếu hợp lệ (xem _resolve_callback)"""
+    return _resolve_callback(url, allowed_hosts)[0]
+
+
+def _post_callback(url: str, address: Optional[str], body: bytes, timeout: float):
+    """
+    POST body tới url, không theo redirect. address khác None: kết nối tới
+    đúng địa chỉ đã kiểm tra thay vì resolve host lần nữa (DNS rebinding có
+    thể trả về địa chỉ nội bộ ở lần resolve thứ 2); Host header, SNI và
+    kiểm tra certificate vẫn theo hostname trong URL
+    """
+    parsed = urlparse(url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+    conn = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+    if address is not None:
+        conn._create_connection = lambda target, *args: socket.create_connection((address, target[1]), *args)
+    path = (parsed.path or '/') + (f'?{parsed.query}' if parsed.query else '')
+    try:
+        conn.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        if response.status >= 300:
+            raise RuntimeError(f'HTTP {response.status} {response.reason}')
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    """
+    Bounded queue + pool worker threads
+    
+    - submit() trả về job ngay, raise QueueFull khi queue đã có max_size
+      job đang chờ (backpressure)
+    - Kết quả giữ trong bộ nhớ result_ttl giây để client poll bằng get()
+    - Nếu job có callback_url: POST kết quả về URL đó khi xong (URL được
+      kiểm tra lại trước khi gửi và gửi tới đúng địa chỉ đã kiểm tra, không
+      theo redirect)
+    - Threads được start lazy ở lần submit đầu tiên trong mỗi process,
+      state được reset lúc fork (reset_after_fork), nên tạo JobQueue trước
+      khi gunicorn fork (preload_app) vẫn an toàn
+    """
+    
+    def __init__(
+        self,
+        handler: Callable[[Any], Dict],
+        workers: int = 2,
+        max_size: int = 256,
+        result_ttl: float = 600.0,
+        callback_timeout: float = 5.0,
+        callback_hosts: Sequence[str] = ()
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self.result_ttl = result_ttl
+        self.callback_timeout = callback_timeout
+        self.callback_hosts = tuple(host.strip().lower() for host in callback_hosts if host.strip())
+        self._reset()
+        reset_after_fork(self)
+    
+    def _reset(self):
+        """State riêng của từng process (gọi lại trong process con sau fork)"""
+        self._queue = queue.Queue(maxsize=self.max_size)
+        self._jobs = {}
+        self._expiry = deque()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._closed = False
+        self._running = 0
+        
+        # Metrics
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.callbacks_sent = 0
+        self.callbacks_failed = 0
+    
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'moderation-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def submit(self, payload: Any, callback_url: Optional[str] = None) -> Dict:
+        """
+        Đưa job vào queue
+        
+        Returns:
+            Bản ghi job (status 'queued')
+        
+        Raises:
+            QueueFull: queue đã đầy
+            QueueClosed: đang shutdown
+        """
+        with self._lock:
+            self._ensure_started()
+            if self._closed:
+                raise QueueClosed('Job queue is shutting down')
+            
+            job = {
+                'job_id': uuid.uuid4().hex,
+                'status': 'queued',
+                'callback_url': callback_url,
+                'submitted_at': datetime.now().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            try:
+                self._queue.put_nowait((job, payload, time.monotonic()))
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull(f'Job queue is full ({self.max_size} jobs pending)')
+            
+            self._prune_locked()
+            self._jobs[job['job_id']] = job
+            self.submitted += 1
+            return self.public_view(job)
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Trạng thái + kết quả của job, None nếu không có hoặc đã hết hạn"""
+        with self._lock:
+            self._prune_locked()
+            job = self._jobs.get(job_id)
+            return self.public_view(job) if job is not None else None
+    
+    def _prune_locked(self):
+        """Xoá các job đã xong quá result_ttl giây (_expiry xếp theo thời điểm xong)"""
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, job_id = self._expiry.popleft()
+            self._jobs.pop(job_id, None)
+    
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._run(*item)
+            finally:
+                self._queue.task_done()
+    
+    def _run(self, job: Dict, payload: Any, enqueued_at: float):
+        started = time.monotonic()
+        with self._lock:
+            job['status'] = 'running'
+            job['started_at'] = datetime.now().isoformat()
+            self._running += 1
+            self._wait_times.append(started - enqueued_at)
+        
+        try:
+            result, error = self.handler(payload), None
+        except Exception as e:
+            result, error = None, str(e)
+        
+        with self._lock:
+            self._running -= 1
+            self._run_times.append(time.monotonic() - started)
+            job['status'] = 'failed' if error else 'done'
+            job['result'] = result
+            job['error'] = error
+            job['finished_at'] = datetime.now().isoformat()
+            self._expiry.append((time.monotonic() + self.result_ttl, job['job_id']))
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+        
+        if job['callback_url']:
+            self._send_callback(job)
+    
+    def _send_callback(self, job: Dict):
+        """POST kết quả về callback_url, lỗi chỉ được log lại (client vẫn poll được)"""
+        # Kiểm tra lại lúc gửi: DNS có thể đã đổi từ lúc submit
+        error, address = _resolve_callback(job['callback_url'], self.callback_hosts)
+        if error:
+            print(f"⚠️ Callback for job {job['job_id']} skipped: {error}")
+            with self._lock:
+                self.callbacks_failed += 1
+            return
+        
+        body = json.dumps(self.public_view(job), ensure_ascii=False, default=str).encode('utf-8')
+        try:
+            _post_callback(job['callback_url'], address, body, self.callback_timeout)
+            ok = True
+        except Exception as e:
+            print(f"⚠️ Callback for job {job['job_id']} failed: {e}")
+            ok = False
+        with self._lock:
+            if ok:
+                self.callbacks_sent += 1
+            else:
+                self.callbacks_failed += 1
+    
+    @staticmethod
+    def public_view(job: Dict) -> Dict:
+        """Job không kèm các field nội bộ"""
+        return {key: value for key, value in job.items() if not key.startswith('_')}
+    
+    def shutdown(self, timeout: float = 30.0):
+        """
+        Ngừng nhận job mới và chờ các job đã nhận chạy xong (tối đa timeout giây)
+        """
+        with self._lock:
+            if not self._threads:
+                self._closed = True
+                return
+            self._closed = True
+            threads = list(self._threads)
+        
+        deadline = time.monotonic() + timeout
+        for _ in threads:
+            # put() có thể block khi queue đầy: sentinel xếp sau các job đang chờ
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+    
+    def stats(self) -> Dict:
+        """Metrics cho /api/health"""
+        with self._lock:
+            waits = np.array(self._wait_times) * 1000
+            runs = np.array(self._run_times) * 1000
+            return {
+                'workers': self.workers,
+                'max_size': self.max_size,
+                'queue_depth': self._queue.qsize(),
+                'running': self._running,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'callbacks_sent': self.callbacks_sent,
+                'callbacks_failed': self.callbacks_failed,
+                'wait_ms': latency_summary(waits),
+                'run_ms': latency_summary(runs)
+            }
+
+
+def latency_summary(values: np.ndarray) -> Dict:
+    """mean/p50/p99 (ms) của một mảng latency"""
+    if not len(values):
+        return {'mean': 0.0, 'p50': 0.0, 'p99': 0.0}
+    return {
+        'mean': round(float(values.mean()), 2),
+        'p50': round(float(np.percentile(values, 50)), 2),
+        'p99': round(float(np.percentile(values, 99)), 2)
+    }
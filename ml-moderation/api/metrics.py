@@ -0,0 +1,491 @@
+"""
+Metrics cho /metrics (Prometheus text exposition format, không cần
+prometheus_client)
+
+- Counter / Gauge / Histogram có labels, thread-safe
+- STAGE_SECONDS: latency từng stage của moderation pipeline (validators,
+  feature extraction, scaler, XGBoost, Isolation Forest)
+- Gauge về models đang phục vụ được cập nhật lúc scrape (app.py); các
+  tổng do object khác đếm sẵn (reloads, cache hit / miss) là Counter *_total,
+  lấy giá trị tuyệt đối lúc scrape bằng labels(...).set()
+- RequestTrace: thời gian từng stage của request đang chạy trên thread
+  (cho request log, xem request_log.py)
+
+Validators (vài µs mỗi stage, chạy cho từng property) được đo bằng các mốc
+perf_counter liên tiếp (StageLaps): request chỉ append mốc vào deque, cộng
+vào histogram theo lô bằng numpy. Stage ML đo theo batch bằng time().
+ML_METRICS=0 tắt đo (timer / inc / observe thành no-op).
+
+Lưu ý: metrics nằm trong memory của từng process, chạy gunicorn nhiều
+workers thì mỗi lần scrape là số liệu của worker trả lời request đó.
+"""
+
+import os
+import math
+import threading
+from bisect import bisect_left
+from collections import deque
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+ENABLED = os.getenv('ML_METRICS', '1') not in ('0', 'false')
+
+# Stage của moderation pipeline chạy từ vài µs (validators) tới vài chục ms
+# (batch lớn qua XGBoost), nên buckets bắt đầu từ 5 µs
+STAGE_BUCKETS = (
+    0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+REQUEST_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def set_enabled(enabled: bool):
+    """Bật / tắt đo (benchmark overhead)"""
+    global ENABLED
+    ENABLED = enabled
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Metric có labels; mỗi tổ hợp label values là 1 child"""
+    
+    TYPE = None
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+    
+    def labels(self, *values, **kwargs):
+        """Child của tổ hợp label values (giữ lại child để tránh tra dict mỗi lần)"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name}: expected labels {self.labelnames}, got {values}')
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+    
+    def clear(self):
+        with self._lock:
+            self._children.clear()
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    def _samples(self, labelvalues, child) -> List[str]:
+        raise NotImplementedError
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.TYPE}']
+        with self._lock:
+            children = sorted(self._children.items())
+        for labelvalues, child in children:
+            lines.extend(self._samples(labelvalues, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+    
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0):
+        if ENABLED:
+            with self._lock:
+                self.value += amount
+    
+    def set(self, value: float):
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    """
+    Chỉ tăng (tên nên kết thúc bằng _total)
+    
+    labels(...).set(total): lấy tổng đã được đếm ở nơi khác (đọc lúc scrape),
+    tổng đó chỉ được tăng hoặc về 0 khi process / object mới (Prometheus
+    coi là counter reset)
+    """
+    
+    TYPE = 'counter'
+    
+    def _new_child(self):
+        return _Value()
+    
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+    
+    def _samples(self, labelvalues, child):
+        return [f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(child.value)}']
+
+
+class Gauge(Counter):
+    """Giá trị hiện tại (set lúc scrape)"""
+    
+    TYPE = 'gauge'
+    
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _Timer:
+    __slots__ = ('child', 'start')
+    
+    def __init__(self, child):
+        self.child = child
+    
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.child.observe(perf_counter() - self.start)
+        return False
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+    
+    def __init__(self, buckets: Tuple[float, ...], lock: threading.Lock):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # ô cuối: > bucket lớn nhất
+        self.sum = 0.0
+        self._lock = lock  # dùng chung trong 1 Histogram
+    
+    def observe(self, value: float):
+        if not ENABLED:
+            return
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+    
+    def time(self) -> _Timer:
+        """Context manager đo thời gian của block (giây)"""
+        return _Timer(self)
+    
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Histogram(_Metric):
+    """Phân bố giá trị (giây) theo buckets cố định, render dạng cumulative"""
+    
+    TYPE = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = REQUEST_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        self._values_lock = threading.Lock()
+        self._flush_hooks = []
+        super().__init__(name, documentation, labelnames, registry)
+    
+    def _new_child(self):
+        return _HistogramValue(self.buckets, self._values_lock)
+    
+    def observe(self, value: float):
+        self.labels().observe(value)
+    
+    def add_many(self, child: _HistogramValue, counts: np.ndarray, total: float):
+        """Cộng số đếm theo bucket (cùng độ dài child.counts) vào child"""
+        with self._values_lock:
+            child.counts = [a + int(b) for a, b in zip(child.counts, counts)]
+            child.sum += total
+    
+    def flush(self):
+        """Cộng các giá trị còn chờ (StageLaps) trước khi đọc"""
+        for hook in self._flush_hooks:
+            hook()
+    
+    def time(self) -> _Timer:
+        return self.labels().time()
+    
+    def render(self) -> List[str]:
+        self.flush()
+        return super().render()
+    
+    def _samples(self, labelvalues, child):
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+    
+    def summary(self) -> Dict[str, Dict]:
+        """count / mean (ms) của từng child, cho /api/health"""
+        self.flush()
+        with self._lock:
+            children = sorted(self._children.items())
+        result = {}
+        for labelvalues, child in children:
+            counts, total = child.snapshot()
+            n = sum(counts)
+            result[','.join(labelvalues)] = {
+                'count': n,
+                'mean_ms': round(total / n * 1000, 4) if n else 0.0
+            }
+        return result
+
+
+class RequestTrace:
+    """Thời gian từng stage (ms, cộng dồn) và số cache hit của 1 request"""
+    
+    __slots__ = ('stages_ms', 'cache_hits')
+    
+    def __init__(self):
+        self.stages_ms = {}
+        self.cache_hits = 0
+    
+    def add(self, stage: str, seconds: float):
+        self.stages_ms[stage] = self.stages_ms.get(stage, 0.0) + seconds * 1000
+
+
+class _TraceLocal(threading.local):
+    trace = None
+
+
+_local = _TraceLocal()
+
+
+def start_trace() -> RequestTrace:
+    """Bắt đầu ghi trace cho request trên thread hiện tại"""
+    _local.trace = RequestTrace()
+    return _local.trace
+
+
+def stop_trace():
+    _local.trace = None
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _local.trace
+
+
+class StageLaps:
+    """
+    Latency của chuỗi stage chạy liên tiếp, từ các mốc perf_counter
+    (stage i = laps[i + 1] - laps[i])
+    
+    record() chỉ append tuple mốc vào deque (atomic, không lock); cứ
+    FLUSH_EVERY lần hoặc lúc scrape thì cả lô được cộng vào histogram bằng
+    numpy. Memory giới hạn bởi FLUSH_EVERY tuple.
+    """
+    
+    FLUSH_EVERY = 256
+    
+    def __init__(self, histogram: Histogram, stages: Iterable[str]):
+        self.histogram = histogram
+        self.stages = tuple(stages)
+        self.children = [histogram.labels(stage) for stage in self.stages]
+        self._pending = deque()
+        histogram._flush_hooks.append(self.flush)
+    
+    def record(self, laps: Tuple[float, ...]):
+        trace = _local.trace
+        if trace is not None:
+            for stage, start, end in zip(self.stages, laps, laps[1:]):
+                trace.add(stage, end - start)
+        if ENABLED:
+            self._pending.append(laps)
+            if len(self._pending) >= self.FLUSH_EVERY:
+                self.flush()
+    
+    def flush(self):
+        rows = []
+        try:
+            while True:
+                rows.append(self._pending.popleft())
+        except IndexError:
+            pass
+        if not rows:
+            return
+        
+        durations = np.diff(np.array(rows), axis=1)
+        # side='left' giống bisect_left: value == bound thuộc bucket le=bound
+        buckets = np.searchsorted(self.histogram.buckets, durations, side='left')
+        n_buckets = len(self.histogram.buckets) + 1
+        for j, child in enumerate(self.children):
+            counts = np.bincount(buckets[:, j], minlength=n_buckets)
+            self.histogram.add_many(child, counts, float(durations[:, j].sum()))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name!r} already registered')
+            self._metrics[metric.name] = metric
+    
+    def render(self) -> str:
+        """Toàn bộ metrics dạng Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# ============================================================
+# Metrics của moderation service
+# ============================================================
+
+STAGE_SECONDS = Histogram(
+    'moderation_stage_duration_seconds',
+    'Latency of each moderation pipeline stage (ML stages are timed per batch)',
+    ('stage',), buckets=STAGE_BUCKETS
+)
+MODEL_ROWS = Counter(
+    'moderation_model_rows_total',
+    'Rows scored by the ML models (inference memo hits excluded)'
+)
+
+# Child của từng stage (giữ sẵn để không tra dict mỗi request)
+STAGES = {
+    stage: STAGE_SECONDS.labels(stage)
+    for stage in (
+        'text', 'completeness', 'image', 'price_range',
+        'feature_extraction', 'scaler', 'price_model', 'anomaly_features', 'anomaly_model'
+    )
+}
+# Các validator chạy theo thứ tự này trong validate_property_rules
+RULE_STAGES = StageLaps(STAGE_SECONDS, ('text', 'completeness', 'image', 'price_range'))
+
+DECISIONS = Counter(
+    'moderation_decisions_total',
+    'Moderation results by decision (error = property failed in a batch)',
+    ('decision', 'cached')
+)
+
+REQUESTS = Counter(
+    'moderation_http_requests_total',
+    'HTTP requests by endpoint and status code',
+    ('endpoint', 'status')
+)
+REQUEST_SECONDS = Histogram(
+    'moderation_http_request_duration_seconds',
+    'HTTP request latency by endpoint',
+    ('endpoint',), buckets=REQUEST_BUCKETS
+)
+
+MODEL_LOADED = Gauge(
+    'moderation_model_loaded',
+    'Whether each model component is loaded (1) or missing (0)',
+    ('component',)
+)
+MODEL_LOAD_SECONDS = Gauge(
+    'moderation_model_load_seconds',
+    'Time spent loading each model component of the serving version',
+    ('component',)
+)
+MODEL_INFO = Gauge(
+    'moderation_model_info',
+    'Model version currently served (value is always 1)',
+    ('version', 'price_backend')
+)
+MODEL_RELOADS = Counter(
+    'moderation_model_reloads_total',
+    'Model reloads in this process by result',
+    ('result',)
+)
+CACHE_LOOKUPS = Counter(
+    'moderation_cache_lookups_total',
+    'Result cache / stage memo lookups by cache and result',
+    ('cache', 'result')
+)
+
+
+_decision_children = {}
+
+
+def record_decision(result: Dict, cached: bool):
+    """Đếm 1 kết quả moderation theo decision"""
+    if cached and _local.trace is not None:
+        _local.trace.cache_hits += 1
+    decision = result.get('decision', 'error') if result.get('success', True) else 'error'
+    child = _decision_children.get((decision, cached))
+    if child is None:
+        child = _decision_children[decision, cached] = DECISIONS.labels(decision, 'true' if cached else 'false')
+    child.inc()
+
+
+def record_decisions(results: List[Dict], cached: Iterable[int] = ()):
+    """record_decision cho cả batch (đếm gộp rồi inc 1 lần mỗi decision)"""
+    cached = set(cached)
+    if cached and _local.trace is not None:
+        _local.trace.cache_hits += len(cached)
+    tally = {}
+    for i, result in enumerate(results):
+        decision = result.get('decision', 'error') if result.get('success', True) else 'error'
+        key = (decision, i in cached)
+        tally[key] = tally.get(key, 0) + 1
+    for (decision, is_cached), count in tally.items():
+        DECISIONS.labels(decision, 'true' if is_cached else 'false').inc(count)
+
+
+def update_model_gauges(predictor, reloader_status: Optional[Dict] = None):
+    """Cập nhật gauges về models đang phục vụ và số lần reload (gọi lúc scrape)"""
+    for component in ('price_model', 'anomaly_model', 'scaler'):
+        MODEL_LOADED.labels(component).set(1 if getattr(predictor, component) is not None else 0)
+    MODEL_LOAD_SECONDS.clear()
+    for component, ms in predictor.load_times.items():
+        MODEL_LOAD_SECONDS.labels(component).set(ms / 1000)
+    MODEL_INFO.clear()
+    MODEL_INFO.labels(predictor.model_version or 'none', predictor.price_backend).set(1)
+    if reloader_status is not None:
+        MODEL_RELOADS.labels('success').set(reloader_status['reloads'])
+        MODEL_RELOADS.labels('failure').set(reloader_status['failures'])
+
+
+def update_cache_counters(cache_stats: Dict[str, Dict]):
+    """hits / misses của từng cache (ResultCache.stats(), gọi lúc scrape)"""
+    for cache, stats in cache_stats.items():
+        CACHE_LOOKUPS.labels(cache, 'hit').set(stats['hits'])
+        CACHE_LOOKUPS.labels(cache, 'miss').set(stats['misses'])
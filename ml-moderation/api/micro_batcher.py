@@ -0,0 +1,152 @@
+"""
+Micro-batching cho các request đơn lẻ
+Gom các request /api/moderate chạy đồng thời thành 1 batch để dùng
+đường chạy model vectorized (evaluate_batch)
+"""
+
+import time
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from job_queue import latency_summary, reset_after_fork
+
+
+class MicroBatcher:
+    """
+    Gom các lời gọi submit() đồng thời thành batch cho process_batch
+    
+    - Một dispatcher thread lấy tối đa max_batch item đang chờ và gọi
+      process_batch(items) một lần, kết quả trả về đúng caller
+    - Adaptive: khi tải thấp (các batch gần đây chỉ có 1 item) batch được
+      chạy ngay, không chờ thêm; khi có tải, dispatcher chờ tối đa
+      max_wait_ms tính từ item đầu tiên để gom thêm item
+    - max_batch <= 1: tắt batching, submit() gọi thẳng process_batch
+    - timeout_s: thời gian chờ kết quả tối đa của 1 item, hết thì submit()
+      raise TimeoutError (request thread không bị treo vĩnh viễn)
+    """
+    
+    # Hệ số EWMA của batch size, dùng để đoán có request đồng thời hay không
+    LOAD_SMOOTHING = 0.2
+    LINGER_LOAD = 1.2
+    
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch: int = 32,
+        max_wait_ms: float = 2.0,
+        timeout_s: float = 30.0
+    ):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout_s
+        self._reset()
+        # Dispatcher thread của process cha không tồn tại trong process con
+        reset_after_fork(self)
+    
+    def _reset(self):
+        """State riêng của từng process (gọi lại trong process con sau fork)"""
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+        self._load = 1.0
+        
+        # Stats
+        self._batch_sizes = Counter()
+        self._wait_times = deque(maxlen=1000)
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1
+    
+    def submit(self, item: Any) -> Any:
+        """
+        Chạy item trong batch kế tiếp và chờ kết quả
+        
+        Nếu process_batch trả về Exception cho item này (hoặc lỗi cả batch)
+        thì exception được raise lại cho caller
+        """
+        if not self.enabled:
+            result = self.process_batch([item])[0]
+        else:
+            future = Future()
+            with self._cond:
+                self._ensure_started()
+                self._pending.append((item, future, time.monotonic()))
+                self._cond.notify()
+            try:
+                result = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # Bỏ item nếu còn chờ; nếu đang chạy thì kết quả bị bỏ qua
+                with self._cond:
+                    self._pending[:] = [entry for entry in self._pending if entry[1] is not future]
+                raise TimeoutError(f'Micro-batch result not ready after {self.timeout:g}s')
+        
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._dispatch_loop, name='micro-batcher', daemon=True)
+            self._thread.start()
+    
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                
+                if self._load > self.LINGER_LOAD and self.max_wait > 0:
+                    deadline = self._pending[0][2] + self.max_wait
+                    while len(self._pending) < self.max_batch:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            
+            self._run(batch)
+    
+    def _run(self, batch: List):
+        started = time.monotonic()
+        items = [item for item, _, _ in batch]
+        try:
+            results = self.process_batch(items)
+        except Exception as e:
+            results = [e] * len(batch)
+        
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+        
+        with self._cond:
+            self._load += self.LOAD_SMOOTHING * (len(batch) - self._load)
+            self._batch_sizes[len(batch)] += 1
+            self._wait_times.extend(started - submitted for _, _, submitted in batch)
+    
+    def reset_stats(self):
+        with self._cond:
+            self._batch_sizes.clear()
+            self._wait_times.clear()
+    
+    def stats(self) -> Dict:
+        """Phân bố batch size và latency cộng thêm do chờ gom batch"""
+        with self._cond:
+            batches = sum(self._batch_sizes.values())
+            items = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                'enabled': self.enabled,
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000,
+                'pending': len(self._pending),
+                'batches': batches,
+                'items': items,
+                'mean_batch_size': round(items / batches, 2) if batches else 0.0,
+                'batch_sizes': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                'added_wait_ms': latency_summary(np.array(self._wait_times) * 1000)
+            }
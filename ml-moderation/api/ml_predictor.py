@@ -3,10 +3,13 @@ ML-based Price Predictor & Anomaly Detector
 Wrapper cho các models đã train
 """
 
-import os
-import pickle
 import numpy as np
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional, Union
+from result_cache import ResultCache
+from model_bundle import load_models
+from price_backends import PRICE_BACKENDS, make_price_backend
+from feature_schema import FEATURE_SCHEMA, PRICE_FEATURES, SCHEMA_VERSION
+from metrics import STAGES, MODEL_ROWS
 
 
 class MLPredictor:
@@ -16,129 +19,137 @@ class MLPredictor:
     - Isolation Forest: Phát hiện outliers
     """
     
-    def __init__(self, models_dir: str = '../models'):
+    def __init__(
+        self,
+        models_dir: str = '../models',
+        memo_size: int = 4096,
+        strict: bool = False,
+        price_backend: str = 'xgboost',
+        predict_threads: int = 1
+    ):
+        """
+        Args:
+            strict: raise khi load models lỗi hoặc không tìm thấy models
+                (mặc định chỉ in cảnh báo và dùng heuristic)
+            price_backend: backend chạy price model ('xgboost', 'inplace', 'numpy'),
+                xem price_backends.py
+            predict_threads: số threads chấm điểm batch lớn của price model
+        """
+        if price_backend not in PRICE_BACKENDS:
+            raise ValueError(f'Unknown price backend {price_backend!r}, expected one of {PRICE_BACKENDS}')
         self.models_dir = models_dir
+        self.strict = strict
+        self.price_backend = price_backend
+        self.predict_threads = predict_threads
         self.price_model = None
         self.anomaly_model = None
         self.scaler = None
         self.feature_names = None
+        self.model_version = None
+        self.load_times = {}
+        self.schema_versions = {}
+        self.price_extractor = FEATURE_SCHEMA.compile(PRICE_FEATURES)
+        # Chỉ có khi anomaly model dùng anomaly features riêng (xem _load_models)
+        self.anomaly_extractor = None
+        self.anomaly_scaler = None
+        
+        # Memo output của models theo feature vector (giá dự đoán, cờ anomaly)
+        self.inference_memo = ResultCache(max_size=memo_size, ttl=None)
         
         # Load models nếu có
         self._load_models()
     
     def _load_models(self):
-        """Load trained models từ disk"""
+        """Load trained models từ disk (models_dir/bundle, fallback .pkl cũ)"""
         try:
-            price_model_path = os.path.join(self.models_dir, 'price_model.pkl')
-            if os.path.exists(price_model_path):
-                with open(price_model_path, 'rb') as f:
-                    self.price_model = pickle.load(f)
-                print('✅ Loaded price prediction model')
-            
-            anomaly_model_path = os.path.join(self.models_dir, 'anomaly_model.pkl')
-            if os.path.exists(anomaly_model_path):
-                with open(anomaly_model_path, 'rb') as f:
-                    self.anomaly_model = pickle.load(f)
-                print('✅ Loaded anomaly detection model')
-            
-            scaler_path = os.path.join(self.models_dir, 'scaler.pkl')
-            if os.path.exists(scaler_path):
-                with open(scaler_path, 'rb') as f:
-                    self.scaler = pickle.load(f)
-                print('✅ Loaded feature scaler')
-            
-            feature_names_path = os.path.join(self.models_dir, 'feature_names.pkl')
-            if os.path.exists(feature_names_path):
-                with open(feature_names_path, 'rb') as f:
-                    self.feature_names = pickle.load(f)
-                print('✅ Loaded feature names')
+            bundle = load_models(self.models_dir)
+            if self.strict and bundle.version is None:
+                raise FileNotFoundError(f'No models found in {self.models_dir}')
         except Exception as e:
+            if self.strict:
+                raise
             print(f'⚠️ Error loading models: {e}')
+            return
+        
+        try:
+            self._check_schema(bundle)
+            feature_names = bundle.feature_names or PRICE_FEATURES
+            # XGBoost và Isolation Forest tự ép input về float32: không có
+            # scaler thì extract thẳng ra float32 (kết quả như nhau)
+            float32_input = bundle.scaler is None and hasattr(bundle.price_model, 'get_booster')
+            price_extractor = FEATURE_SCHEMA.compile(
+                feature_names, dtype=np.float32 if float32_input else np.float64
+            )
+        except (KeyError, ValueError) as e:
+            if self.strict:
+                raise
+            print(f'⚠️ Error loading models: {e}')
+            return
+        
+        self.model_version = bundle.version
+        self.load_times = bundle.load_times
+        self.schema_versions = bundle.schema_versions
+        self.feature_names = bundle.feature_names
+        self.price_extractor = price_extractor
+        self.price_model = make_price_backend(
+            bundle.price_model, backend=self.price_backend, threads=self.predict_threads
+        )
+        self.scaler = bundle.scaler
+        
+        # Anomaly model train trên anomaly features riêng (3_train) cần
+        # predicted_price của price model + anomaly_scaler; models không ghi
+        # features riêng thì dùng chung feature vector của price model
+        anomaly_features = bundle.component_features.get('anomaly_model')
+        if bundle.anomaly_model is not None and anomaly_features and anomaly_features != feature_names:
+            try:
+                self.anomaly_extractor = FEATURE_SCHEMA.compile(
+                    anomaly_features, stats=bundle.feature_stats.get('anomaly_model')
+                )
+                self.anomaly_scaler = bundle.anomaly_scaler
+                self.anomaly_model = bundle.anomaly_model
+            except KeyError as e:
+                if self.strict:
+                    raise
+                print(f'⚠️ Anomaly model skipped: {e}')
+        else:
+            self.anomaly_model = bundle.anomaly_model
+        
+        for name in ('price_model', 'anomaly_model', 'scaler'):
+            if getattr(self, name) is not None:
+                print(f'✅ Loaded {name} ({bundle.load_times.get(name, 0):.1f} ms)')
+        if self.price_model is not None:
+            print(f'✅ Price backend: {self.price_model.name} (threads={self.predict_threads})')
+        if bundle.version:
+            print(f'✅ Model version {bundle.version} loaded in {bundle.load_times["total"]:.1f} ms')
     
-    def _extract_features(self, property_data: Dict) -> np.ndarray:
+    def _check_schema(self, bundle):
         """
-        Extract features từ property data
+        Models phải được train bằng cùng feature schema với API
         
-        Features:
-        - location: lat, lng, district_encoded, city_encoded
-        - property: area, bedrooms, bathrooms, propertyType_encoded
-        - amenities: wifi, ac, parking, kitchen, water, laundry, balcony, security (8 features)
-        - derived: price_per_sqm, amenity_count
+        Raises:
+            ValueError: component được train bằng schema version khác
         """
-        features = {}
-        
-        # Location features
-        location = property_data.get('location', {})
-        coords = location.get('coordinates', [106.7, 10.8])  # Default HCM center
-        features['longitude'] = coords[0] if len(coords) > 0 else 106.7
-        features['latitude'] = coords[1] if len(coords) > 1 else 10.8
-        
-        # District encoding (simple mapping)
-        district = property_data.get('address', {}).get('district', '')
-        district_map = {
-            'Quận 1': 1, 'Quận 2': 2, 'Quận 3': 3, 'Quận 4': 4, 'Quận 5': 5,
-            'Quận 6': 6, 'Quận 7': 7, 'Quận 8': 8, 'Quận 9': 9, 'Quận 10': 10,
-            'Quận 11': 11, 'Quận 12': 12, 'Quận Bình Tân': 13, 
-            'Quận Bình Thạnh': 14, 'Quận Gò Vấp': 15, 'Quận Phú Nhuận': 16,
-            'Quận Tân Bình': 17, 'Quận Tân Phú': 18, 'Thành phố Thủ Đức': 19
-        }
-        features['district_encoded'] = district_map.get(district, 0)
-        
-        # City encoding
-        city = property_data.get('address', {}).get('city', '')
-        city_map = {
-            'TP. Hồ Chí Minh': 1,
-            'Thành phố Hồ Chí Minh': 1,
-            'Hà Nội': 2,
-            'Đà Nẵng': 3
-        }
-        features['city_encoded'] = city_map.get(city, 1)
-        
-        # Property features
-        features['area'] = property_data.get('area', 20)
-        features['bedrooms'] = property_data.get('bedrooms', 1)
-        features['bathrooms'] = property_data.get('bathrooms', 1)
-        
-        # Property type encoding
-        property_type = property_data.get('propertyType', 'phong-tro')
-        type_map = {
-            'phong-tro': 1,
-            'nha-nguyen-can': 2,
-            'can-ho': 3,
-            'chung-cu-mini': 4,
-            'homestay': 5
-        }
-        features['propertyType_encoded'] = type_map.get(property_type, 1)
-        
-        # Amenities features
-        amenities = property_data.get('amenities', {})
-        amenity_keys = ['wifi', 'ac', 'parking', 'kitchen', 'water', 'laundry', 'balcony', 'security']
-        for key in amenity_keys:
-            features[f'amenity_{key}'] = 1 if amenities.get(key, False) else 0
-        
-        # Derived features
-        features['amenity_count'] = sum(amenities.get(k, False) for k in amenity_keys)
-        
-        # Price per sqm (nếu có price)
-        price = property_data.get('price', 0)
-        area = features['area']
-        features['price_per_sqm'] = price / area if area > 0 else 0
-        
-        # Convert to array theo thứ tự feature_names (nếu có)
-        if self.feature_names:
-            feature_array = np.array([features.get(name, 0) for name in self.feature_names])
-        else:
-            # Fallback: theo thứ tự cố định
-            feature_order = [
-                'longitude', 'latitude', 'district_encoded', 'city_encoded',
-                'area', 'bedrooms', 'bathrooms', 'propertyType_encoded',
-                'amenity_wifi', 'amenity_ac', 'amenity_parking', 'amenity_kitchen',
-                'amenity_water', 'amenity_laundry', 'amenity_balcony', 'amenity_security',
-                'amenity_count', 'price_per_sqm'
-            ]
-            feature_array = np.array([features.get(name, 0) for name in feature_order])
-        
-        return feature_array.reshape(1, -1)
+        for name, version in bundle.schema_versions.items():
+            if version is None:
+                print(f'⚠️ {name} has no feature schema version (trained before '
+                      f'feature_schema v{SCHEMA_VERSION}), encodings may differ')
+            elif version != SCHEMA_VERSION:
+                raise ValueError(
+                    f'{name} was trained with feature schema v{version}, '
+                    f'API uses v{SCHEMA_VERSION}'
+                )
+    
+    def _extract_feature_row(self, property_data: Dict) -> np.ndarray:
+        """
+        Extract features từ property data thành vector 1 chiều theo
+        feature_names của price model (mặc định PRICE_FEATURES), cách tính
+        từng feature khai báo trong feature_schema
+        """
+        return self.price_extractor.transform([property_data])[0]
+    
+    def _extract_features(self, property_data: Dict) -> np.ndarray:
+        """Extract features cho 1 property, shape (1, n_features)"""
+        return self._extract_feature_row(property_data).reshape(1, -1)
     
     def predict_price(self, property_data: Dict) -> Tuple[float, float, List[str]]:
         """
@@ -188,20 +199,12 @@ class MLPredictor:
         Returns:
             (is_anomaly, anomaly_score, reasons)
         """
-        reasons = []
-        
         actual_price = property_data.get('price', 0)
         
         # 1. Dự đoán giá
         predicted_price, _, _ = self.predict_price(property_data)
         
-        # 2. Tính % deviation
-        if predicted_price > 0:
-            deviation_pct = ((actual_price - predicted_price) / predicted_price) * 100
-        else:
-            deviation_pct = 0
-        
-        # 3. Kiểm tra với Isolation Forest (nếu có)
+        # 2. Kiểm tra với Isolation Forest (nếu có)
         is_anomaly_model = False
         if self.anomaly_model:
             try:
@@ -209,19 +212,220 @@ class MLPredictor:
                 if self.scaler:
                     features = self.scaler.transform(features)
                 
-                # Isolation Forest: -1 = anomaly, 1 = normal
-                prediction = self.anomaly_model.predict(features)[0]
-                is_anomaly_model = (prediction == -1)
-                
-                if is_anomaly_model:
-                    reasons.append('❌ Model phát hiện giá bất thường')
+                flags = self._anomaly_flags(
+                    [property_data], features,
+                    np.array([predicted_price]) if self.price_model else None
+                )
+                is_anomaly_model = bool(flags[0]) if flags is not None else False
             except Exception as e:
                 print(f'Error in anomaly detection: {e}')
         
-        # 4. Rule-based anomaly check
-        is_anomaly_rule = False
+        # 3. Rule-based anomaly check (% deviation so với giá dự đoán)
+        is_anomaly, anomaly_score, reasons = self._anomaly_verdict(
+            actual_price, predicted_price, is_anomaly_model
+        )
+        
+        return is_anomaly, anomaly_score, reasons
+    
+    def _anomaly_flags(
+        self,
+        properties: List[Dict],
+        X_scaled: np.ndarray,
+        predicted_prices: Optional[np.ndarray]
+    ) -> Optional[np.ndarray]:
+        """
+        Cờ anomaly của Isolation Forest cho từng row (-1 = anomaly)
+        
+        Với anomaly features riêng (3_train): extract từ properties kèm
+        predicted_price rồi scale bằng anomaly_scaler; không có predicted
+        price thì không chạy được (None). Ngược lại dùng X_scaled của price model.
+        """
+        if self.anomaly_extractor is None:
+            X = X_scaled
+        elif predicted_prices is None:
+            return None
+        else:
+            with STAGES['anomaly_features'].time():
+                X = self.anomaly_extractor.transform(properties, inputs={'predicted_price': predicted_prices})
+                if self.anomaly_scaler is not None:
+                    X = self.anomaly_scaler.transform(X)
+        with STAGES['anomaly_model'].time():
+            return self.anomaly_model.predict(X) == -1
+    
+    def _memo_key(self, row: np.ndarray, property_data: Dict) -> Optional[bytes]:
+        """Key của inference_memo: feature vector (+ giá nếu anomaly features dùng giá)"""
+        if row.dtype.kind not in 'biuf':
+            return None
+        if self.anomaly_extractor is not None:
+            return row.tobytes() + repr(property_data.get('price')).encode()
+        return row.tobytes()
+    
+    def evaluate(self, property_data: Dict) -> Dict:
+        """
+        Đánh giá giá 1 property trong một lượt
+        
+        Feature vector và giá dự đoán chỉ được tính 1 lần rồi dùng lại cho
+        cả deviation check lẫn Isolation Forest (predict_price +
+        detect_anomaly phải extract features và predict 2 lần).
+        
+        Returns:
+            Dict {predicted_price, confidence, price_reasons, is_anomaly,
+            anomaly_score, anomaly_reasons}
+        """
+        result = self.evaluate_batch([property_data])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def evaluate_batch(self, properties: List[Dict]) -> List[Union[Dict, Exception]]:
+        """
+        Đánh giá giá cho nhiều properties trong một lần chạy model
+        
+        Extract features của cả batch vào một ma trận 2-D, sau đó chạy
+        đúng 1 lần scaler.transform, 1 lần price_model.predict và
+        1 lần anomaly_model.predict. Row có feature vector đã gặp thì lấy
+        output từ inference_memo, không đưa vào model nữa.
+        
+        Returns:
+            List cùng thứ tự với input. Mỗi phần tử là dict
+            {predicted_price, confidence, price_reasons, is_anomaly,
+            anomaly_score, anomaly_reasons}, hoặc Exception nếu row đó lỗi.
+        """
+        results: List[Union[Dict, Exception, None]] = [None] * len(properties)
+        
+        # 1. Extract features cả batch theo cột; batch lỗi thì extract lại
+        #    từng row (row lỗi không làm hỏng cả batch)
+        need_features = self.price_model is not None or self.anomaly_model is not None
+        batch_rows = []
+        feature_rows = []
+        if need_features:
+            try:
+                with STAGES['feature_extraction'].time():
+                    feature_rows = list(self.price_extractor.transform(properties))
+                batch_rows = list(range(len(properties)))
+            except Exception:
+                for i, prop in enumerate(properties):
+                    try:
+                        feature_rows.append(self._extract_feature_row(prop))
+                        batch_rows.append(i)
+                    except Exception:
+                        # Chạy lại qua đường đơn lẻ để giữ nguyên fallback/lý do lỗi
+                        results[i] = self._evaluate_unbatched(prop)
+        else:
+            batch_rows = list(range(len(properties)))
+        
+        # 2. Lấy output đã memo theo feature vector, các row còn lại
+        #    chạy model một lần cho cả ma trận
+        model_outputs = [None] * len(feature_rows)
+        memo_keys = [
+            self._memo_key(row, properties[i])
+            for row, i in zip(feature_rows, batch_rows)
+        ]
+        generation = self.inference_memo.generation
+        pending = []
+        for pos, key in enumerate(memo_keys):
+            if key is not None:
+                model_outputs[pos] = self.inference_memo.get(key)
+            if model_outputs[pos] is None:
+                pending.append(pos)
+        
+        if pending:
+            try:
+                X = np.vstack([feature_rows[pos] for pos in pending])
+                X_scaled = X
+                if self.scaler:
+                    with STAGES['scaler'].time():
+                        X_scaled = self.scaler.transform(X)
+                predicted_prices = None
+                anomaly_flags = None
+                if self.price_model:
+                    with STAGES['price_model'].time():
+                        predicted_prices = self.price_model.predict(X_scaled)
+                if self.anomaly_model:
+                    anomaly_flags = self._anomaly_flags(
+                        [properties[batch_rows[pos]] for pos in pending], X_scaled, predicted_prices
+                    )
+                MODEL_ROWS.inc(len(pending))
+            except Exception as e:
+                print(f'Error in batch inference, falling back to per-row: {e}')
+                for i in batch_rows:
+                    results[i] = self._evaluate_unbatched(properties[i])
+                return results
+            
+            for j, pos in enumerate(pending):
+                output = (
+                    float(predicted_prices[j]) if predicted_prices is not None else None,
+                    bool(anomaly_flags[j]) if anomaly_flags is not None else False
+                )
+                model_outputs[pos] = output
+                if memo_keys[pos] is not None:
+                    self.inference_memo.put(memo_keys[pos], output, generation=generation)
+        
+        # 3. Fan-out kết quả về từng property
+        for pos, i in enumerate(batch_rows):
+            prop = properties[i]
+            try:
+                predicted_price, is_anomaly_model = None, False
+                if need_features:
+                    predicted_price, is_anomaly_model = model_outputs[pos]
+                if predicted_price is not None:
+                    confidence = 0.8
+                    price_reasons = ['✅ Dự đoán từ ML model']
+                else:
+                    predicted_price = self._heuristic_price(prop)
+                    confidence = 0.5
+                    price_reasons = ['⚠️ Sử dụng heuristic (model chưa train)']
+                
+                is_anomaly, anomaly_score, anomaly_reasons = self._anomaly_verdict(
+                    prop.get('price', 0), predicted_price, is_anomaly_model
+                )
+                results[i] = {
+                    'predicted_price': predicted_price,
+                    'confidence': confidence,
+                    'price_reasons': price_reasons,
+                    'is_anomaly': is_anomaly,
+                    'anomaly_score': anomaly_score,
+                    'anomaly_reasons': anomaly_reasons
+                }
+            except Exception as e:
+                results[i] = e
+        
+        return results
+    
+    def _evaluate_unbatched(self, property_data: Dict) -> Union[Dict, Exception]:
+        """Đánh giá 1 property qua predict_price + detect_anomaly (fallback của batch)"""
+        try:
+            predicted_price, confidence, price_reasons = self.predict_price(property_data)
+            is_anomaly, anomaly_score, anomaly_reasons = self.detect_anomaly(property_data)
+        except Exception as e:
+            return e
+        return {
+            'predicted_price': predicted_price,
+            'confidence': confidence,
+            'price_reasons': price_reasons,
+            'is_anomaly': is_anomaly,
+            'anomaly_score': anomaly_score,
+            'anomaly_reasons': anomaly_reasons
+        }
+    
+    @staticmethod
+    def _anomaly_verdict(
+        actual_price: float,
+        predicted_price: float,
+        is_anomaly_model: bool
+    ) -> Tuple[bool, float, List[str]]:
+        """Kết hợp kết quả Isolation Forest với rule-based deviation check"""
+        reasons = []
+        
+        if is_anomaly_model:
+            reasons.append('❌ Model phát hiện giá bất thường')
         
-        # Nếu giá quá cao hoặc quá thấp so với dự đoán
+        if predicted_price > 0:
+            deviation_pct = ((actual_price - predicted_price) / predicted_price) * 100
+        else:
+            deviation_pct = 0
+        
+        is_anomaly_rule = False
         if abs(deviation_pct) > 50:
             is_anomaly_rule = True
             if deviation_pct > 0:
@@ -229,10 +433,7 @@ class MLPredictor:
             else:
                 reasons.append(f'⚠️ Giá thấp hơn dự đoán {abs(deviation_pct):.1f}%')
         
-        # Tổng hợp
         is_anomaly = is_anomaly_model or is_anomaly_rule
-        
-        # Anomaly score (càng cao càng bất thường)
         anomaly_score = min(abs(deviation_pct) / 100, 1.0)
         
         if not is_anomaly:
@@ -285,12 +486,35 @@ def evaluate_price(property_data: Dict, ml_predictor: MLPredictor) -> Dict:
         Dictionary chứa kết quả đánh giá
     """
     actual_price = property_data.get('price', 0)
+    return _price_result(actual_price, ml_predictor.evaluate(property_data))
+
+
+def evaluate_price_batch(
+    properties: List[Dict],
+    ml_predictor: MLPredictor
+) -> List[Union[Dict, Exception]]:
+    """
+    Phiên bản batch của evaluate_price (một lần chạy model cho cả list)
     
-    # 1. Predict price
-    predicted_price, confidence, price_reasons = ml_predictor.predict_price(property_data)
-    
-    # 2. Detect anomaly
-    is_anomaly, anomaly_score, anomaly_reasons = ml_predictor.detect_anomaly(property_data)
+    Returns:
+        List cùng thứ tự với input; phần tử là Exception nếu row đó lỗi
+    """
+    results = []
+    for prop, evaluation in zip(properties, ml_predictor.evaluate_batch(properties)):
+        if isinstance(evaluation, Exception):
+            results.append(evaluation)
+            continue
+        try:
+            results.append(_price_result(prop.get('price', 0), evaluation))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _price_result(actual_price: float, evaluation: Dict) -> Dict:
+    """Tính price_score từ kết quả predict + anomaly của MLPredictor"""
+    predicted_price = evaluation['predicted_price']
+    is_anomaly = evaluation['is_anomaly']
     
     # 3. Tính price score
     # Score cao nếu giá gần với dự đoán
@@ -321,9 +545,9 @@ def evaluate_price(property_data: Dict, ml_predictor: MLPredictor) -> Dict:
         'actual_price': int(actual_price),
         'deviation_pct': round(deviation_pct, 2),
         'is_anomaly': is_anomaly,
-        'anomaly_score': round(anomaly_score, 3),
-        'confidence': round(confidence, 3),
-        'reasons': price_reasons + anomaly_reasons
+        'anomaly_score': round(evaluation['anomaly_score'], 3),
+        'confidence': round(evaluation['confidence'], 3),
+        'reasons': evaluation['price_reasons'] + evaluation['anomaly_reasons']
     }
 
 
@@ -0,0 +1,472 @@
+"""
+Model bundle: định dạng lưu models cho serving
+Thay cho các file .pkl riêng lẻ (pickle/joblib)
+
+models/bundle/
+    manifest.json                  version, feature lists, schema version, params, file paths
+    <version>/price_model.ubj      XGBoost native (UBJSON)
+    <version>/anomaly_model/*.npy  Isolation Forest dạng mảng node (mmap)
+    <version>/scaler/*.npy         mean / scale của StandardScaler
+    <version>/anomaly_scaler/*.npy scaler riêng của anomaly features (training)
+
+Mỗi lần save tạo thư mục version mới rồi mới ghi đè manifest.json
+(os.replace), nên process đang đọc bundle cũ không bị đọc dở.
+"""
+
+import os
+import json
+import time
+import shutil
+import pickle
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from feature_schema import SCHEMA_VERSION
+from packed_trees import PackedIsolationForest, pack_isolation_forest
+
+BUNDLE_FORMAT = 'ml-moderation-bundle'
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+COMPONENTS = ('price_model', 'anomaly_model', 'scaler', 'anomaly_scaler')
+
+# Số thư mục version cũ giữ lại sau khi save (cho process đang load dở)
+KEEP_VERSIONS = 2
+
+
+class BundleError(Exception):
+    """Bundle không đọc được (manifest sai format, thiếu file...)"""
+
+
+def _scaler_array(scaler, name: str) -> Optional[np.ndarray]:
+    """mean_ / scale_ mà transform dùng (with_mean=False: sklearn vẫn tính mean_ nhưng không trừ)"""
+    if name == 'mean' and not getattr(scaler, 'with_mean', True):
+        return None
+    return getattr(scaler, f'{name}_', None)
+
+
+class ArrayScaler:
+    """
+    StandardScaler chỉ gồm mảng mean / scale (transform giống sklearn)
+    
+    n_features_in_ lấy từ manifest: scaler with_mean=False, with_std=False
+    không có mảng nào để suy ra số features (None: bundle cũ không ghi và
+    cũng không có mảng)
+    """
+    
+    def __init__(self, mean: Optional[np.ndarray], scale: Optional[np.ndarray],
+                 n_features_in_: Optional[int] = None):
+        self.mean_ = mean
+        self.scale_ = scale
+        if n_features_in_ is None:
+            arrays = [array for array in (mean, scale) if array is not None]
+            n_features_in_ = len(arrays[0]) if arrays else None
+        self.n_features_in_ = n_features_in_
+    
+    @classmethod
+    def from_sklearn(cls, scaler) -> 'ArrayScaler':
+        return cls(_scaler_array(scaler, 'mean'), _scaler_array(scaler, 'scale'),
+                   getattr(scaler, 'n_features_in_', None))
+    
+    def transform(self, X) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        if self.mean_ is not None:
+            X -= self.mean_
+        if self.scale_ is not None:
+            X /= self.scale_
+        return X
+
+
+class ModelBundle:
+    """
+    Models đã load + thông tin đi kèm
+    
+    Attributes:
+        price_model, anomaly_model, scaler, anomaly_scaler: None nếu bundle không có
+        feature_names: thứ tự features đầu vào của models
+        component_features: features riêng của từng component (nếu có)
+        schema_versions: feature schema version mỗi component được train
+            (None: models cũ, không rõ version)
+        feature_stats: stats training của từng component (vd. mean/std
+            cho ZScore features)
+        version: model version (tên thư mục version trong bundle)
+        load_times: thời gian load từng component (ms)
+    """
+    
+    def __init__(
+        self,
+        price_model=None,
+        anomaly_model=None,
+        scaler=None,
+        anomaly_scaler=None,
+        feature_names: Optional[List[str]] = None,
+        component_features: Optional[Dict[str, List[str]]] = None,
+        version: Optional[str] = None,
+        manifest: Optional[Dict] = None,
+        load_times: Optional[Dict[str, float]] = None,
+        schema_versions: Optional[Dict[str, Optional[int]]] = None,
+        feature_stats: Optional[Dict[str, Dict]] = None
+    ):
+        self.price_model = price_model
+        self.anomaly_model = anomaly_model
+        self.scaler = scaler
+        self.anomaly_scaler = anomaly_scaler
+        self.feature_names = feature_names
+        self.component_features = component_features or {}
+        self.version = version
+        self.manifest = manifest or {}
+        self.load_times = load_times or {}
+        self.schema_versions = schema_versions or {}
+        self.feature_stats = feature_stats or {}
+
+
+# ============================================================
+# Save
+# ============================================================
+
+def _save_price_model(model, path: str) -> Dict:
+    model.save_model(path)
+    return {'type': 'xgboost', 'file': os.path.basename(path)}
+
+
+def _save_anomaly_model(model, path: str) -> Dict:
+    packed = model if isinstance(model, PackedIsolationForest) else None
+    if packed is None:
+        packed = PackedIsolationForest(**pack_isolation_forest(model))
+    os.makedirs(path)
+    for name, array in packed.arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+    return {
+        'type': 'packed_isolation_forest',
+        'file': os.path.basename(path),
+        'arrays': sorted(packed.arrays),
+        'params': packed.params
+    }
+
+
+def _save_scaler(scaler, path: str) -> Dict:
+    os.makedirs(path)
+    arrays = {}
+    for name in ('mean', 'scale'):
+        value = _scaler_array(scaler, name)
+        if value is not None:
+            np.save(os.path.join(path, f'{name}.npy'), np.asarray(value, dtype=np.float64))
+            arrays[name] = True
+    n_features = getattr(scaler, 'n_features_in_', None)
+    return {
+        'type': 'standard_scaler',
+        'file': os.path.basename(path),
+        'arrays': sorted(arrays),
+        'n_features': int(n_features) if n_features is not None else None
+    }
+
+
+_SAVERS = {
+    'price_model': (_save_price_model, 'price_model.ubj'),
+    'anomaly_model': (_save_anomaly_model, 'anomaly_model'),
+    'scaler': (_save_scaler, 'scaler'),
+    'anomaly_scaler': (_save_scaler, 'anomaly_scaler')
+}
+
+
+def save_bundle(
+    bundle_dir: str,
+    price_model=None,
+    anomaly_model=None,
+    scaler=None,
+    anomaly_scaler=None,
+    feature_names: Optional[List[str]] = None,
+    component_features: Optional[Dict[str, List[str]]] = None,
+    feature_stats: Optional[Dict[str, Dict]] = None,
+    metadata: Optional[Dict] = None,
+    update: bool = True,
+    schema_version: Optional[int] = SCHEMA_VERSION
+) -> Dict:
+    """
+    Ghi models vào bundle (tạo version mới)
+    
+    Args:
+        price_model: XGBRegressor / Booster đã train
+        anomaly_model: sklearn IsolationForest hoặc PackedIsolationForest
+        scaler: StandardScaler (hoặc ArrayScaler) cho features đầu vào
+        anomaly_scaler: StandardScaler của anomaly features (3_train)
+        feature_names: thứ tự features đầu vào chung
+        component_features: features riêng của từng component (nếu khác nhau)
+        feature_stats: stats training cần lúc extract features, theo component
+        metadata: thông tin thêm (metrics, thresholds...) ghi vào manifest
+        update: giữ lại các component đã có trong bundle hiện tại mà lần
+            này không truyền vào (vd. 2_train chỉ ghi price_model,
+            3_train ghi tiếp anomaly_model)
+        schema_version: feature schema version ghi vào các component
+            được ghi lần này (mặc định version hiện tại)
+    
+    Returns:
+        manifest mới
+    """
+    os.makedirs(bundle_dir, exist_ok=True)
+    previous = read_manifest(bundle_dir) if update and has_bundle(bundle_dir) else None
+    
+    version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    version_dir = os.path.join(bundle_dir, version)
+    os.makedirs(version_dir)
+    
+    if feature_names is None and previous:
+        feature_names = previous.get('feature_names')
+    
+    given = {
+        'price_model': price_model, 'anomaly_model': anomaly_model,
+        'scaler': scaler, 'anomaly_scaler': anomaly_scaler
+    }
+    components = {}
+    for name in COMPONENTS:
+        if given[name] is not None:
+            saver, filename = _SAVERS[name]
+            components[name] = saver(given[name], os.path.join(version_dir, filename))
+            features = (component_features or {}).get(name)
+            if features is not None:
+                components[name]['features'] = list(features)
+            if (feature_stats or {}).get(name) is not None:
+                components[name]['feature_stats'] = feature_stats[name]
+            components[name]['schema_version'] = schema_version
+        elif previous and name in previous['components']:
+            # Copy component cũ sang version mới (bundle luôn tự đủ trong 1 thư mục)
+            # cùng schema_version của lần train trước
+            old = previous['components'][name]
+            src = os.path.join(bundle_dir, previous['version'], old['file'])
+            dst = os.path.join(version_dir, old['file'])
+            if os.path.isdir(src):
+                shutil.copytree(src, dst)
+            else:
+                shutil.copy2(src, dst)
+            components[name] = old
+    
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'version': version,
+        'created_at': datetime.now().isoformat(),
+        'feature_names': list(feature_names) if feature_names is not None else None,
+        'components': components,
+        'metadata': {**(previous or {}).get('metadata', {}), **(metadata or {})}
+    }
+    
+    # Ghi manifest tạm rồi replace (atomic)
+    tmp_path = os.path.join(bundle_dir, f'.{MANIFEST_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(bundle_dir, MANIFEST_FILE))
+    
+    _prune_versions(bundle_dir, keep=version)
+    return manifest
+
+
+def _prune_versions(bundle_dir: str, keep: str):
+    versions = sorted(
+        name for name in os.listdir(bundle_dir)
+        if os.path.isdir(os.path.join(bundle_dir, name)) and name != keep
+    )
+    for name in versions[:max(0, len(versions) - (KEEP_VERSIONS - 1))]:
+        shutil.rmtree(os.path.join(bundle_dir, name), ignore_errors=True)
+
+
+# ============================================================
+# Load
+# ============================================================
+
+def has_bundle(bundle_dir: str) -> bool:
+    return os.path.exists(os.path.join(bundle_dir, MANIFEST_FILE))
+
+
+def read_manifest(bundle_dir: str) -> Dict:
+    with open(os.path.join(bundle_dir, MANIFEST_FILE), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise BundleError(f'{bundle_dir}: not a model bundle')
+    if manifest.get('format_version', 0) > BUNDLE_FORMAT_VERSION:
+        raise BundleError(
+            f"{bundle_dir}: bundle format v{manifest['format_version']} is newer "
+            f'than supported v{BUNDLE_FORMAT_VERSION}'
+        )
+    return manifest
+
+
+def _load_price_model(path: str, spec: Dict):
+    import xgboost as xgb
+    model = xgb.XGBRegressor()
+    model.load_model(path)
+    return model
+
+
+def _load_anomaly_model(path: str, spec: Dict) -> PackedIsolationForest:
+    arrays = {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+        for name in spec['arrays']
+    }
+    return PackedIsolationForest(arrays, spec['params'])
+
+
+def _load_scaler(path: str, spec: Dict) -> ArrayScaler:
+    arrays = {
+        name: np.load(os.path.join(path, f'{name}.npy')) if name in spec['arrays'] else None
+        for name in ('mean', 'scale')
+    }
+    return ArrayScaler(arrays['mean'], arrays['scale'], spec.get('n_features'))
+
+
+_LOADERS = {
+    'price_model': _load_price_model,
+    'anomaly_model': _load_anomaly_model,
+    'scaler': _load_scaler,
+    'anomaly_scaler': _load_scaler
+}
+
+
+def load_bundle(bundle_dir: str, parallel: Optional[bool] = None) -> ModelBundle:
+    """
+    Load bundle, các component được load song song (mặc định khi máy có
+    nhiều hơn 1 CPU; với 1 CPU load tuần tự nhanh hơn)
+    
+    Mảng của Isolation Forest được mmap (không copy qua buffer đọc file),
+    PackedIsolationForest sắp xếp lại chúng 1 lần khi khởi tạo.
+    """
+    start = time.perf_counter()
+    manifest = read_manifest(bundle_dir)
+    version_dir = os.path.join(bundle_dir, manifest['version'])
+    specs = manifest['components']
+    
+    def load(name):
+        t0 = time.perf_counter()
+        spec = specs[name]
+        loader = _LOADERS.get(name)
+        if loader is None:
+            raise BundleError(f'{bundle_dir}: unknown component {name}')
+        component = loader(os.path.join(version_dir, spec['file']), spec)
+        return name, component, (time.perf_counter() - t0) * 1000
+    
+    names = [name for name in COMPONENTS if name in specs]
+    if parallel is None:
+        parallel = (os.cpu_count() or 1) > 1
+    if parallel and len(names) > 1:
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            loaded = list(pool.map(load, names))
+    else:
+        loaded = [load(name) for name in names]
+    
+    components = {name: component for name, component, _ in loaded}
+    load_times = {name: round(ms, 2) for name, _, ms in loaded}
+    load_times['total'] = round((time.perf_counter() - start) * 1000, 2)
+    
+    return ModelBundle(
+        **components,
+        feature_names=manifest.get('feature_names'),
+        component_features={
+            name: spec['features'] for name, spec in specs.items() if spec.get('features')
+        },
+        version=manifest['version'],
+        manifest=manifest,
+        load_times=load_times,
+        schema_versions={name: specs[name].get('schema_version') for name in names},
+        feature_stats={
+            name: spec['feature_stats'] for name, spec in specs.items() if spec.get('feature_stats')
+        }
+    )
+
+
+def load_legacy_pickles(models_dir: str) -> ModelBundle:
+    """
+    Load các file .pkl kiểu cũ (price_model.pkl, anomaly_model.pkl,
+    scaler.pkl, feature_names.pkl)
+    
+    Training scripts lưu dict {'model': ..., 'feature_columns': ...}
+    bằng joblib, nên dict được unwrap ở đây.
+    """
+    components = {}
+    component_features = {}
+    schema_versions = {}
+    feature_stats = {}
+    load_times = {}
+    start = time.perf_counter()
+    for name in ('price_model', 'anomaly_model', 'scaler', 'feature_names'):
+        path = os.path.join(models_dir, f'{name}.pkl')
+        if not os.path.exists(path):
+            continue
+        t0 = time.perf_counter()
+        try:
+            import joblib
+            obj = joblib.load(path)
+        except ImportError:
+            with open(path, 'rb') as f:
+                obj = pickle.load(f)
+        load_times[name] = round((time.perf_counter() - t0) * 1000, 2)
+        
+        if isinstance(obj, dict) and 'model' in obj:
+            features = obj.get('feature_columns') or obj.get('anomaly_features')
+            if features:
+                component_features[name] = list(features)
+            schema_versions[name] = obj.get('schema_version')
+            if obj.get('feature_stats'):
+                feature_stats[name] = obj['feature_stats']
+            if name == 'anomaly_model' and obj.get('scaler') is not None:
+                components['anomaly_scaler'] = obj['scaler']
+            obj = obj['model']
+        components[name] = obj
+    load_times['total'] = round((time.perf_counter() - start) * 1000, 2)
+    
+    return ModelBundle(
+        price_model=components.get('price_model'),
+        anomaly_model=components.get('anomaly_model'),
+        scaler=components.get('scaler'),
+        anomaly_scaler=components.get('anomaly_scaler'),
+        feature_names=components.get('feature_names', component_features.get('price_model')),
+        component_features=component_features,
+        version='legacy-pickle' if len(load_times) > 1 else None,
+        load_times=load_times,
+        schema_versions=schema_versions,
+        feature_stats=feature_stats
+    )
+
+
+def load_models(models_dir: str) -> ModelBundle:
+    """
+    models_dir/bundle nếu có, không thì fallback sang .pkl kiểu cũ
+    
+    Isolation Forest từ .pkl cũng được pack để request path luôn chấm
+    điểm bằng PackedIsolationForest (không qua sklearn)
+    """
+    bundle_dir = os.path.join(models_dir, 'bundle')
+    if has_bundle(bundle_dir):
+        return load_bundle(bundle_dir)
+    bundle = load_legacy_pickles(models_dir)
+    if bundle.anomaly_model is not None and not isinstance(bundle.anomaly_model, PackedIsolationForest):
+        bundle.anomaly_model = PackedIsolationForest(**pack_isolation_forest(bundle.anomaly_model))
+    return bundle
+
+
+def convert_legacy_pickles(models_dir: str) -> Dict:
+    """Chuyển các .pkl kiểu cũ trong models_dir sang bundle"""
+    legacy = load_legacy_pickles(models_dir)
+    if legacy.version is None:
+        raise BundleError(f'{models_dir}: no .pkl models to convert')
+    return save_bundle(
+        os.path.join(models_dir, 'bundle'),
+        price_model=legacy.price_model,
+        anomaly_model=legacy.anomaly_model,
+        scaler=legacy.scaler,
+        anomaly_scaler=legacy.anomaly_scaler,
+        feature_names=legacy.feature_names,
+        component_features=legacy.component_features,
+        feature_stats=legacy.feature_stats,
+        metadata={'converted_from': 'legacy-pickle'},
+        update=False,
+        # .pkl do training scripts cũ ghi không có schema version
+        schema_version=legacy.schema_versions.get('price_model')
+    )
+
+
+if __name__ == '__main__':
+    import sys
+    
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), '..', 'models')
+    manifest = convert_legacy_pickles(target)
+    print(f"✅ Converted {', '.join(manifest['components'])} -> {target}/bundle (version {manifest['version']})")
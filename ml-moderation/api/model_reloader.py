@@ -0,0 +1,178 @@
+"""
+Hot reload models không cần restart server
+- POST /api/models/reload: reload trong background thread
+- Watcher (optional): poll models/bundle/manifest.json, tự reload khi
+  training scripts ghi version mới
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Dict
+
+from model_bundle import MANIFEST_FILE, read_manifest
+from moderation_service import ModerationService, ModelReloadError
+
+
+class ModelReloader:
+    """
+    Điều phối reload models cho ModerationService
+    
+    - Mỗi lúc chỉ 1 reload chạy (reload khác tới trong lúc đó bị từ chối)
+    - Trạng thái reload gần nhất xem qua status()
+    - watch_interval > 0: thread poll manifest.json mỗi watch_interval giây.
+      Thread start lazy trong từng process (gọi ensure_watching() mỗi
+      request), nên mỗi gunicorn worker tự reload models của nó
+    """
+    
+    def __init__(self, service: ModerationService, watch_interval: float = 0.0):
+        self.service = service
+        self.watch_interval = watch_interval
+        self.manifest_path = os.path.join(service.models_dir, 'bundle', MANIFEST_FILE)
+        self._reset()
+    
+    def _reset(self):
+        """State riêng của từng process (gọi lại sau fork)"""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._watcher_lock = threading.Lock()
+        self._watcher = None
+        self._seen_mtime = None
+        self._failed_version = None
+        self._status = {
+            'state': 'idle',
+            'trigger': None,
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+            'reloads': 0,
+            'failures': 0
+        }
+    
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+    
+    def reload(self, trigger: str = 'api') -> Dict:
+        """
+        Reload đồng bộ
+        
+        Raises:
+            RuntimeError: đang có reload khác chạy
+            ModelReloadError: models mới lỗi (models cũ vẫn được giữ)
+        """
+        self._check_pid()
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A model reload is already in progress')
+        try:
+            return self._reload_locked(trigger)
+        finally:
+            self._lock.release()
+    
+    def _reload_locked(self, trigger: str) -> Dict:
+        """Reload khi đã giữ self._lock (caller release)"""
+        self._status.update({
+            'state': 'reloading',
+            'trigger': trigger,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'error': None
+        })
+        start = time.perf_counter()
+        try:
+            result = self.service.reload_models()
+        except ModelReloadError as e:
+            self._status.update({
+                'state': 'failed',
+                'finished_at': datetime.now().isoformat(),
+                'error': str(e),
+                'failures': self._status['failures'] + 1
+            })
+            print(f'❌ Model reload ({trigger}) failed, keeping current models: {e}')
+            raise
+        
+        result['reload_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        self._status.update({
+            'state': 'succeeded',
+            'finished_at': datetime.now().isoformat(),
+            'result': result,
+            'reloads': self._status['reloads'] + 1
+        })
+        print(f"✅ Models reloaded ({trigger}): {result['previous_version']} -> {result['version']}")
+        return result
+    
+    def start(self, trigger: str = 'api') -> bool:
+        """Reload trong background thread, False nếu đang có reload khác chạy"""
+        self._check_pid()
+        # Giữ lock ngay tại đây (không check rồi mới start thread): 2 request
+        # đồng thời thì chỉ 1 request được 202
+        if not self._lock.acquire(blocking=False):
+            return False
+        
+        def run():
+            try:
+                self._reload_locked(trigger)
+            except ModelReloadError:
+                pass
+            finally:
+                self._lock.release()
+        
+        threading.Thread(target=run, name='model-reload', daemon=True).start()
+        return True
+    
+    def status(self) -> Dict:
+        self._check_pid()
+        return {
+            'version': self.service.ml_predictor.model_version,
+            'watch_interval': self.watch_interval,
+            'watching': self._watcher is not None,
+            **self._status
+        }
+    
+    # ============================================================
+    # Watcher
+    # ============================================================
+    
+    def ensure_watching(self):
+        """Start watcher thread trong process hiện tại (nếu bật và chưa chạy)"""
+        if self.watch_interval <= 0:
+            return
+        self._check_pid()
+        if self._watcher is not None:
+            return
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+                self._watcher.start()
+    
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            try:
+                self._poll()
+            except Exception as e:
+                print(f'⚠️ Model watcher error: {e}')
+    
+    def _poll(self):
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._seen_mtime:
+            return
+        self._seen_mtime = mtime
+        
+        version = read_manifest(os.path.dirname(self.manifest_path))['version']
+        if version in (self.service.ml_predictor.model_version, self._failed_version):
+            return
+        try:
+            self.reload(trigger='watcher')
+            self._failed_version = None
+        except ModelReloadError:
+            # Không thử lại version lỗi cho tới khi có version mới
+            self._failed_version = version
+        except RuntimeError:
+            # Đang có reload khác, poll lại ở vòng sau
+            self._seen_mtime = None
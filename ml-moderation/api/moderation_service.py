@@ -3,9 +3,56 @@ Core Moderation Service
 Kết hợp Rule-based + ML để duyệt bài đăng
 """
 
+import json
+import math
+import hashlib
+from time import perf_counter
 from typing import Dict, List
-from rule_validators import validate_property_rules
-from ml_predictor import MLPredictor, evaluate_price
+from rule_validators import TextValidator, validate_property_rules, stage_memo_stats
+from ml_predictor import MLPredictor, evaluate_price_batch
+from result_cache import ResultCache
+from micro_batcher import MicroBatcher
+from metrics import current_trace, record_decision, record_decisions
+
+
+# Các field ảnh hưởng tới kết quả moderation (dùng để tạo cache key)
+MODERATION_FIELDS = (
+    'title', 'description', 'price', 'area', 'propertyType', 'address',
+    'location', 'bedrooms', 'bathrooms', 'images', 'amenities'
+)
+
+
+# Listing mẫu để smoke test models mới trước khi swap
+SMOKE_TEST_PROPERTY = {
+    'title': 'Phòng trọ gần trung tâm',
+    'description': 'Phòng sạch sẽ, có wifi, máy lạnh, chỗ để xe',
+    'price': 3_000_000,
+    'area': 25,
+    'bedrooms': 1,
+    'bathrooms': 1,
+    'propertyType': 'phong-tro',
+    'address': {'district': 'Quận 1', 'city': 'TP. Hồ Chí Minh'},
+    'location': {'coordinates': [106.7, 10.78]},
+    'amenities': {'wifi': True, 'ac': True, 'parking': True}
+}
+
+
+class ModelReloadError(Exception):
+    """Models mới không load được hoặc không qua smoke test"""
+
+
+def content_hash(property_data: Dict) -> str:
+    """
+    Hash canonical của các field moderation
+    
+    Cùng nội dung (kể cả khác _id, khác thứ tự key) -> cùng hash
+    """
+    relevant = {field: property_data.get(field) for field in MODERATION_FIELDS}
+    canonical = json.dumps(
+        relevant, sort_keys=True, ensure_ascii=False,
+        separators=(',', ':'), default=str
+    )
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
 
 
 class ModerationService:
@@ -17,14 +64,122 @@ class ModerationService:
     2. ML-based price evaluation
     3. Tổng hợp overall_score
     4. Quyết định: auto_approved / pending_review / rejected
+    
+    Kết quả được cache theo content_hash (LRU + TTL). Cache bị xoá khi
+    đổi thresholds/keywords hoặc reload models.
+    
+    Phần ML của các moderate() chạy đồng thời (nhiều threads) được gom
+    thành batch qua MicroBatcher.
+    
+    Mỗi request giữ predictor của nó từ đầu đến cuối, nên khi reload_models()
+    swap predictor mới, request đang chạy vẫn xong trên models cũ.
     """
     
-    def __init__(self, models_dir: str = '../models'):
-        self.ml_predictor = MLPredictor(models_dir=models_dir)
+    def __init__(
+        self,
+        models_dir: str = '../models',
+        cache_size: int = 1024,
+        cache_ttl: float = 300.0,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 2.0,
+        price_backend: str = 'xgboost',
+        predict_threads: int = 1
+    ):
+        self.models_dir = models_dir
+        self.price_backend = price_backend
+        self.predict_threads = predict_threads
+        self.ml_predictor = MLPredictor(
+            models_dir=models_dir, price_backend=price_backend, predict_threads=predict_threads
+        )
         
         # Thresholds
         self.AUTO_APPROVE_THRESHOLD = 0.85
         self.REJECT_THRESHOLD = 0.60
+        
+        # Cache kết quả moderation (cache_size=0 để tắt)
+        self.result_cache = ResultCache(max_size=cache_size, ttl=cache_ttl)
+        
+        # Gom price evaluation của các request đơn lẻ đồng thời (batch_max_size<=1 để tắt)
+        self.price_batcher = MicroBatcher(
+            self._evaluate_price_batch,
+            max_batch=batch_max_size,
+            max_wait_ms=batch_max_wait_ms
+        )
+    
+    def update_thresholds(self, auto_approve: float = None, reject: float = None):
+        """Đổi thresholds và invalidate cache (decision phụ thuộc thresholds)"""
+        if auto_approve is not None:
+            self.AUTO_APPROVE_THRESHOLD = auto_approve
+        if reject is not None:
+            self.REJECT_THRESHOLD = reject
+        self.result_cache.clear()
+    
+    def update_keywords(self, spam_keywords: List[str] = None, forbidden_words: List[str] = None):
+        """Hot-reload keyword lists của TextValidator và invalidate cache"""
+        TextValidator.reload_keywords(spam_keywords=spam_keywords, forbidden_words=forbidden_words)
+        self.result_cache.clear()
+    
+    def stage_memo_stats(self) -> Dict:
+        """Hit/miss của memo từng stage (text, image, price)"""
+        stats = stage_memo_stats()
+        stats['price'] = self.ml_predictor.inference_memo.stats()
+        return stats
+    
+    def _evaluate_price_batch(self, items: List) -> List:
+        """
+        Price evaluation cho 1 micro-batch
+        
+        items là các cặp (property, predictor); batch có thể lẫn 2 predictor
+        khi đang reload, mỗi nhóm chạy trên đúng predictor của nó
+        """
+        groups = {}
+        for i, (_, predictor) in enumerate(items):
+            groups.setdefault(id(predictor), (predictor, []))[1].append(i)
+        
+        results = [None] * len(items)
+        for predictor, indices in groups.values():
+            group_results = evaluate_price_batch([items[i][0] for i in indices], predictor)
+            for i, result in zip(indices, group_results):
+                results[i] = result
+        return results
+    
+    def reload_models(self) -> Dict:
+        """
+        Load models mới từ models_dir, smoke test rồi mới swap
+        
+        Models mới được load trong khi predictor cũ vẫn phục vụ request.
+        Load lỗi hoặc smoke test fail -> raise ModelReloadError, giữ models cũ.
+        
+        Returns:
+            {previous_version, version, load_ms, smoke_test}
+        """
+        previous = self.ml_predictor
+        try:
+            predictor = MLPredictor(
+                models_dir=self.models_dir, strict=True,
+                price_backend=self.price_backend, predict_threads=self.predict_threads
+            )
+            smoke = predictor.evaluate(SMOKE_TEST_PROPERTY)
+        except Exception as e:
+            raise ModelReloadError(f'Failed to load models: {e}') from e
+        
+        predicted_price = smoke['predicted_price']
+        if not math.isfinite(predicted_price) or predicted_price <= 0:
+            raise ModelReloadError(f'Smoke test failed: predicted_price={predicted_price}')
+        
+        # Swap (gán attribute là atomic), rồi invalidate cache của models cũ
+        self.ml_predictor = predictor
+        self.result_cache.clear()
+        
+        return {
+            'previous_version': previous.model_version,
+            'version': predictor.model_version,
+            'load_ms': predictor.load_times,
+            'smoke_test': {
+                'predicted_price': predicted_price,
+                'is_anomaly': smoke['is_anomaly']
+            }
+        }
     
     def moderate(self, property_data: Dict) -> Dict:
         """
@@ -34,7 +189,8 @@ class ModerationService:
             property_data: Dictionary chứa thông tin property
         
         Returns:
-            Dictionary chứa kết quả moderation:
+            Dictionary chứa kết quả moderation (có thể lấy từ cache,
+            dùng chung giữa các request nên không được sửa trực tiếp):
             {
                 'success': bool,
                 'overall_score': float,
@@ -44,13 +200,38 @@ class ModerationService:
                 'suggestions': [...]
             }
         """
+        cache_key = content_hash(property_data)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            record_decision(cached, cached=True)
+            return cached
+        generation = self.result_cache.generation
+        predictor = self.ml_predictor
         
         # 1. Rule-based validation
         rule_result = validate_property_rules(property_data)
         
-        # 2. ML-based price evaluation
-        price_result = evaluate_price(property_data, self.ml_predictor)
+        # 2. ML-based price evaluation (chung batch với các request đồng thời)
+        ml_start = perf_counter()
+        price_result = self.price_batcher.submit((property_data, predictor))
+        trace = current_trace()
+        if trace is not None:
+            trace.add('ml', perf_counter() - ml_start)
         
+        result = self._build_result(rule_result, price_result, predictor.model_version)
+        self.result_cache.put(cache_key, result, generation=generation)
+        record_decision(result, cached=False)
+        return result
+    
+    def _build_result(
+        self,
+        rule_result: Dict,
+        price_result: Dict,
+        model_version: str = None
+    ) -> Dict:
+        """
+        Tổng hợp kết quả rule-based + ML thành response moderation
+        """
         # 3. Tổng hợp overall_score
         # Weights: rules 60%, ML 40%
         rule_score = rule_result['overall_score']
@@ -111,7 +292,8 @@ class ModerationService:
             'thresholds': {
                 'auto_approve': self.AUTO_APPROVE_THRESHOLD,
                 'reject': self.REJECT_THRESHOLD
-            }
+            },
+            'model_version': model_version
         }
     
     def _generate_suggestions(
@@ -172,19 +354,72 @@ class ModerationService:
     def batch_moderate(self, properties: List[Dict]) -> List[Dict]:
         """
         Moderate nhiều properties cùng lúc
+        
+        Rule-based validation chạy theo từng property, còn phần ML chạy
+        vectorized cho cả batch (1 lần scaler/predict thay vì N lần).
+        Lỗi ở property nào chỉ ảnh hưởng kết quả của property đó.
         """
-        results = []
-        for prop in properties:
+        results: List[Dict] = [None] * len(properties)
+        generation = self.result_cache.generation
+        predictor = self.ml_predictor
+        
+        # 0. Lấy kết quả đã cache
+        cache_keys = {}
+        cached = set()
+        for i, prop in enumerate(properties):
+            try:
+                cache_keys[i] = content_hash(prop)
+            except Exception as e:
+                results[i] = self._error_result(prop, e)
+                continue
+            results[i] = self.result_cache.get(cache_keys[i])
+            if results[i] is not None:
+                cached.add(i)
+        
+        # 1. Rule-based validation cho các property chưa có trong cache
+        rule_results = {}
+        for i, prop in enumerate(properties):
+            if results[i] is not None:
+                continue
+            try:
+                rule_results[i] = validate_property_rules(prop)
+            except Exception as e:
+                results[i] = self._error_result(prop, e)
+        
+        # 2. ML-based price evaluation cho cả batch
+        indices = list(rule_results)
+        ml_start = perf_counter()
+        price_results = evaluate_price_batch(
+            [properties[i] for i in indices],
+            predictor
+        )
+        trace = current_trace()
+        if trace is not None:
+            trace.add('ml', perf_counter() - ml_start)
+        
+        # 3. Tổng hợp kết quả từng property
+        for i, price_result in zip(indices, price_results):
+            if isinstance(price_result, Exception):
+                results[i] = self._error_result(properties[i], price_result)
+                continue
             try:
-                result = self.moderate(prop)
-                results.append(result)
+                results[i] = self._build_result(rule_results[i], price_result, predictor.model_version)
             except Exception as e:
-                results.append({
-                    'success': False,
-                    'error': str(e),
-                    'property_id': prop.get('_id', 'unknown')
-                })
+                results[i] = self._error_result(properties[i], e)
+                continue
+            self.result_cache.put(cache_keys[i], results[i], generation=generation)
+        
+        record_decisions(results, cached)
         return results
+    
+    @staticmethod
+    def _error_result(prop, error: Exception) -> Dict:
+        """Response cho property bị lỗi trong batch"""
+        return {
+            'success': False,
+            'error': str(error),
+            'property_id': prop.get('_id', 'unknown') if isinstance(prop, dict) else 'unknown'
+        }
 
 
 if __name__ == '__main__':
@@ -0,0 +1,392 @@
+"""
+Tree ensembles dạng mảng NumPy (không cần sklearn/xgboost lúc chấm điểm)
+Toàn bộ cây được nối thành các mảng node phẳng và đi xuống mọi cây cùng
+lúc bằng phép index NumPy:
+- PackedIsolationForest: lưu/đọc bằng .npy (mmap được), giống hệt
+  IsolationForest.score_samples
+- PackedXGBRegressor: pack từ XGBoost booster, giống hệt XGBRegressor.predict
+"""
+
+import json
+import numpy as np
+from typing import Dict
+
+# Tên các mảng node (mỗi mảng dài bằng tổng số node của cả forest)
+NODE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value')
+
+
+def average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    """c(n): độ dài path trung bình của BST không thành công (như sklearn)"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros(n_samples.shape)
+    mask_2 = n_samples == 2
+    not_mask = n_samples > 2
+    result[mask_2] = 1.0
+    result[not_mask] = (
+        2.0 * (np.log(n_samples[not_mask] - 1.0) + np.euler_gamma)
+        - 2.0 * (n_samples[not_mask] - 1.0) / n_samples[not_mask]
+    )
+    return result
+
+
+def _node_depths(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Số node trên path từ root tới mỗi node (root = 1)"""
+    depths = np.zeros(len(left), dtype=np.float64)
+    depths[0] = 1.0
+    # sklearn đánh số node theo depth-first: con luôn có index lớn hơn cha
+    for node in range(len(left)):
+        if left[node] != -1:
+            depths[left[node]] = depths[node] + 1.0
+            depths[right[node]] = depths[node] + 1.0
+    return depths
+
+
+def sibling_order(left: np.ndarray, right: np.ndarray, roots: np.ndarray) -> np.ndarray:
+    """
+    Thứ tự node mới (theo từng tầng): roots là 0..n_trees-1, 2 con của
+    mỗi node được xếp liền nhau (left, right)
+    
+    Sau khi đánh số lại, right = left + 1 nên bước đi xuống cây chỉ là
+    node = first_child[node] + go_right.
+    """
+    order = [roots]
+    frontier = roots
+    while len(frontier):
+        internal = frontier[left[frontier] != -1]
+        children = np.empty(2 * len(internal), dtype=np.intp)
+        children[0::2] = left[internal]
+        children[1::2] = right[internal]
+        order.append(children)
+        frontier = children
+    return np.concatenate(order)
+
+
+def _renumber(left: np.ndarray, right: np.ndarray, roots: np.ndarray):
+    """(order, first_child) theo sibling_order, leaf có first_child = chính nó"""
+    is_leaf = left == -1
+    order = sibling_order(left, right, roots)
+    new_id = np.empty(len(order), dtype=np.intp)
+    new_id[order] = np.arange(len(order), dtype=np.intp)
+    first_child = np.where(is_leaf, new_id, new_id[np.where(is_leaf, 0, left)])[order]
+    return order, first_child
+
+
+def pack_isolation_forest(forest) -> Dict:
+    """
+    Chuyển sklearn IsolationForest đã fit thành các mảng node phẳng
+    
+    Mỗi node lưu sẵn value = depth + c(n_node_samples) - 1 (phần cộng vào
+    path length khi row dừng ở leaf đó), nên lúc chấm điểm chỉ cần đi
+    xuống cây rồi cộng value.
+    
+    Returns:
+        {'arrays': {tên: ndarray}, 'params': {...}} dùng cho PackedIsolationForest
+    """
+    n_features = forest.n_features_in_
+    subsample_features = forest._max_features != n_features
+    
+    parts = {name: [] for name in NODE_ARRAYS + ('missing_left',)}
+    roots = []
+    offset = 0
+    max_depth = 0
+    for estimator, features in zip(forest.estimators_, forest.estimators_features_):
+        tree = estimator.tree_
+        left = tree.children_left.astype(np.int64)
+        right = tree.children_right.astype(np.int64)
+        is_leaf = left == -1
+        
+        feature = tree.feature.astype(np.int64)
+        if subsample_features:
+            # Cây được train trên X[:, features] -> đổi về index cột gốc
+            feature[~is_leaf] = np.asarray(features)[feature[~is_leaf]]
+        feature[is_leaf] = 0
+        
+        depths = _node_depths(left, right)
+        max_depth = max(max_depth, int(depths.max()))
+        
+        parts['feature'].append(feature)
+        parts['threshold'].append(np.where(is_leaf, np.inf, tree.threshold))
+        parts['left'].append(np.where(is_leaf, -1, left + offset))
+        parts['right'].append(np.where(is_leaf, -1, right + offset))
+        parts['value'].append(depths + average_path_length(tree.n_node_samples) - 1.0)
+        # sklearn >= 1.3: NaN đi theo hướng đã học lúc fit
+        parts['missing_left'].append(
+            getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count)).astype(bool) & ~is_leaf
+        )
+        roots.append(offset)
+        offset += tree.node_count
+    
+    arrays = {
+        'feature': np.concatenate(parts['feature']).astype(np.int32),
+        'threshold': np.concatenate(parts['threshold']).astype(np.float64),
+        'left': np.concatenate(parts['left']).astype(np.int32),
+        'right': np.concatenate(parts['right']).astype(np.int32),
+        'value': np.concatenate(parts['value']).astype(np.float64),
+        'missing_left': np.concatenate(parts['missing_left']).astype(np.uint8),
+        'roots': np.array(roots, dtype=np.int32)
+    }
+    params = {
+        'n_estimators': len(forest.estimators_),
+        'n_features': int(n_features),
+        'max_samples': int(forest.max_samples_),
+        'max_depth': max_depth,
+        'offset': float(forest.offset_)
+    }
+    return {'arrays': arrays, 'params': params}
+
+
+class PackedIsolationForest:
+    """
+    Isolation Forest chạy trên mảng node phẳng
+    
+    API giống sklearn: score_samples / decision_function / predict
+    (-1 = anomaly, 1 = normal), kết quả giống hệt IsolationForest gốc.
+    
+    Mọi row đi xuống mọi cây cùng lúc: node hiện tại là ma trận
+    (n_rows, n_trees), mỗi bước là vài phép take NumPy trên mảng phẳng.
+    Lúc load, node được đánh số lại theo sibling_order, nên mỗi bước chỉ
+    là node = first_child[node] + (x > threshold).
+    Leaf trỏ về chính nó nên chỉ cần lặp đúng max_depth - 1 bước, không
+    cần mask. Một row đơn lẻ tốn ~max_depth phép NumPy thay vì
+    n_trees lần gọi tree.apply của sklearn.
+    """
+    
+    # Số row mỗi chunk (ma trận (rows, trees) nằm gọn trong cache)
+    CHUNK_ROWS = 512
+    
+    def __init__(self, arrays: Dict[str, np.ndarray], params: Dict):
+        self.arrays = arrays
+        self.params = params
+        self.n_features_in_ = params['n_features']
+        self.offset_ = params['offset']
+        self.max_depth = params['max_depth']
+        self._denominator = (
+            params['n_estimators'] * average_path_length(np.array([params['max_samples']]))[0]
+        )
+        
+        left = np.asarray(arrays['left'], dtype=np.intp)
+        is_leaf = left == -1
+        # Leaf: first_child = chính nó, threshold = +inf -> đứng yên ở leaf
+        order, self._first_child = _renumber(
+            left, np.asarray(arrays['right'], dtype=np.intp), np.asarray(arrays['roots'], dtype=np.intp)
+        )
+        self._feature = np.asarray(arrays['feature'], dtype=np.intp)[order]
+        self._threshold = self._float32_thresholds(np.asarray(arrays['threshold'], dtype=np.float64))[order]
+        self._value = np.asarray(arrays['value'], dtype=np.float64)[order]
+        self._n_trees = len(arrays['roots'])
+        
+        # NaN đi phải trừ khi missing_left (leaf coi như missing_left để đứng yên)
+        missing_left = arrays.get('missing_left')
+        missing_left = (
+            np.asarray(missing_left, dtype=bool) if missing_left is not None
+            else np.zeros(len(left), dtype=bool)
+        )
+        self._missing_right = ~(missing_left | is_leaf)[order]
+    
+    @staticmethod
+    def _float32_thresholds(threshold: np.ndarray) -> np.ndarray:
+        """
+        Threshold float64 -> float32 làm tròn xuống: với x float32,
+        x <= t64 tương đương x <= t32 nên so sánh vẫn chính xác
+        """
+        t32 = threshold.astype(np.float32)
+        rounded_up = t32.astype(np.float64) > threshold
+        t32[rounded_up] = np.nextafter(t32[rounded_up], np.float32(-np.inf))
+        return t32
+    
+    def _path_lengths(self, X: np.ndarray) -> np.ndarray:
+        """Tổng path length qua tất cả cây cho từng row"""
+        n_rows = len(X)
+        flat_X = X.ravel()
+        # Offset của từng row trong flat_X, broadcast theo cột cây
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * X.shape[1])[:, None]
+        node = np.broadcast_to(np.arange(self._n_trees, dtype=np.intp), (n_rows, self._n_trees))
+        has_nan = np.isnan(flat_X).any()
+        for _ in range(self.max_depth - 1):
+            x = flat_X.take(row_offsets + self._feature.take(node))
+            go_right = x > self._threshold.take(node)
+            if has_nan:
+                go_right |= np.isnan(x) & self._missing_right.take(node)
+            node = self._first_child.take(node) + go_right
+        
+        # sklearn cộng dồn path length lần lượt từng cây; cumsum giữ đúng
+        # thứ tự cộng đó (np.sum cộng pairwise, lệch ở bit cuối)
+        return np.cumsum(self._value.take(node), axis=1)[:, -1]
+    
+    def score_samples(self, X) -> np.ndarray:
+        # sklearn ép X về float32 trước khi đi xuống cây
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f'X has {X.shape[-1]} features, but PackedIsolationForest '
+                f'is expecting {self.n_features_in_} features as input'
+            )
+        if len(X) <= self.CHUNK_ROWS:
+            depths = self._path_lengths(X)
+        else:
+            depths = np.concatenate([
+                self._path_lengths(X[start:start + self.CHUNK_ROWS])
+                for start in range(0, len(X), self.CHUNK_ROWS)
+            ])
+        if self._denominator == 0:
+            return -np.full(len(X), 0.5)
+        return -(2 ** (-depths / self._denominator))
+    
+    def decision_function(self, X) -> np.ndarray:
+        return self.score_samples(X) - self.offset_
+    
+    def predict(self, X) -> np.ndarray:
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+# ============================================================
+# XGBoost
+# ============================================================
+
+# Objectives mà output = margin (không có link function)
+XGB_IDENTITY_OBJECTIVES = ('reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror')
+
+
+def pack_xgboost(model, iteration_range=None) -> Dict:
+    """
+    Chuyển XGBoost model (XGBRegressor hoặc Booster) thành các mảng node phẳng
+    
+    Args:
+        iteration_range: (begin, end) như XGBRegressor.predict; mặc định
+            tới best_iteration nếu model được train với early stopping
+    
+    Raises:
+        ValueError: model không pack được (objective có link function,
+            dart, multi-output, categorical split)
+    """
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    if iteration_range is None:
+        best_iteration = getattr(model, 'best_iteration', None)
+        iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+    
+    learner = json.loads(bytes(booster.save_raw(raw_format='json')))['learner']
+    objective = learner['objective']['name']
+    if objective not in XGB_IDENTITY_OBJECTIVES:
+        raise ValueError(f'Unsupported XGBoost objective {objective}')
+    if learner['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Unsupported XGBoost booster {learner['gradient_booster']['name']}")
+    model_param = learner['learner_model_param']
+    if int(model_param.get('num_target', 1)) != 1 or int(model_param.get('num_class', 0)) > 1:
+        raise ValueError('Multi-output XGBoost models are not supported')
+    
+    gbtree = learner['gradient_booster']['model']
+    trees = gbtree['trees']
+    begin, end = iteration_range
+    if end > 0:
+        indptr = gbtree['iteration_indptr']
+        trees = trees[indptr[begin]:indptr[end]]
+    
+    parts = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'value', 'default_left')}
+    roots = []
+    offset = 0
+    max_depth = 0
+    for tree in trees:
+        if any(tree['split_type']):
+            raise ValueError('Categorical splits are not supported')
+        left = np.array(tree['left_children'], dtype=np.int64)
+        right = np.array(tree['right_children'], dtype=np.int64)
+        is_leaf = left == -1
+        conditions = np.array(tree['split_conditions'], dtype=np.float32)
+        
+        max_depth = max(max_depth, int(_node_depths(left, right).max()))
+        
+        parts['feature'].append(np.where(is_leaf, 0, tree['split_indices']))
+        # Leaf lưu leaf value trong split_conditions
+        parts['threshold'].append(np.where(is_leaf, np.float32(np.nan), conditions))
+        parts['left'].append(np.where(is_leaf, -1, left + offset))
+        parts['right'].append(np.where(is_leaf, -1, right + offset))
+        parts['value'].append(np.where(is_leaf, conditions, np.float32(0)))
+        parts['default_left'].append(np.array(tree['default_left'], dtype=bool) & ~is_leaf)
+        roots.append(offset)
+        offset += len(left)
+    
+    if not roots:
+        raise ValueError('XGBoost model has no trees')
+    
+    arrays = {
+        'feature': np.concatenate(parts['feature']).astype(np.int32),
+        'threshold': np.concatenate(parts['threshold']).astype(np.float32),
+        'left': np.concatenate(parts['left']).astype(np.int32),
+        'right': np.concatenate(parts['right']).astype(np.int32),
+        'value': np.concatenate(parts['value']).astype(np.float32),
+        'default_left': np.concatenate(parts['default_left']).astype(np.uint8),
+        'roots': np.array(roots, dtype=np.int32)
+    }
+    params = {
+        'objective': objective,
+        'n_features': int(model_param['num_feature']),
+        'base_score': float(str(model_param['base_score']).strip('[]')),
+        'max_depth': max_depth
+    }
+    return {'arrays': arrays, 'params': params}
+
+
+class PackedXGBRegressor:
+    """
+    XGBoost regressor chạy trên mảng node phẳng (cùng cách đi xuống cây
+    như PackedIsolationForest)
+    
+    Giống hệt XGBRegressor.predict: X float32, đi trái khi x < split_condition,
+    NaN theo default_left, output float32 = base_score cộng dồn leaf value
+    lần lượt từng cây.
+    """
+    
+    # Số row mỗi chunk (ma trận (rows, trees) nằm gọn trong cache)
+    CHUNK_ROWS = 512
+    
+    def __init__(self, arrays: Dict[str, np.ndarray], params: Dict):
+        self.arrays = arrays
+        self.params = params
+        self.n_features_in_ = params['n_features']
+        self.base_score = np.float32(params['base_score'])
+        self.max_depth = params['max_depth']
+        
+        left = np.asarray(arrays['left'], dtype=np.intp)
+        is_leaf = left == -1
+        # Leaf: first_child = chính nó, threshold = NaN (x >= NaN luôn False)
+        order, self._first_child = _renumber(
+            left, np.asarray(arrays['right'], dtype=np.intp), np.asarray(arrays['roots'], dtype=np.intp)
+        )
+        self._feature = np.asarray(arrays['feature'], dtype=np.intp)[order]
+        self._threshold = np.asarray(arrays['threshold'], dtype=np.float32)[order]
+        self._value = np.asarray(arrays['value'], dtype=np.float32)[order]
+        self._missing_right = ~(np.asarray(arrays['default_left'], dtype=bool) | is_leaf)[order]
+        self._n_trees = len(arrays['roots'])
+    
+    def _predict_chunk(self, X: np.ndarray) -> np.ndarray:
+        n_rows = len(X)
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * X.shape[1])[:, None]
+        node = np.broadcast_to(np.arange(self._n_trees, dtype=np.intp), (n_rows, self._n_trees))
+        has_nan = np.isnan(flat_X).any()
+        for _ in range(self.max_depth - 1):
+            x = flat_X.take(row_offsets + self._feature.take(node))
+            go_right = x >= self._threshold.take(node)
+            if has_nan:
+                go_right |= np.isnan(x) & self._missing_right.take(node)
+            node = self._first_child.take(node) + go_right
+        
+        # XGBoost cộng float32 lần lượt từng cây, bắt đầu từ base_score
+        leaves = np.empty((n_rows, self._n_trees + 1), dtype=np.float32)
+        leaves[:, 0] = self.base_score
+        leaves[:, 1:] = self._value.take(node)
+        return np.cumsum(leaves, axis=1, dtype=np.float32)[:, -1]
+    
+    def predict(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f'X has {X.shape[-1]} features, but PackedXGBRegressor '
+                f'is expecting {self.n_features_in_} features as input'
+            )
+        if len(X) <= self.CHUNK_ROWS:
+            return self._predict_chunk(X)
+        return np.concatenate([
+            self._predict_chunk(X[start:start + self.CHUNK_ROWS])
+            for start in range(0, len(X), self.CHUNK_ROWS)
+        ])
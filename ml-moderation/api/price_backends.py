@@ -0,0 +1,143 @@
+"""
+Inference backends cho price model (XGBoost)
+- xgboost: XGBRegressor.predict (API Python chung, mặc định)
+- inplace: Booster.inplace_predict trên bản copy của booster, nthread cố định
+- numpy: PackedXGBRegressor (cây được pack thành mảng NumPy, không gọi xgboost)
+
+Batch lớn được chia chunk và chấm điểm song song trong thread pool
+(xgboost và các phép take của NumPy nhả GIL).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from packed_trees import PackedXGBRegressor, pack_xgboost
+
+PRICE_BACKENDS = ('xgboost', 'inplace', 'numpy')
+
+
+class PriceBackend:
+    """
+    Bọc price model, API giống model gốc: predict(X) -> ndarray
+    
+    threads > 1: batch có từ parallel_min_rows rows trở lên được chia
+    thành threads chunk và chạy song song. Thread pool được tạo lazy trong
+    từng process (an toàn khi gunicorn fork workers).
+    """
+    
+    name = 'base'
+    
+    def __init__(self, model, threads: int = 1, parallel_min_rows: int = 1024):
+        self.model = model
+        self.threads = max(1, threads)
+        self.parallel_min_rows = parallel_min_rows
+        self._pid = None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+    
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.threads, thread_name_prefix=f'price-{self.name}'
+                )
+            return self._pool
+    
+    def predict(self, X) -> np.ndarray:
+        if self.threads == 1 or len(X) < self.parallel_min_rows:
+            return self._predict(X)
+        chunks = np.array_split(np.asarray(X), self.threads)
+        return np.concatenate(list(self._get_pool().map(self._predict, chunks)))
+    
+    def __getattr__(self, name):
+        # Các thuộc tính khác (n_features_in_, get_booster...) lấy từ model gốc
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+class XGBoostBackend(PriceBackend):
+    name = 'xgboost'
+    
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        return self.model.predict(X)
+
+
+class InplaceBackend(PriceBackend):
+    """
+    Booster.inplace_predict, bỏ qua phần validate/convert của sklearn API
+    
+    Booster được copy để set nthread mà không đụng vào model gốc. Song song
+    chỉ qua thread pool của backend, mỗi call xgboost chạy nthread threads.
+    """
+    
+    name = 'inplace'
+    
+    def __init__(self, model, threads: int = 1, parallel_min_rows: int = 1024, nthread: int = 1):
+        super().__init__(model, threads=threads, parallel_min_rows=parallel_min_rows)
+        self.booster = model.get_booster().copy()
+        self.booster.set_param({'nthread': nthread})
+        best_iteration = getattr(model, 'best_iteration', None)
+        self.iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+    
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        return self.booster.inplace_predict(
+            X, iteration_range=self.iteration_range, validate_features=False
+        )
+
+
+class NumpyBackend(PriceBackend):
+    """Các cây XGBoost dạng mảng NumPy (PackedXGBRegressor)"""
+    
+    name = 'numpy'
+    
+    def __init__(self, model, threads: int = 1, parallel_min_rows: int = 1024):
+        super().__init__(model, threads=threads, parallel_min_rows=parallel_min_rows)
+        self.packed = PackedXGBRegressor(**pack_xgboost(model))
+    
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        return self.packed.predict(X)
+
+
+_BACKENDS = {
+    'xgboost': XGBoostBackend,
+    'inplace': InplaceBackend,
+    'numpy': NumpyBackend
+}
+
+
+def make_price_backend(
+    model,
+    backend: str = 'xgboost',
+    threads: int = 1,
+    parallel_min_rows: int = 1024
+) -> Optional[PriceBackend]:
+    """
+    Bọc price model bằng backend được chọn
+    
+    Model không phải XGBoost (hoặc không pack được) thì dùng predict của
+    chính model và in cảnh báo.
+    
+    Raises:
+        ValueError: tên backend không hợp lệ
+    """
+    if backend not in _BACKENDS:
+        raise ValueError(f'Unknown price backend {backend!r}, expected one of {PRICE_BACKENDS}')
+    if model is None:
+        return None
+    if backend != 'xgboost' and not hasattr(model, 'get_booster'):
+        print(f'⚠️ Price backend {backend!r} needs an XGBoost model, using model.predict')
+        backend = 'xgboost'
+    try:
+        return _BACKENDS[backend](model, threads=threads, parallel_min_rows=parallel_min_rows)
+    except ValueError as e:
+        print(f'⚠️ Price backend {backend!r} unavailable ({e}), using model.predict')
+        return XGBoostBackend(model, threads=threads, parallel_min_rows=parallel_min_rows)
@@ -0,0 +1,250 @@
+"""
+Stack-sampling profiler cho request moderation (opt-in)
+
+Request được profile khi có header `X-Profile: 1` hoặc được chọn ngẫu
+nhiên theo sample_rate (ML_PROFILE_SAMPLE_RATE, mặc định 0 = chỉ theo
+header). enabled=False (API mặc định tắt, bật bằng ML_PROFILE_ENABLED=1)
+thì không request nào được profile, kể cả khi có header. Trong lúc
+request chạy, 1 sampler thread định kỳ đọc stack của request thread
+(sys._current_frames) và của các thread làm việc thay request
+(micro-batcher chạy phần ML), rồi cộng dồn theo stack.
+
+Kết quả ở dạng "folded stacks" (1 dòng / stack: `frame;frame;... count`),
+dùng thẳng được với flamegraph.pl, speedscope hoặc inferno.
+
+Giới hạn memory: tối đa max_stacks stack khác nhau (stack mới sau đó cộng
+vào 1 dòng `[other]`), stack dài hơn max_depth bị cắt. Tối đa max_active
+request được profile cùng lúc, request khác chạy bình thường.
+
+Sampler cần GIL để đọc stack: mỗi lần lấy mẫu, request thread phải nhả
+GIL. interval_ms mặc định 5ms (bằng sys.getswitchinterval()); lấy mẫu dày
+hơn làm tăng overhead (bench/bench_profiler.py) mà độ phân giải thực vẫn
+bị giới hạn bởi switch interval khi request chạy code Python liên tục.
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+OTHER_STACKS = '[other]'
+TRUNCATED = '[truncated]'
+_THREADING_FILE = threading.__file__
+
+
+class _Profiled:
+    """Context manager: đăng ký thread hiện tại với sampler trong lúc chạy"""
+    
+    def __init__(self, profiler: 'StackProfiler', label: str):
+        self.profiler = profiler
+        self.label = label
+    
+    def __enter__(self) -> bool:
+        # Stack chỉ lấy từ frame gọi profile() trở vào trong
+        return self.profiler._register(threading.get_ident(), self.label, sys._getframe(1))
+    
+    def __exit__(self, *exc):
+        self.profiler._unregister(threading.get_ident())
+        return False
+
+
+class StackProfiler:
+    """
+    Profiler lấy mẫu stack của các request được chọn
+    
+    Sampler thread được start lazy trong từng process (gunicorn fork sau
+    khi import app) và chỉ chạy khi có request đang được profile.
+    
+    Args:
+        enabled: False thì profile() luôn là no-op (bỏ qua header và sample_rate)
+        sample_rate: tỉ lệ request được profile ngẫu nhiên (0..1)
+        interval_ms: khoảng cách giữa 2 lần lấy mẫu
+        max_active: số request tối đa được profile cùng lúc
+        max_stacks: số stack khác nhau tối đa được giữ
+        max_depth: số frame tối đa của 1 stack
+        follow_threads: tên các thread được lấy mẫu kèm khi có request đang
+            profile (chỉ khi đang chạy, không tính lúc chờ việc)
+    """
+    
+    def __init__(
+        self,
+        enabled: bool = True,
+        sample_rate: float = 0.0,
+        interval_ms: float = 5.0,
+        max_active: int = 4,
+        max_stacks: int = 2000,
+        max_depth: int = 64,
+        follow_threads: tuple = ('micro-batcher',)
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.max_active = max_active
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.follow_threads = follow_threads
+        self._reset()
+    
+    def _reset(self):
+        """State riêng của từng process (gọi lại sau fork)"""
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._thread = None
+        # thread id -> (label, frame gọi profile())
+        self._active: Dict[int, tuple] = {}
+        self._stacks = Counter()
+        self._frame_names: Dict[object, str] = {}
+        
+        # Stats
+        self.profiled = 0
+        self.skipped_busy = 0
+        self.samples = 0
+        self.dropped = 0
+        self.started_at = time.time()
+    
+    def profile(self, header: Optional[str] = None, label: str = 'request'):
+        """
+        Context manager cho 1 request: profile nếu header bật hoặc được
+        sample, không thì không làm gì (nullcontext)
+        
+        `with profiler.profile(...) as profiled`: profiled là True nếu
+        request thực sự được profile (không bị bỏ vì đủ max_active)
+        """
+        if not self.enabled:
+            return nullcontext()
+        if header in ('1', 'true') or (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return _Profiled(self, label)
+        return nullcontext()
+    
+    def _register(self, ident: int, label: str, frame) -> bool:
+        if self._pid != os.getpid():
+            self._reset()
+        with self._cond:
+            if len(self._active) >= self.max_active:
+                self.skipped_busy += 1
+                return False
+            self._active[ident] = (label, frame)
+            self.profiled += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name='stack-profiler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return True
+    
+    def _unregister(self, ident: int):
+        with self._cond:
+            self._active.pop(ident, None)
+    
+    def _sample_loop(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            time.sleep(self.interval)
+            self._sample()
+    
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._cond:
+            active = list(self._active.items())
+            if not active:
+                return
+            
+            for ident, (label, root) in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._add(label, self._walk(frame, root))
+            
+            if self.follow_threads:
+                for thread in threading.enumerate():
+                    if thread.name in self.follow_threads:
+                        frame = frames.get(thread.ident)
+                        # Đang chờ việc (leaf trong threading.py): không tính
+                        if frame is not None and frame.f_code.co_filename != _THREADING_FILE:
+                            self._add(thread.name, self._walk(frame, None))
+    
+    def _walk(self, frame, root) -> List[str]:
+        """Tên các frame từ leaf ra tới root (hoặc hết stack), bỏ frame của threading.py"""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename != _THREADING_FILE:
+                names.append(self._frame_name(code))
+            if frame is root:
+                break
+            frame = frame.f_back
+        return names
+    
+    def _frame_name(self, code) -> str:
+        name = self._frame_names.get(code)
+        if name is None:
+            if len(self._frame_names) >= self.max_stacks * 4:
+                self._frame_names.clear()
+            name = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+            self._frame_names[code] = name
+        return name
+    
+    def _add(self, label: str, names: List[str]):
+        names.reverse()
+        if len(names) > self.max_depth:
+            names = names[:self.max_depth] + [TRUNCATED]
+        stack = ';'.join([label] + names)
+        self.samples += 1
+        if stack in self._stacks or len(self._stacks) < self.max_stacks:
+            self._stacks[stack] += 1
+        else:
+            self._stacks[f'{label};{OTHER_STACKS}'] += 1
+            self.dropped += 1
+    
+    def folded(self) -> str:
+        """Các stack dạng folded (`frame;frame;... count`), nhiều sample trước"""
+        with self._cond:
+            items = self._stacks.most_common()
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+    
+    def top_functions(self, limit: int = 20) -> List[Dict]:
+        """Các frame có nhiều sample nhất ở leaf (self) và trong stack (total)"""
+        with self._cond:
+            items = list(self._stacks.items())
+        own, total = Counter(), Counter()
+        for stack, count in items:
+            frames = stack.split(';')[1:]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [
+            {'frame': frame, 'self_samples': own[frame], 'total_samples': total[frame]}
+            for frame, _ in total.most_common(limit)
+        ]
+    
+    def clear(self):
+        with self._cond:
+            self._stacks.clear()
+            self.samples = 0
+            self.dropped = 0
+            self.profiled = 0
+            self.skipped_busy = 0
+            self.started_at = time.time()
+    
+    def stats(self) -> Dict:
+        """Counters cho /api/health và /api/debug/profile"""
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'interval_ms': self.interval * 1000,
+                'profiled_requests': self.profiled,
+                'skipped_busy': self.skipped_busy,
+                'active': len(self._active),
+                'samples': self.samples,
+                'stacks': len(self._stacks),
+                'max_stacks': self.max_stacks,
+                'dropped_samples': self.dropped,
+                'since': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds')
+            }
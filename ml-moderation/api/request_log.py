@@ -0,0 +1,203 @@
+"""
+Request log dạng JSON (1 dòng / record), ghi bất đồng bộ
+
+Request thread chỉ tạo LogRecord và đưa vào queue (QueueHandler); format
+JSON, timestamp và ghi ra stdout chạy trong listener thread riêng, nên
+request không phải chờ stdout. Queue có giới hạn: đầy thì bỏ record (đếm ở
+stats()) thay vì chặn request.
+
+Sampling: rejected và lỗi luôn được ghi; request thành công chỉ ghi với
+xác suất sample_rate (ML_LOG_SAMPLE_RATE).
+
+Ví dụ 1 record:
+    {"ts": "2025-01-01T10:00:00.123", "level": "INFO", "event": "moderate",
+     "request_id": "...", "decision": "rejected", "score": 0.41,
+     "total_ms": 3.2, "stages_ms": {"text": 0.04, ..., "ml": 2.6}, ...}
+"""
+
+import os
+import sys
+import json
+import queue
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from metrics import RequestTrace
+
+LOGGER_NAME = 'moderation.requests'
+
+
+class JsonFormatter(logging.Formatter):
+    """LogRecord -> 1 dòng JSON (event = message, thêm các field trong record.fields)"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'event': record.getMessage(),
+            **getattr(record, 'fields', {})
+        }
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler bỏ record khi queue đầy thay vì chặn request thread"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestLogger:
+    """
+    Logger cho các request moderation
+    
+    Listener thread được start lazy trong từng process (gunicorn fork sau
+    khi import app), giống JobQueue / MicroBatcher.
+    
+    Args:
+        sample_rate: tỉ lệ ghi request thành công (0..1), rejected / lỗi luôn ghi
+        queue_size: số record tối đa chờ ghi
+        stream: nơi ghi (mặc định sys.stdout)
+    """
+    
+    def __init__(self, sample_rate: float = 0.1, queue_size: int = 10000, stream=None):
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.stream = stream
+        self._reset()
+    
+    def _reset(self):
+        """State riêng của từng process (gọi lại sau fork)"""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._handler = _DroppingQueueHandler(self._queue)
+        
+        # Stats
+        self.logged = 0
+        self.sampled_out = 0
+    
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is None:
+                output = logging.StreamHandler(self.stream or sys.stdout)
+                output.setFormatter(JsonFormatter())
+                self._listener = logging.handlers.QueueListener(self._queue, output)
+                self._listener.start()
+    
+    def _sampled(self, always: bool) -> bool:
+        if always or self.sample_rate >= 1 or random.random() < self.sample_rate:
+            return True
+        self.sampled_out += 1
+        return False
+    
+    def _emit(self, level: int, event: str, fields: Dict):
+        self._ensure_started()
+        self.logged += 1
+        # Tạo record trực tiếp: Logger.log() tìm caller qua stack frames và
+        # lấy lock của handler, tốn hơn cả phần format JSON
+        record = logging.LogRecord(LOGGER_NAME, level, '', 0, event, None, None)
+        record.fields = fields
+        self._handler.enqueue(record)
+    
+    def log_moderation(
+        self,
+        request_id: str,
+        property_data: Dict,
+        result: Dict,
+        trace: Optional[RequestTrace],
+        total_ms: float
+    ):
+        """1 request /api/moderate (ghi nếu rejected hoặc được sample)"""
+        decision = result.get('decision')
+        if not self._sampled(decision == 'rejected'):
+            return
+        title = property_data.get('title')
+        self._emit(logging.INFO, 'moderate', {
+            'request_id': request_id,
+            'property_id': property_data.get('_id'),
+            'title': title[:50] if isinstance(title, str) else None,
+            'decision': decision,
+            'score': result.get('overall_score'),
+            'model_version': result.get('model_version'),
+            'cache_hit': bool(trace and trace.cache_hits),
+            'total_ms': round(total_ms, 3),
+            'stages_ms': _rounded(trace)
+        })
+    
+    def log_batch(
+        self,
+        request_id: str,
+        results: List[Dict],
+        trace: Optional[RequestTrace],
+        total_ms: float
+    ):
+        """1 request /api/moderate/batch (ghi nếu có rejected / lỗi hoặc được sample)"""
+        decisions = {}
+        for result in results:
+            decision = result.get('decision', 'error') if result.get('success', True) else 'error'
+            decisions[decision] = decisions.get(decision, 0) + 1
+        always = bool(decisions.get('rejected') or decisions.get('error'))
+        if not self._sampled(always):
+            return
+        self._emit(logging.WARNING if decisions.get('error') else logging.INFO, 'moderate_batch', {
+            'request_id': request_id,
+            'count': len(results),
+            'decisions': decisions,
+            'cache_hits': trace.cache_hits if trace else 0,
+            'total_ms': round(total_ms, 3),
+            'stages_ms': _rounded(trace)
+        })
+    
+    def log_error(self, request_id: str, endpoint: str, error: Exception):
+        """Lỗi xử lý request (luôn ghi)"""
+        self._emit(logging.ERROR, 'error', {
+            'request_id': request_id,
+            'endpoint': endpoint,
+            'error_type': type(error).__name__,
+            'error': str(error)
+        })
+    
+    def stats(self) -> Dict:
+        """Counters cho /api/health"""
+        return {
+            'sample_rate': self.sample_rate,
+            'logged': self.logged,
+            'sampled_out': self.sampled_out,
+            'dropped': self._handler.dropped,
+            'pending': self._queue.qsize()
+        }
+    
+    def shutdown(self):
+        """Ghi nốt các record đang chờ rồi dừng listener thread"""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                try:
+                    self._listener.stop()
+                except queue.Full:
+                    pass  # queue đầy, không đưa được sentinel: bỏ các record còn lại
+                self._listener = None
+
+
+def _rounded(trace: Optional[RequestTrace]) -> Dict[str, float]:
+    if trace is None:
+        return {}
+    return {stage: round(ms, 3) for stage, ms in trace.stages_ms.items()}
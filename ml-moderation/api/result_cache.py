@@ -0,0 +1,104 @@
+"""
+LRU + TTL cache cho kết quả moderation
+Dùng chung cho cache toàn bộ response và cache từng stage
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class ResultCache:
+    """
+    Cache LRU có TTL, thread-safe
+    
+    - Vượt max_size: bỏ entry ít dùng nhất (eviction)
+    - Entry quá ttl giây: coi như miss và bị xoá (expiration)
+    - clear(): xoá toàn bộ và tăng generation, để kết quả đang tính dở
+      (bắt đầu trước khi clear) không được ghi lại vào cache
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Lấy value theo key, trả về default nếu miss hoặc hết hạn"""
+        if not self.enabled:
+            return default
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """
+        Lưu value vào cache
+        
+        Args:
+            generation: generation lúc bắt đầu tính value; nếu cache đã bị
+                clear từ lúc đó thì bỏ qua (value có thể đã lỗi thời)
+        """
+        if not self.enabled:
+            return
+        
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Invalidate toàn bộ cache"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+    
+    def stats(self) -> Dict:
+        """Counters cho /api/health"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -4,7 +4,115 @@ Kiểm tra các quy tắc cứng: text, completeness, images, etc.
 """
 
 import re
-from typing import Dict, List, Tuple
+import json
+import hashlib
+from typing import Callable, Dict, List, Optional, Tuple
+from result_cache import ResultCache
+from time import perf_counter
+from metrics import RULE_STAGES
+
+
+# Memo kết quả từng stage theo hash input của riêng stage đó: sửa giá thì
+# text/images không phải validate lại. Chỉ LRU (kết quả không hết hạn).
+STAGE_MEMO_SIZE = 4096
+STAGE_MEMOS = {
+    'text': ResultCache(max_size=STAGE_MEMO_SIZE, ttl=None),
+    'image': ResultCache(max_size=STAGE_MEMO_SIZE, ttl=None)
+}
+
+
+def _text_key(title: str, description: str) -> str:
+    """Key cho text stage (digest để memory không phụ thuộc độ dài mô tả)"""
+    canonical = json.dumps([title, description], ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _image_key(images) -> Optional[str]:
+    """Key cho image stage; None (không memo) nếu list có phần tử không phải URL string"""
+    if not isinstance(images, list) or not all(isinstance(img, str) for img in images):
+        return None
+    return hashlib.blake2b('\n'.join(images).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _memoized(stage: str, key: Optional[str], compute: Callable):
+    """Lấy kết quả stage từ memo, hoặc tính rồi lưu lại"""
+    if key is None:
+        return compute()
+    
+    memo = STAGE_MEMOS[stage]
+    generation = memo.generation
+    result = memo.get(key)
+    if result is None:
+        result = compute()
+        memo.put(key, result, generation=generation)
+    return result
+
+
+def stage_memo_stats() -> Dict:
+    """Hit/miss của từng stage memo"""
+    return {stage: memo.stats() for stage, memo in STAGE_MEMOS.items()}
+
+
+class KeywordMatcher:
+    """
+    Tìm tất cả keywords xuất hiện trong text (substring match)
+    
+    Với list dài, keywords được gộp thành 1 regex dạng trie đã compile sẵn
+    nên chỉ quét text một lượt, chi phí không tăng theo số keywords.
+    Với list ngắn, quét `in` từng keyword vẫn nhanh hơn regex nên giữ cách đó.
+    """
+    
+    # Từ khoảng 40 keywords trở lên, regex trie nhanh hơn quét `in`
+    SCAN_THRESHOLD = 40
+    
+    def __init__(self, keywords: List[str]):
+        self.keywords = tuple(keywords)
+        unique = set(self.keywords)
+        
+        self._pattern = None
+        self._implied = {}
+        if len(unique) >= self.SCAN_THRESHOLD and '' not in unique:
+            self._pattern = re.compile(self._trie_pattern(unique))
+            # Keyword dài chứa keyword ngắn: match keyword dài = match cả keyword ngắn
+            self._implied = {kw: frozenset(other for other in unique if other in kw) for kw in unique}
+    
+    @staticmethod
+    def _trie_pattern(words) -> str:
+        """Gộp keywords thành regex theo prefix trie: (?:gọi ngay|giá sốc) -> g(?:ọi ngay|iá sốc)"""
+        trie = {}
+        for word in words:
+            node = trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[''] = {}
+        
+        def build(node):
+            is_end = '' in node
+            branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != '']
+            if not branches:
+                return ''
+            if len(branches) == 1 and not is_end:
+                return branches[0]
+            group = '(?:' + '|'.join(branches) + ')'
+            return group + '?' if is_end else group
+        
+        return build(trie)
+    
+    def find(self, text: str) -> List[str]:
+        """Trả về các keywords có trong text, giữ thứ tự của list keywords"""
+        if self._pattern is None:
+            return [kw for kw in self.keywords if kw in text]
+        
+        found = set()
+        match_at = self._pattern.match
+        for match in self._pattern.finditer(text):
+            found |= self._implied[match.group()]
+            # finditer không trả về match chồng lấn: kiểm tra các vị trí bên trong match
+            for pos in range(match.start() + 1, match.end()):
+                inner = match_at(text, pos)
+                if inner:
+                    found |= self._implied[inner.group()]
+        return [kw for kw in self.keywords if kw in found]
 
 
 class TextValidator:
@@ -21,8 +129,36 @@ class TextValidator:
         'ma túy', 'đồ cấm'
     ]
     
-    @staticmethod
-    def validate(title: str, description: str) -> Tuple[float, List[str]]:
+    # Compile sẵn khi load class
+    PHONE_PATTERN = re.compile(r'\b0\d{9,10}\b')
+    REPEATED_CHAR_PATTERN = re.compile(r'(.)\1{4,}')  # 5+ repeated chars
+    
+    _spam_matcher = KeywordMatcher(SPAM_KEYWORDS)
+    _forbidden_matcher = KeywordMatcher(FORBIDDEN_WORDS)
+    
+    @classmethod
+    def reload_keywords(cls, spam_keywords: List[str] = None, forbidden_words: List[str] = None):
+        """
+        Thay list keywords lúc đang chạy (không cần restart)
+        
+        Matcher mới được build xong rồi mới gán vào class, nên request đang
+        chạy vẫn dùng trọn bộ matcher cũ hoặc trọn bộ matcher mới.
+        """
+        if spam_keywords is not None:
+            spam_keywords = [kw.strip().lower() for kw in spam_keywords if kw and kw.strip()]
+            spam_matcher = KeywordMatcher(spam_keywords)
+            cls.SPAM_KEYWORDS, cls._spam_matcher = spam_keywords, spam_matcher
+        
+        if forbidden_words is not None:
+            forbidden_words = [kw.strip().lower() for kw in forbidden_words if kw and kw.strip()]
+            forbidden_matcher = KeywordMatcher(forbidden_words)
+            cls.FORBIDDEN_WORDS, cls._forbidden_matcher = forbidden_words, forbidden_matcher
+        
+        # Kết quả text cũ được tính với keywords cũ
+        STAGE_MEMOS['text'].clear()
+    
+    @classmethod
+    def validate(cls, title: str, description: str) -> Tuple[float, List[str]]:
         """
         Validate text quality
         Returns: (score, reasons)
@@ -48,7 +184,7 @@ class TextValidator:
         
         # 3. Check for spam keywords
         text_lower = (title + ' ' + description).lower()
-        spam_count = sum(1 for keyword in TextValidator.SPAM_KEYWORDS if keyword in text_lower)
+        spam_count = len(cls._spam_matcher.find(text_lower))
         if spam_count > 3:
             score -= 0.3
             reasons.append(f'❌ Phát hiện {spam_count} từ khóa spam')
@@ -57,7 +193,7 @@ class TextValidator:
             reasons.append(f'⚠️ Phát hiện {spam_count} từ khóa nghi ngờ spam')
         
         # 4. Check for forbidden words
-        forbidden_found = [word for word in TextValidator.FORBIDDEN_WORDS if word in text_lower]
+        forbidden_found = cls._forbidden_matcher.find(text_lower)
         if forbidden_found:
             score -= 0.5
             reasons.append(f'❌ Chứa từ cấm: {", ".join(forbidden_found)}')
@@ -69,12 +205,12 @@ class TextValidator:
             reasons.append('⚠️ Quá nhiều chữ IN HOA trong tiêu đề')
         
         # 6. Check for phone numbers in title (not recommended)
-        if re.search(r'\b0\d{9,10}\b', title):
+        if cls.PHONE_PATTERN.search(title):
             score -= 0.1
             reasons.append('⚠️ Không nên để số điện thoại trong tiêu đề')
         
         # 7. Check for repetitive characters
-        if re.search(r'(.)\1{4,}', text_lower):  # 5+ repeated chars
+        if cls.REPEATED_CHAR_PATTERN.search(text_lower):
             score -= 0.15
             reasons.append('⚠️ Phát hiện ký tự lặp lại nhiều lần')
         
@@ -276,11 +412,23 @@ def validate_property_rules(property_data: Dict) -> Dict:
     property_type = property_data.get('propertyType', '')
     images = property_data.get('images', [])
     
-    # Run all validators
-    text_score, text_reasons = TextValidator.validate(title, description)
+    # Run all validators (text và images được memo theo input của stage),
+    # latency từng stage vào metrics.STAGE_SECONDS
+    t0 = perf_counter()
+    text_score, text_reasons = _memoized(
+        'text', _text_key(title, description),
+        lambda: TextValidator.validate(title, description)
+    )
+    t1 = perf_counter()
     completeness_score, completeness_reasons = CompletenessValidator.validate(property_data)
-    image_score, image_reasons = ImageValidator.validate(images)
+    t2 = perf_counter()
+    image_score, image_reasons = _memoized(
+        'image', _image_key(images),
+        lambda: ImageValidator.validate(images)
+    )
+    t3 = perf_counter()
     price_score, price_reasons = PriceRangeValidator.validate(price, property_type, area)
+    RULE_STAGES.record((t0, t1, t2, t3, perf_counter()))
     
     # Tính overall score (weighted average)
     weights = {
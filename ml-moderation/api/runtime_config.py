@@ -0,0 +1,99 @@
+"""
+Config đổi lúc chạy (POST /api/config) dùng chung giữa các worker process
+
+Thresholds và keyword lists được ghi vào 1 file JSON (MODERATION_CONFIG_PATH,
+mặc định models/runtime_config.json). Mỗi worker kiểm tra file trước mỗi
+request (1 lần os.stat) và áp dụng khi file đổi, nên mọi worker dùng cùng
+config và cùng xoá result cache. Worker mới (restart, max_requests) đọc
+file lúc khởi động nên không quay về config mặc định.
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ chạy 1 process (python app.py)
+    fcntl = None
+
+from moderation_service import ModerationService
+
+CONFIG_KEYS = ('auto_approve_threshold', 'reject_threshold', 'spam_keywords', 'forbidden_words')
+
+
+class RuntimeConfig:
+    """
+    File config chung + áp dụng vào ModerationService của process hiện tại
+    
+    - sync(): áp dụng file nếu đổi từ lần áp dụng trước (gọi mỗi request)
+    - update(changes): ghi thay đổi vào file (giữ các key khác) rồi áp dụng
+    """
+    
+    def __init__(self, service: ModerationService, path: str):
+        self.service = service
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+    
+    def _stat_signature(self) -> Optional[tuple]:
+        # os.replace tạo inode mới: inode + mtime đổi sau mỗi lần ghi
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+    
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def _apply(self, config: Dict):
+        thresholds = {
+            'auto_approve': config.get('auto_approve_threshold'),
+            'reject': config.get('reject_threshold')
+        }
+        if any(value is not None for value in thresholds.values()):
+            self.service.update_thresholds(**thresholds)
+        keywords = {key: config[key] for key in ('spam_keywords', 'forbidden_words') if key in config}
+        if keywords:
+            self.service.update_keywords(**keywords)
+    
+    def sync(self):
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            signature = self._stat_signature()
+            if signature == self._signature:
+                return
+            try:
+                self._apply(self._read())
+            except (OSError, ValueError) as e:
+                # File lỗi: giữ config hiện tại, không thử lại tới khi file đổi
+                print(f'⚠️ Runtime config {self.path} ignored: {e}')
+            self._signature = signature
+    
+    def update(self, changes: Dict) -> Dict:
+        """Ghi changes (các key trong CONFIG_KEYS) vào file và áp dụng, trả về config mới"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._lock, open(self.path + '.lock', 'a') as lock_file:
+            # Khoá giữa các process: 2 worker cùng ghi không làm mất thay đổi của nhau
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            config = {key: value for key, value in self._read().items() if key in CONFIG_KEYS}
+            config.update(changes)
+            
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({**config, 'updated_at': datetime.now().isoformat()}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            
+            self._apply(config)
+            self._signature = self._stat_signature()
+        return config
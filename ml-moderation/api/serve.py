@@ -0,0 +1,98 @@
+"""
+Production server cho Moderation Service (gunicorn, pre-fork)
+
+- Models được load 1 lần trong master (preload_app) rồi fork ra workers,
+  các workers dùng chung memory của models theo copy-on-write
+- Số workers / threads cấu hình qua biến môi trường
+- SIGTERM: ngừng nhận request mới, chờ request đang chạy xong
+  (tối đa ML_GRACEFUL_TIMEOUT giây) rồi mới thoát
+
+Chạy:
+    cd ml-moderation/api
+    ML_WORKERS=4 ML_THREADS=2 python serve.py
+"""
+
+import os
+import gc
+import sys
+import multiprocessing
+
+# Mỗi worker chỉ dùng 1 thread native (OpenMP/BLAS) để N workers
+# không tranh nhau CPU. Phải set trước khi import numpy/xgboost.
+_NATIVE_THREADS = os.getenv('ML_NATIVE_THREADS', '1')
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, _NATIVE_THREADS)
+
+
+def server_options() -> dict:
+    """Đọc cấu hình gunicorn từ biến môi trường"""
+    workers = int(os.getenv('ML_WORKERS', multiprocessing.cpu_count()))
+    threads = int(os.getenv('ML_THREADS', 1))
+    return {
+        'bind': f"{os.getenv('ML_HOST', '0.0.0.0')}:{os.getenv('PORT', os.getenv('ML_PORT', '5000'))}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'preload_app': True,
+        'timeout': int(os.getenv('ML_TIMEOUT', 60)),
+        'graceful_timeout': int(os.getenv('ML_GRACEFUL_TIMEOUT', 30)),
+        'keepalive': int(os.getenv('ML_KEEPALIVE', 5)),
+        'max_requests': int(os.getenv('ML_MAX_REQUESTS', 0)),
+        'max_requests_jitter': int(os.getenv('ML_MAX_REQUESTS_JITTER', 0)),
+        'accesslog': os.getenv('ML_ACCESS_LOG') or None,
+        'when_ready': _when_ready,
+        'worker_exit': _worker_exit
+    }
+
+
+def _when_ready(server):
+    """Master đã load xong app, chuẩn bị fork workers"""
+    # Đưa các object đã load (models, lookup tables) ra khỏi GC tracking:
+    # GC của worker không chạm vào các pages này nên chúng được share
+    # copy-on-write thay vì bị copy sang từng worker
+    gc.freeze()
+    server.log.info('Models preloaded in master (pid %s), forking %s workers',
+                    os.getpid(), server.cfg.workers)
+
+
+def _worker_exit(server, worker):
+    """Worker thoát (sau khi đã xử lý xong request đang chạy)"""
+    # Chạy nốt các job async đã nhận (trong giới hạn graceful_timeout),
+    # rồi ghi nốt request log còn trong queue
+    from app import job_queue, request_logger
+    job_queue.shutdown(timeout=server.cfg.graceful_timeout)
+    request_logger.shutdown()
+    server.log.info('Worker %s exited', worker.pid)
+
+
+def main():
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print('✗ Cần cài gunicorn: pip install gunicorn')
+        print('  (Windows không hỗ trợ gunicorn, dùng python app.py để chạy dev server)')
+        sys.exit(1)
+    
+    class ModerationServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+        
+        def load(self):
+            # Import trong master (preload_app) -> ModerationService load models 1 lần
+            from app import app
+            return app
+    
+    options = server_options()
+    print(f"🚀 Starting ML Moderation Service on {options['bind']} "
+          f"({options['workers']} workers x {options['threads']} threads)")
+    ModerationServer(options).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark: các bước train anomaly model (3_train_anomaly_model.py) trên
+dataset tổng hợp lớn (mặc định 5M rows)
+
+- Thời gian và bộ nhớ đỉnh (tracemalloc) từng bước
+- So với cách cũ (features float64, fit IsolationForest với contamination
+  cố định rồi predict + score_samples, len(df[...]) cho mỗi quantile) và
+  kiểm tra kết quả giống nhau
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_anomaly_training.py --rows 5000000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import tracemalloc
+from contextlib import redirect_stderr, redirect_stdout
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from common import BENCH_DIR, sample_properties
+from feature_schema import FEATURE_SCHEMA, PREP_COLUMNS, PRICE_FEATURES
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'scripts'))
+from run_cache import NullCache
+
+anomaly = importlib.import_module('3_train_anomaly_model')
+
+QUANTILES = [0.01, 0.05, 0.1, 0.15, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+
+def synthetic_frame(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """DataFrame giống data/training_data: lặp listing mẫu, jitter area / price"""
+    base = FEATURE_SCHEMA.compile(PREP_COLUMNS).frame(sample_properties(2000, seed=seed))
+    rng = np.random.default_rng(seed)
+    df = base.iloc[rng.integers(0, len(base), size=n_rows)].reset_index(drop=True)
+    df['area'] = rng.integers(12, 120, size=n_rows).astype(float)
+    df['price'] = (df['area'] * rng.normal(100_000, 25_000, size=n_rows)).clip(500_000).round(-4)
+    return df
+
+
+def fit_price_model(df: pd.DataFrame, seed: int = 42):
+    sample = df.sample(min(len(df), 20000), random_state=seed)
+    X = pd.DataFrame(FEATURE_SCHEMA.compile(PRICE_FEATURES).frame_columns(sample), columns=PRICE_FEATURES)
+    return xgb.XGBRegressor(n_estimators=100, max_depth=5, random_state=seed).fit(X[PRICE_FEATURES], sample['price'])
+
+
+def measure(report, name, fn, *args):
+    """Chạy fn (tắt output), ghi thời gian và bộ nhớ đỉnh vào report"""
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        result = fn(*args)
+    report[name] = {
+        'seconds': round(time.perf_counter() - start, 3),
+        'peak_mb': round((tracemalloc.get_traced_memory()[1] - before) / 2**20, 1)
+    }
+    return result
+
+
+# Cách cũ (trước khi vector hoá), để so sánh
+def legacy_prepare(df, features):
+    from sklearn.preprocessing import StandardScaler
+    return StandardScaler().fit_transform(df[features].astype(np.float64))
+
+
+def legacy_train(X):
+    from sklearn.ensemble import IsolationForest
+    return IsolationForest(n_estimators=100, contamination=0.1, max_samples='auto', random_state=42,
+                           n_jobs=-1).fit(X)
+
+
+def legacy_evaluate(iso_forest, X, df):
+    labels = iso_forest.predict(X)
+    scores = iso_forest.score_samples(X)
+    return labels, scores, len(df[labels == -1])
+
+
+def legacy_thresholds(df):
+    score_quantiles = df['anomaly_score'].quantile(QUANTILES)
+    counts = [len(df[df['anomaly_score'] <= score]) for score in score_quantiles]
+    return score_quantiles.to_numpy(), counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark anomaly training steps')
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--skip-legacy', action='store_true', help='Không chạy cách cũ')
+    args = parser.parse_args()
+    
+    df = synthetic_frame(args.rows)
+    price_model = fit_price_model(df)
+    print(f'Dataset: {len(df):,} rows')
+    
+    tracemalloc.start()
+    report = {'rows': len(df), 'steps': {}, 'legacy': {}}
+    steps = report['steps']
+    df, feature_stats = measure(steps, 'create_anomaly_features', anomaly.create_anomaly_features,
+                                df, price_model, PRICE_FEATURES)
+    X, scaler, features = measure(steps, 'prepare_features', anomaly.prepare_features, df)
+    iso_forest, train_scores = measure(steps, 'train_isolation_forest', anomaly.train_isolation_forest,
+                                       X, NullCache())
+    df, n_anomalies, _ = measure(steps, 'evaluate_model', anomaly.evaluate_model, iso_forest, X, df, train_scores)
+    thresholds = measure(steps, 'analyze_thresholds', anomaly.analyze_thresholds, df)
+    measure(steps, 'analyze_anomalies', anomaly.analyze_anomalies, df)
+    measure(steps, 'test_samples', anomaly.test_samples, iso_forest, scaler, features, feature_stats,
+            price_model, PRICE_FEATURES, thresholds)
+    report['anomaly_feature_mb'] = round(X.nbytes / 2**20, 1)
+    
+    if not args.skip_legacy:
+        legacy = report['legacy']
+        measure(legacy, 'prepare_features', legacy_prepare, df, features)
+        legacy_forest = measure(legacy, 'train_isolation_forest', legacy_train, X)
+        assert legacy_forest.offset_ == iso_forest.offset_, 'offset_ differs'
+        labels, scores, legacy_anomalies = measure(legacy, 'evaluate_model', legacy_evaluate, legacy_forest, X, df)
+        assert np.array_equal(labels, df['anomaly_label'].to_numpy()), 'labels differ'
+        assert np.array_equal(scores, df['anomaly_score'].to_numpy()), 'scores differ'
+        assert legacy_anomalies == n_anomalies
+        
+        legacy_quantiles, legacy_counts = measure(legacy, 'analyze_thresholds', legacy_thresholds, df)
+        assert np.allclose([thresholds['strict'], thresholds['moderate'], thresholds['lenient']],
+                           legacy_quantiles[1:4], rtol=0, atol=1e-12), 'thresholds differ'
+        sorted_scores = np.sort(df['anomaly_score'].to_numpy())
+        assert legacy_counts == np.searchsorted(sorted_scores, legacy_quantiles, side='right').tolist()
+        print('✅ Parity OK (labels, scores, thresholds, counts)')
+    tracemalloc.stop()
+    
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: evaluate_price hai lượt (predict_price + detect_anomaly)
+so với MLPredictor.evaluate một lượt
+
+Inference memo tắt: listing lặp lại qua các lần --repeat sẽ chỉ đo memo hit.
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_evaluate.py --n 500 --repeat 3
+"""
+
+import argparse
+import json
+
+from common import sample_properties, fit_synthetic_models, time_calls, summarize
+from ml_predictor import MLPredictor, evaluate_price, _price_result
+from result_cache import ResultCache
+
+
+def evaluate_price_two_pass(property_data, ml_predictor):
+    """Cách tính cũ: predict_price rồi detect_anomaly (predict lần 2)"""
+    predicted_price, confidence, price_reasons = ml_predictor.predict_price(property_data)
+    is_anomaly, anomaly_score, anomaly_reasons = ml_predictor.detect_anomaly(property_data)
+    return _price_result(property_data.get('price', 0), {
+        'predicted_price': predicted_price,
+        'confidence': confidence,
+        'price_reasons': price_reasons,
+        'is_anomaly': is_anomaly,
+        'anomaly_score': anomaly_score,
+        'anomaly_reasons': anomaly_reasons
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n', type=int, default=500, help='Số listing mỗi lượt')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    predictor = fit_synthetic_models(MLPredictor(models_dir='__no_models__'))
+    predictor.inference_memo = ResultCache(max_size=0)
+    properties = sample_properties(args.n, seed=7)
+    
+    # Kết quả phải giống hệt nhau
+    for prop in properties:
+        assert evaluate_price(prop, predictor) == evaluate_price_two_pass(prop, predictor)
+    
+    report = {}
+    anomaly_model = predictor.anomaly_model
+    for config, use_anomaly in [('price_model_only', False), ('price_and_anomaly', True)]:
+        predictor.anomaly_model = anomaly_model if use_anomaly else None
+        
+        # Warm-up
+        time_calls(lambda p: evaluate_price(p, predictor), properties[:50])
+        
+        two_pass = summarize(time_calls(
+            lambda p: evaluate_price_two_pass(p, predictor), properties, args.repeat
+        ))
+        single_pass = summarize(time_calls(
+            lambda p: evaluate_price(p, predictor), properties, args.repeat
+        ))
+        report[config] = {
+            'two_pass': two_pass,
+            'single_pass': single_pass,
+            'speedup_mean': round(two_pass['mean_ms'] / single_pass['mean_ms'], 2)
+        }
+    
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
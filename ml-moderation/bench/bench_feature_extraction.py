@@ -0,0 +1,83 @@
+"""
+Microbenchmark: tốc độ extract features (features/giây) của FeatureExtractor
+
+- Parity: extract cả batch == extract từng row == đường DataFrame training
+  (1_data_preparation -> transform_frame), float32 == float64 ép kiểu
+- Throughput theo batch size: rows/s và features/s, float64 và float32
+  (float32 ghi vào buffer có sẵn qua out=)
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_feature_extraction.py --batch-sizes 1 32 1000 10000
+"""
+
+import json
+import argparse
+
+import numpy as np
+
+from common import sample_properties, time_calls, summarize
+from feature_schema import FEATURE_SCHEMA, PREP_COLUMNS, PRICE_FEATURES, ANOMALY_FEATURES
+
+FEATURE_SETS = {
+    'price': PRICE_FEATURES,
+    'anomaly': ANOMALY_FEATURES
+}
+
+
+def check_parity(properties, stats):
+    inputs = {'predicted_price': np.array([p['price'] * 0.9 for p in properties], dtype=float)}
+    prep_frame = FEATURE_SCHEMA.compile(PREP_COLUMNS).frame(properties)
+    for name, feature_names in FEATURE_SETS.items():
+        extractor = FEATURE_SCHEMA.compile(feature_names, stats=stats)
+        X = extractor.transform(properties, inputs)
+        rows = np.vstack([
+            extractor.transform([p], {'predicted_price': inputs['predicted_price'][i:i + 1]})
+            for i, p in enumerate(properties)
+        ])
+        assert np.array_equal(X, rows, equal_nan=True), f'{name}: batch != per-row'
+        
+        X_frame = extractor.transform_frame(prep_frame, inputs)
+        assert np.array_equal(X, X_frame, equal_nan=True), f'{name}: records != DataFrame'
+        
+        X32 = FEATURE_SCHEMA.compile(feature_names, stats=stats, dtype=np.float32).transform(properties, inputs)
+        assert X32.dtype == np.float32 and np.array_equal(X32, X.astype(np.float32), equal_nan=True)
+    print(f'✅ Parity OK ({len(FEATURE_SETS)} feature sets, {len(properties)} properties)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark feature extraction')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32, 1000, 10000])
+    parser.add_argument('--max-calls', type=int, default=2000,
+                        help='Số lần gọi tối đa cho mỗi batch size')
+    args = parser.parse_args()
+    
+    properties = sample_properties(max(args.batch_sizes), seed=11)
+    check_parity(properties[:500], stats={'price_diff': {'mean': 0.0, 'std': 1_000_000.0}})
+    
+    n_features = len(PRICE_FEATURES)
+    extractor64 = FEATURE_SCHEMA.compile(PRICE_FEATURES)
+    extractor32 = FEATURE_SCHEMA.compile(PRICE_FEATURES, dtype=np.float32)
+    
+    report = {}
+    for batch_size in args.batch_sizes:
+        calls = max(5, min(args.max_calls, 50000 // batch_size))
+        batches = [properties[:batch_size]] * calls
+        out = np.empty((batch_size, n_features), dtype=np.float32)
+        runs = {
+            'float64': extractor64.transform,
+            'float32_out': lambda batch: extractor32.transform(batch, out=out)
+        }
+        report[f'batch_{batch_size}'] = {}
+        for key, transform in runs.items():
+            stats = summarize(time_calls(transform, batches))
+            rows_per_sec = batch_size / (stats['mean_ms'] / 1000)
+            stats['rows_per_sec'] = round(rows_per_sec)
+            stats['features_per_sec'] = round(rows_per_sec * n_features)
+            report[f'batch_{batch_size}'][key] = stats
+    
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark + parity: PackedIsolationForest (NumPy) so với sklearn IsolationForest
+
+- Parity: score_samples / decision_function / predict phải giống hệt sklearn
+  (nhiều cấu hình forest, có cả NaN)
+- Latency p50/p99 theo batch size (mặc định 1 -> 10k rows)
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_isolation_forest.py --batch-sizes 1 10 100 1000 10000
+"""
+
+import json
+import argparse
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+import common  # noqa: F401  (thêm api/ vào sys.path)
+from common import time_calls, summarize
+from packed_trees import PackedIsolationForest, pack_isolation_forest
+
+# (n_estimators, max_samples, max_features, contamination)
+PARITY_CONFIGS = [
+    (100, 'auto', 1.0, 0.1),
+    (50, 64, 0.5, 'auto'),
+    (200, 512, 0.8, 0.05),
+    (10, 2, 1.0, 0.1)
+]
+
+
+def check_parity(n_features: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for n_estimators, max_samples, max_features, contamination in PARITY_CONFIGS:
+        X = rng.normal(size=(3000, n_features))
+        X[rng.random(X.shape) < 0.02] = np.nan
+        forest = IsolationForest(
+            n_estimators=n_estimators, max_samples=max_samples, max_features=max_features,
+            contamination=contamination, random_state=seed
+        ).fit(X)
+        packed = PackedIsolationForest(**pack_isolation_forest(forest))
+        
+        X_test = rng.normal(scale=2.0, size=(PackedIsolationForest.CHUNK_ROWS + 500, n_features))
+        X_test[rng.random(X_test.shape) < 0.02] = np.nan
+        assert np.array_equal(forest.score_samples(X_test), packed.score_samples(X_test))
+        assert np.array_equal(forest.decision_function(X_test), packed.decision_function(X_test))
+        assert np.array_equal(forest.predict(X_test), packed.predict(X_test))
+        for row in X_test[:50]:
+            assert forest.score_samples(row[None, :])[0] == packed.score_samples(row[None, :])[0]
+    print(f'✅ Parity OK ({len(PARITY_CONFIGS)} configs)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Isolation Forest: NumPy vs sklearn')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--n-features', type=int, default=14)
+    parser.add_argument('--max-calls', type=int, default=200,
+                        help='Số lần gọi tối đa cho mỗi batch size')
+    args = parser.parse_args()
+    
+    check_parity(args.n_features)
+    
+    rng = np.random.default_rng(42)
+    forest = IsolationForest(
+        n_estimators=args.n_estimators, contamination=0.1, random_state=42
+    ).fit(rng.normal(size=(5000, args.n_features)))
+    packed = PackedIsolationForest(**pack_isolation_forest(forest))
+    
+    report = {}
+    for batch_size in args.batch_sizes:
+        # Batch lớn: ít lần gọi hơn để benchmark không chạy quá lâu
+        calls = max(5, min(args.max_calls, 20000 // batch_size))
+        batches = [rng.normal(scale=1.5, size=(batch_size, args.n_features)) for _ in range(calls)]
+        sklearn_stats = summarize(time_calls(forest.predict, batches))
+        numpy_stats = summarize(time_calls(packed.predict, batches))
+        report[f'batch_{batch_size}'] = {
+            'sklearn': sklearn_stats,
+            'numpy': numpy_stats,
+            'speedup_p50': round(sklearn_stats['p50_ms'] / numpy_stats['p50_ms'], 2)
+        }
+    
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
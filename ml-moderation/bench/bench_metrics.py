@@ -0,0 +1,113 @@
+"""
+Benchmark: overhead của metrics (api/metrics.py) trên ModerationService
+
+So sánh latency moderate() / batch_moderate() khi bật và tắt đo
+(metrics.set_enabled), chạy xen kẽ nhiều vòng để giảm nhiễu, và chi phí
+riêng của các lời gọi metrics cho 1 property so với latency đó. Cache kết
+quả, memo và micro-batching đều tắt để mỗi request chạy đủ các stage.
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_metrics.py --requests 2000 --rounds 5
+"""
+
+import time
+import argparse
+import json
+
+import numpy as np
+
+from common import sample_properties, fit_synthetic_models, time_calls
+import metrics
+from moderation_service import ModerationService
+from result_cache import ResultCache
+import rule_validators
+
+
+def make_service() -> ModerationService:
+    service = ModerationService(models_dir='__no_models__', cache_size=0, batch_max_size=1)
+    fit_synthetic_models(service.ml_predictor)
+    service.ml_predictor.inference_memo = ResultCache(max_size=0)
+    for stage in rule_validators.STAGE_MEMOS:
+        rule_validators.STAGE_MEMOS[stage] = ResultCache(max_size=0)
+    return service
+
+
+def instrumentation_us(batch_size: int, n: int = 20_000) -> float:
+    """
+    Chi phí các lời gọi metrics của 1 property (µs): 4 validators
+    (StageLaps), decision counter và phần chia đều của các stage ML
+    (đo 1 lần cho cả batch)
+    """
+    perf_counter = time.perf_counter
+    result = {'success': True, 'decision': 'pending_review'}
+    ml_stages = [metrics.STAGES[stage] for stage in ('feature_extraction', 'price_model', 'anomaly_model')]
+    
+    start = perf_counter()
+    for _ in range(n):
+        t0 = perf_counter()
+        t1 = perf_counter()
+        t2 = perf_counter()
+        t3 = perf_counter()
+        metrics.RULE_STAGES.record((t0, t1, t2, t3, perf_counter()))
+    per_property = (perf_counter() - start) / n
+    
+    start = perf_counter()
+    for _ in range(n // batch_size + 1):
+        metrics.record_decisions([result] * batch_size)
+    per_property += (perf_counter() - start) / ((n // batch_size + 1) * batch_size)
+    
+    start = perf_counter()
+    for _ in range(n):
+        for stage in ml_stages:
+            with stage.time():
+                pass
+        metrics.MODEL_ROWS.inc(batch_size)
+    per_batch = (perf_counter() - start) / n
+    return (per_property + per_batch / batch_size) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark overhead của /metrics instrumentation')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    
+    service = make_service()
+    properties = sample_properties(args.requests)
+    batches = [properties[i:i + args.batch_size] for i in range(0, len(properties), args.batch_size)]
+    
+    # Warm-up
+    time_calls(service.moderate, properties[:100])
+    
+    timings = {'moderate': {True: [], False: []}, 'batch_moderate': {True: [], False: []}}
+    for _ in range(args.rounds):
+        for enabled in (True, False):
+            metrics.set_enabled(enabled)
+            timings['moderate'][enabled].append(time_calls(service.moderate, properties).mean())
+            timings['batch_moderate'][enabled].append(
+                time_calls(service.batch_moderate, batches).mean() / args.batch_size
+            )
+    metrics.set_enabled(True)
+    
+    # So sánh bật / tắt bị nhiễu cỡ vài % giữa các vòng, nên overhead_pct
+    # tính từ chi phí đo của riêng các lời gọi metrics / latency khi tắt
+    report = {'requests': args.requests, 'rounds': args.rounds}
+    for name, batch_size in (('moderate', 1), ('batch_moderate', args.batch_size)):
+        # Trung vị các vòng (ms / property)
+        on, off = float(np.median(timings[name][True])), float(np.median(timings[name][False]))
+        cost_us = instrumentation_us(batch_size)
+        report[name] = {
+            'metrics_on_ms': round(on, 4),
+            'metrics_off_ms': round(off, 4),
+            'on_vs_off_pct': round((on - off) / off * 100, 2),
+            'instrumentation_us': round(cost_us, 2),
+            'overhead_pct': round(cost_us / 1000 / off * 100, 3)
+        }
+    
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
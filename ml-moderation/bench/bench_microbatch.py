@@ -0,0 +1,89 @@
+"""
+Benchmark: ModerationService.moderate từ nhiều threads đồng thời,
+có và không có micro-batching phần ML
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_microbatch.py --requests 2000 --concurrency 1 8 32
+"""
+
+import time
+import argparse
+import json
+import threading
+
+import numpy as np
+
+from common import sample_properties, fit_synthetic_models, summarize
+from moderation_service import ModerationService
+from result_cache import ResultCache
+
+
+def make_service(batch_max_size: int, max_wait_ms: float) -> ModerationService:
+    service = ModerationService(
+        models_dir='__no_models__', cache_size=0,
+        batch_max_size=batch_max_size, batch_max_wait_ms=max_wait_ms
+    )
+    fit_synthetic_models(service.ml_predictor)
+    # Tắt memo để mỗi request đều chạy model
+    service.ml_predictor.inference_memo = ResultCache(max_size=0)
+    return service
+
+
+def run(service: ModerationService, properties, concurrency: int) -> dict:
+    latencies = [[] for _ in range(concurrency)]
+    
+    def client(i):
+        for prop in properties[i::concurrency]:
+            start = time.perf_counter()
+            service.moderate(prop)
+            latencies[i].append((time.perf_counter() - start) * 1000)
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    result = summarize(np.concatenate([np.array(l) for l in latencies]))
+    result['requests_per_sec'] = round(len(properties) / elapsed, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark micro-batching cho /api/moderate')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args()
+    
+    properties = sample_properties(args.requests, seed=11)
+    unbatched = make_service(1, 0)
+    batched = make_service(args.max_batch, args.max_wait_ms)
+    
+    # Kết quả phải giống hệt nhau
+    for prop in properties[:200]:
+        assert batched.moderate(prop) == unbatched.moderate(prop)
+    
+    report = {}
+    for concurrency in args.concurrency:
+        batched.price_batcher.reset_stats()
+        off = run(unbatched, properties, concurrency)
+        on = run(batched, properties, concurrency)
+        stats = batched.price_batcher.stats()
+        report[f'concurrency_{concurrency}'] = {
+            'unbatched': off,
+            'batched': on,
+            'mean_batch_size': stats['mean_batch_size'],
+            'added_wait_ms': stats['added_wait_ms'],
+            'throughput_gain': round(on['requests_per_sec'] / off['requests_per_sec'], 2)
+        }
+    
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: thời gian load models (cold start)
+.pkl kiểu cũ (joblib) so với model bundle (XGBoost native + mảng .npy mmap)
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_model_load.py --repeat 20
+"""
+
+import os
+import json
+import argparse
+import tempfile
+
+import joblib
+import numpy as np
+
+from common import sample_properties, fit_synthetic_models, time_calls, summarize
+from ml_predictor import MLPredictor
+from model_bundle import save_bundle, load_bundle, load_legacy_pickles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark load models: pickle vs bundle')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--n-estimators', type=int, default=100,
+                        help='Số cây của Isolation Forest')
+    args = parser.parse_args()
+    
+    predictor = fit_synthetic_models(MLPredictor(models_dir='__no_models__'))
+    if args.n_estimators != len(predictor.anomaly_model.estimators_):
+        from sklearn.ensemble import IsolationForest
+        X = predictor.scaler.transform(np.vstack([
+            predictor._extract_feature_row(p) for p in sample_properties(2000, seed=42)
+        ]).astype(float))
+        predictor.anomaly_model = IsolationForest(
+            n_estimators=args.n_estimators, contamination=0.1, random_state=42
+        ).fit(X)
+    
+    models_dir = tempfile.mkdtemp(prefix='bench_model_load_')
+    joblib.dump({'model': predictor.price_model}, os.path.join(models_dir, 'price_model.pkl'))
+    joblib.dump({'model': predictor.anomaly_model}, os.path.join(models_dir, 'anomaly_model.pkl'))
+    joblib.dump(predictor.scaler, os.path.join(models_dir, 'scaler.pkl'))
+    bundle_dir = os.path.join(models_dir, 'bundle')
+    save_bundle(
+        bundle_dir,
+        price_model=predictor.price_model,
+        anomaly_model=predictor.anomaly_model,
+        scaler=predictor.scaler
+    )
+    
+    # Kết quả predict phải giống nhau
+    legacy, bundle = load_legacy_pickles(models_dir), load_bundle(bundle_dir)
+    X = bundle.scaler.transform(np.vstack([
+        predictor._extract_feature_row(p) for p in sample_properties(500, seed=5)
+    ]).astype(float))
+    assert np.array_equal(legacy.price_model.predict(X), bundle.price_model.predict(X))
+    assert np.array_equal(legacy.anomaly_model.predict(X), bundle.anomaly_model.predict(X))
+    
+    report = {
+        'sizes_kb': {
+            'pickle': round(sum(
+                os.path.getsize(os.path.join(models_dir, f))
+                for f in os.listdir(models_dir) if f.endswith('.pkl')
+            ) / 1024, 1),
+            'bundle': round(sum(
+                os.path.getsize(os.path.join(root, f))
+                for root, _, files in os.walk(bundle_dir) for f in files
+            ) / 1024, 1)
+        },
+        'pickle': summarize(time_calls(lambda _: load_legacy_pickles(models_dir), range(args.repeat))),
+        'bundle_parallel': summarize(time_calls(
+            lambda _: load_bundle(bundle_dir, parallel=True), range(args.repeat)
+        )),
+        'bundle_sequential': summarize(time_calls(
+            lambda _: load_bundle(bundle_dir, parallel=False), range(args.repeat)
+        )),
+        'bundle_components_ms': load_bundle(bundle_dir).load_times
+    }
+    report['speedup_mean'] = round(report['pickle']['mean_ms'] / min(
+        report['bundle_parallel']['mean_ms'], report['bundle_sequential']['mean_ms']
+    ), 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: latency của price model theo backend (xgboost / inplace / numpy)
+và theo số threads chấm điểm batch lớn
+
+Kết quả của mọi backend phải giống hệt XGBRegressor.predict.
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_price_backends.py --batch-sizes 1 32 1000 10000 --threads 1 4
+"""
+
+import json
+import argparse
+
+import numpy as np
+
+from common import sample_properties, fit_synthetic_models, time_calls, summarize
+from ml_predictor import MLPredictor
+from price_backends import PRICE_BACKENDS, make_price_backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark price model backends')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32, 1000, 10000])
+    parser.add_argument('--backends', nargs='+', default=list(PRICE_BACKENDS), choices=PRICE_BACKENDS)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--max-calls', type=int, default=300,
+                        help='Số lần gọi tối đa cho mỗi batch size')
+    args = parser.parse_args()
+    
+    predictor = fit_synthetic_models(MLPredictor(models_dir='__no_models__'))
+    model = predictor.price_model
+    X_all = predictor.scaler.transform(np.vstack([
+        predictor._extract_feature_row(p) for p in sample_properties(max(args.batch_sizes), seed=7)
+    ]).astype(float))
+    expected = model.predict(X_all)
+    
+    backends = {}
+    for name in args.backends:
+        for threads in args.threads:
+            backend = make_price_backend(model, backend=name, threads=threads, parallel_min_rows=1024)
+            assert np.array_equal(backend.predict(X_all), expected), f'{name} mismatch'
+            assert np.array_equal(backend.predict(X_all[:1]), expected[:1]), f'{name} mismatch'
+            backends[f'{name}/threads={threads}'] = backend
+    print(f'✅ Parity OK ({len(backends)} backends)')
+    
+    rng = np.random.default_rng(0)
+    report = {}
+    for batch_size in args.batch_sizes:
+        calls = max(5, min(args.max_calls, 30000 // batch_size))
+        batches = [X_all[rng.integers(0, len(X_all), batch_size)] for _ in range(calls)]
+        report[f'batch_{batch_size}'] = {
+            key: summarize(time_calls(backend.predict, batches))
+            for key, backend in backends.items()
+        }
+    
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
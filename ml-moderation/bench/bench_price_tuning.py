@@ -0,0 +1,75 @@
+"""
+Benchmark: hyperparameter search của price model
+halving (random search + successive halving + early stopping) so với
+GridSearchCV 729 tổ hợp cũ: wall clock, số lần fit, CV MAE và test MAE
+
+Dữ liệu: data/training_data (output của 1_data_preparation.py) nếu có,
+không thì dữ liệu tổng hợp từ properties_sample.json.
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_price_tuning.py --budget 120
+    python bench/bench_price_tuning.py --budget 120 --grid   # thêm grid (chậm)
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import train_test_split
+
+from common import BENCH_DIR, DATA_DIR, sample_properties
+from feature_schema import FEATURE_SCHEMA, PRICE_FEATURES
+
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'scripts'))
+from price_tuning import tune
+
+
+def load_dataset(n_synthetic: int, seed: int = 42):
+    """X, y và nguồn dữ liệu"""
+    path = os.path.join(DATA_DIR, 'training_data')
+    if os.path.isdir(path):
+        df = pd.read_parquet(path)
+        return df[PRICE_FEATURES].to_numpy(dtype=float), df['price'].to_numpy(dtype=float), path
+    
+    # Giá tổng hợp có tín hiệu (phi tuyến theo features) + nhiễu
+    properties = sample_properties(n_synthetic, seed=seed)
+    X = FEATURE_SCHEMA.compile(PRICE_FEATURES).transform(properties)
+    rng = np.random.default_rng(seed)
+    weights = rng.normal(size=X.shape[1])
+    signal = np.tanh((X - X.mean(axis=0)) / (X.std(axis=0) + 1e-9)) @ weights
+    y = 3_000_000 + 800_000 * signal + rng.normal(0, 300_000, size=len(X))
+    return X, y, 'synthetic'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark price model tuning')
+    parser.add_argument('--budget', type=float, default=600, help='Time budget (giây) cho halving')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--candidates', type=int, default=64)
+    parser.add_argument('--samples', type=int, default=5000,
+                        help='Số listing tổng hợp khi không có data/training_data')
+    parser.add_argument('--grid', action='store_true', help='Chạy thêm GridSearchCV (chậm)')
+    args = parser.parse_args()
+    
+    X, y, source = load_dataset(args.samples)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    print(f'Dữ liệu: {source} ({len(X_train)} train / {len(X_test)} test)')
+    
+    strategies = ['halving'] + (['grid'] if args.grid else [])
+    report = {'data': source, 'train_rows': len(X_train)}
+    for strategy in strategies:
+        model, result = tune(X_train, y_train, strategy=strategy, budget_s=args.budget,
+                             workers=args.workers, n_candidates=args.candidates, verbose=False)
+        result['test_mae'] = round(float(mean_absolute_error(y_test, model.predict(X_test))))
+        report[strategy] = result
+    
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
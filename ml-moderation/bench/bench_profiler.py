@@ -0,0 +1,90 @@
+"""
+Benchmark: overhead của profiler lấy mẫu stack (api/profiler.py)
+
+So sánh throughput của moderate() (nhiều threads, result cache tắt,
+micro-batching bật như production, mỗi lần chạy 1 bộ listing mới để
+inference memo không hit) khi:
+- off: không profile
+- sampled: profile ngẫu nhiên 5% request
+- all: profile mọi request (như khi mọi request gửi X-Profile: 1)
+
+Các chế độ chạy xen kẽ nhiều vòng, lấy trung vị để giảm nhiễu. In ra các
+frame nhiều sample nhất của chế độ `all`.
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_profiler.py --requests 600 --rounds 3 --concurrency 1 4
+"""
+
+import sys
+import time
+import json
+import argparse
+import itertools
+import threading
+
+import numpy as np
+
+from common import synthetic_properties, fit_synthetic_models
+from moderation_service import ModerationService
+from profiler import StackProfiler
+
+
+def run(service, properties, concurrency: int, profiler: StackProfiler) -> float:
+    def client(i):
+        for prop in properties[i::concurrency]:
+            with profiler.profile(label='moderate'):
+                service.moderate(prop)
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return round(len(properties) / (time.perf_counter() - start), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark overhead của stack profiler')
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--interval-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    
+    service = ModerationService(models_dir='__no_models__', cache_size=0)
+    fit_synthetic_models(service.ml_predictor)
+    for prop in synthetic_properties(100, seed=0):
+        service.moderate(prop)
+    
+    report = {'requests': args.requests, 'rounds': args.rounds, 'interval_ms': args.interval_ms, 'results': {}}
+    seeds = itertools.count(1)
+    for concurrency in args.concurrency:
+        profilers = {
+            'off': StackProfiler(sample_rate=0),
+            'sampled': StackProfiler(sample_rate=0.05, interval_ms=args.interval_ms),
+            'all': StackProfiler(sample_rate=1.0, interval_ms=args.interval_ms)
+        }
+        rates = {name: [] for name in profilers}
+        for _ in range(args.rounds):
+            for name, profiler in profilers.items():
+                properties = synthetic_properties(args.requests, seed=next(seeds))
+                rates[name].append(run(service, properties, concurrency, profiler))
+        
+        results = report['results'][str(concurrency)] = {
+            name: {'requests_per_sec': float(np.median(values))} for name, values in rates.items()
+        }
+        off = results['off']['requests_per_sec']
+        for name in ('sampled', 'all'):
+            rate = results[name]['requests_per_sec']
+            results[name]['overhead_pct'] = round((off - rate) / rate * 100, 1)
+            results[name]['samples'] = profilers[name].stats()['samples']
+        print(f'concurrency={concurrency}: {json.dumps(results)}', file=sys.stderr)
+    
+    report['top_frames'] = profilers['all'].top_functions(10)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: chi phí log mỗi request /api/moderate
+
+So sánh throughput của moderate() (nhiều threads, result cache bật nên
+phần moderation rẻ và log chiếm phần lớn) khi:
+- none: không log
+- print: 4 lần print + datetime.strftime mỗi request (cách cũ của app.py)
+- json: RequestLogger ghi mọi request (sample_rate=1)
+- json_sampled: RequestLogger với sample_rate mặc định (0.1)
+
+Log được ghi vào file tạm (stdout thật thường là pipe sang log collector).
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_request_log.py --requests 20000 --concurrency 1 8
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+from common import sample_properties, fit_synthetic_models
+import metrics
+from moderation_service import ModerationService
+from request_log import RequestLogger
+
+
+def print_log(out, property_data, result):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Moderated property", file=out)
+    print(f"  Title: {property_data.get('title', 'N/A')[:50]}", file=out)
+    print(f"  Score: {result['overall_score']}", file=out)
+    print(f"  Decision: {result['decision']}", file=out)
+
+
+def run(service, properties, concurrency: int, log) -> dict:
+    def client(i):
+        for prop in properties[i::concurrency]:
+            start = time.perf_counter()
+            trace = metrics.start_trace()
+            result = service.moderate(prop)
+            metrics.stop_trace()
+            log(prop, result, trace, (time.perf_counter() - start) * 1000)
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {'requests_per_sec': round(len(properties) / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark request logging của /api/moderate')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    args = parser.parse_args()
+    
+    service = ModerationService(models_dir='__no_models__')
+    fit_synthetic_models(service.ml_predictor)
+    # 200 listing lặp lại: sau lượt đầu mọi request là cache hit
+    properties = (sample_properties(200) * (args.requests // 200 + 1))[:args.requests]
+    for prop in properties[:200]:
+        service.moderate(prop)
+    
+    report = {'requests': args.requests, 'results': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for concurrency in args.concurrency:
+            results = report['results'][str(concurrency)] = {}
+            
+            results['none'] = run(service, properties, concurrency, lambda *a: None)
+            
+            with open(os.path.join(tmp, 'print.log'), 'w', encoding='utf-8') as out:
+                results['print'] = run(service, properties, concurrency,
+                                       lambda prop, result, trace, ms: print_log(out, prop, result))
+            
+            for name, sample_rate in (('json', 1.0), ('json_sampled', 0.1)):
+                with open(os.path.join(tmp, f'{name}.log'), 'w', encoding='utf-8') as out:
+                    logger = RequestLogger(sample_rate=sample_rate, stream=out)
+                    start = time.perf_counter()
+                    results[name] = run(
+                        service, properties, concurrency,
+                        lambda prop, result, trace, ms: logger.log_moderation('bench', prop, result, trace, ms)
+                    )
+                    # Tính cả thời gian listener ghi nốt queue
+                    logger.shutdown()
+                    results[name]['incl_flush_per_sec'] = round(len(properties) / (time.perf_counter() - start), 1)
+                    results[name]['dropped'] = logger.stats()['dropped']
+            print(f"concurrency={concurrency}: {json.dumps(results)}", file=sys.stderr)
+    
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Load test: requests/sec của serve.py theo số workers
+
+Với mỗi giá trị workers, khởi động serve.py, bắn /api/moderate từ nhiều
+client processes (keep-alive) trong một khoảng thời gian rồi đo throughput
+và latency. Cache kết quả bị tắt để đo đúng chi phí moderation.
+
+Chạy:
+    cd ml-moderation
+    python bench/bench_serving.py --workers 1 2 4 --concurrency 16 --duration 10
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import http.client
+import multiprocessing
+import numpy as np
+
+from common import API_DIR, sample_properties, wait_ready, check_first_requests
+
+
+def _client(port: int, duration: float, seed: int, queue):
+    """Một client: gửi request tuần tự trên 1 connection keep-alive"""
+    bodies = [
+        json.dumps({'property': prop}).encode('utf-8')
+        for prop in sample_properties(200, seed=seed)
+    ]
+    headers = {'Content-Type': 'application/json'}
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    i = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('POST', '/api/moderate', body=bodies[i % len(bodies)], headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        latencies.append((time.perf_counter() - start) * 1000)
+        i += 1
+    queue.put((latencies, errors))
+
+
+def run_load(port: int, concurrency: int, duration: float) -> dict:
+    queue = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(target=_client, args=(port, duration, seed, queue))
+        for seed in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+    results = [queue.get() for _ in clients]
+    for client in clients:
+        client.join()
+    
+    latencies = np.array([lat for lats, _ in results for lat in lats])
+    return {
+        'requests': int(len(latencies)),
+        'errors': int(sum(errors for _, errors in results)),
+        'requests_per_sec': round(len(latencies) / duration, 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test serve.py theo số workers')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, multiprocessing.cpu_count()}))
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    args = parser.parse_args()
+    
+    report = {'cpu_count': multiprocessing.cpu_count(), 'runs': []}
+    for workers in args.workers:
+        env = dict(
+            os.environ,
+            ML_WORKERS=str(workers),
+            ML_THREADS=str(args.threads),
+            ML_PORT=str(args.port),
+            MODERATION_CACHE_SIZE='0'
+        )
+        server = subprocess.Popen(
+            [sys.executable, 'serve.py'], cwd=API_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_ready(args.port)
+            # Request đầu tiên của mỗi worker sau fork phải thành công
+            failed = check_first_requests(args.port, workers)
+            if failed:
+                raise RuntimeError(f'workers={workers}: first requests after fork failed with status {failed}')
+            run = run_load(args.port, args.concurrency, args.duration)
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+        
+        run.update({'workers': workers, 'threads': args.threads})
+        report['runs'].append(run)
+        print(f"workers={workers:>3}  {run['requests_per_sec']:>8.1f} req/s  "
+              f"p50={run['p50_ms']:.2f}ms  p99={run['p99_ms']:.2f}ms  errors={run['errors']}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Helpers dùng chung cho các benchmark
+Tạo listing mẫu và gắn models train nhanh trên dữ liệu tổng hợp
+"""
+
+import os
+import sys
+import json
+import copy
+import random
+import time
+import threading
+import http.client
+import numpy as np
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCH_DIR, '..', 'api')
+DATA_DIR = os.path.join(BENCH_DIR, '..', 'data')
+SCRIPTS_DIR = os.path.join(BENCH_DIR, '..', 'scripts')
+
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+def sample_properties(n: int, seed: int = 42) -> List[Dict]:
+    """
+    Tạo n listing từ data/properties_sample.json (jitter giá và diện tích)
+    """
+    with open(os.path.join(DATA_DIR, 'properties_sample.json'), encoding='utf-8') as f:
+        templates = json.load(f)
+    
+    rnd = random.Random(seed)
+    properties = []
+    for _ in range(n):
+        prop = copy.deepcopy(rnd.choice(templates))
+        prop['area'] = rnd.randint(12, 120)
+        prop['price'] = rnd.randint(10, 200) * 100_000
+        properties.append(prop)
+    return properties
+
+
+def synthetic_properties(n: int, seed: int = 42, bad_ratio: float = 0.1) -> List[Dict]:
+    """
+    Tạo n listing theo phân phối của scripts/generate_sample_data.py
+    (tỉnh / quận, diện tích, phòng, tiện nghi, giá theo diện tích)
+    
+    Khoảng bad_ratio listing bị làm hỏng để đi qua cả các nhánh reject:
+    chèn spam keyword vào mô tả, giá lệch x10 / x0.1, hoặc bỏ ảnh.
+    Cùng seed cho cùng dữ liệu.
+    """
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+    from generate_sample_data import generate_property
+    from rule_validators import TextValidator
+    
+    rnd = random.Random(seed)
+    properties = []
+    for _ in range(n):
+        prop = generate_property(rnd)
+        # Bỏ các field datetime.now() (không dùng khi moderate) để dữ liệu
+        # giống hệt nhau giữa các lần chạy và gửi được qua JSON
+        for key in ('availableFrom', 'createdAt', 'updatedAt'):
+            prop.pop(key, None)
+        
+        if rnd.random() < bad_ratio:
+            defect = rnd.randrange(3)
+            if defect == 0:
+                keywords = rnd.sample(TextValidator.SPAM_KEYWORDS, k=3)
+                prop['description'] += ' ' + ', '.join(keywords).upper()
+            elif defect == 1:
+                prop['price'] = int(prop['price'] * rnd.choice([10, 0.1]))
+            else:
+                prop['images'] = []
+        properties.append(prop)
+    return properties
+
+
+def fit_synthetic_models(predictor, n_samples: int = 2000, seed: int = 42):
+    """
+    Train nhanh scaler + XGBoost + Isolation Forest trên dữ liệu tổng hợp
+    và gắn vào predictor (để benchmark đường chạy model thật)
+    """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.ensemble import IsolationForest
+    import xgboost as xgb
+    
+    properties = sample_properties(n_samples, seed=seed)
+    X = np.vstack([predictor._extract_feature_row(p) for p in properties]).astype(float)
+    y = np.array([p['price'] for p in properties], dtype=float)
+    
+    scaler = StandardScaler().fit(X)
+    X_scaled = scaler.transform(X)
+    
+    predictor.scaler = scaler
+    predictor.price_model = xgb.XGBRegressor(
+        n_estimators=200, max_depth=5, random_state=seed, n_jobs=1
+    ).fit(X_scaled, y)
+    predictor.anomaly_model = IsolationForest(
+        n_estimators=100, contamination=0.1, random_state=seed
+    ).fit(X_scaled)
+    predictor.inference_memo.clear()
+    return predictor
+
+
+def time_calls(fn, items, repeat: int = 1) -> np.ndarray:
+    """Gọi fn(item) cho từng item, trả về latency từng call (ms)"""
+    latencies = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def summarize(latencies_ms: np.ndarray) -> Dict:
+    """Thống kê latency (ms)"""
+    return {
+        'calls': int(len(latencies_ms)),
+        'mean_ms': round(float(latencies_ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 4),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 4)
+    }
+
+
+def wait_ready(port: int, host: str = '127.0.0.1', timeout: float = 60.0):
+    """Chờ server trả lời /api/health"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server trên {host}:{port} không sẵn sàng sau {timeout}s')
+
+
+def check_first_requests(port: int, workers: int, host: str = '127.0.0.1') -> List[int]:
+    """
+    Gửi cùng lúc workers * 4 request /api/moderate, mỗi request 1 connection
+    mới, để request đầu tiên của từng worker (lần đầu chạy code sau fork)
+    đều được kiểm tra. Trả về các status khác 200
+    """
+    body = json.dumps({'property': sample_properties(1, seed=0)[0]}).encode('utf-8')
+    n = workers * 4
+    barrier = threading.Barrier(n)
+    statuses = []
+    
+    def send():
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        barrier.wait()
+        try:
+            conn.request('POST', '/api/moderate', body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            statuses.append(response.status)
+        except (OSError, http.client.HTTPException):
+            statuses.append(0)
+        finally:
+            conn.close()
+    
+    threads = [threading.Thread(target=send) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [status for status in statuses if status != 200]
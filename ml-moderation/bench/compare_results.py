@@ -0,0 +1,122 @@
+"""
+So sánh 2 file kết quả của load_test.py để phát hiện regression
+
+Mỗi metric số được so theo chiều tốt của nó: *_per_sec càng cao càng tốt,
+*_ms / *_mb, errors và warmup_errors càng thấp càng tốt. Metric tệ đi quá
+--tolerance % là regression (max_ms quá nhiễu nên chỉ hiển thị). Cảnh báo
+nếu 2 lần chạy khác workload (seed, số listing, models, ...).
+
+Chạy:
+    cd ml-moderation
+    python bench/compare_results.py baseline.json results.json --tolerance 10
+"""
+
+import sys
+import json
+import argparse
+from typing import Dict, List
+
+# Các tham số quyết định workload: khác nhau thì kết quả không so được
+WORKLOAD_ARGS = (
+    'seed', 'bad_ratio', 'models_dir', 'requests', 'duration', 'warmup',
+    'http_batch_size', 'workers', 'server_threads', 'url', 'cache_size'
+)
+REPORT_ONLY = ('max_ms',)
+
+
+def flatten(report: Dict, prefix: str = '') -> Dict[str, float]:
+    """{'http': {'moderate': {'p50_ms': 1}}} -> {'http.moderate.p50_ms': 1} (bỏ meta)"""
+    flat = {}
+    for key, value in report.items():
+        if not prefix and key == 'meta':
+            continue
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def direction(path: str) -> int:
+    """+1: cao hơn là tốt, -1: thấp hơn là tốt, 0: không so"""
+    name = path.rsplit('.', 1)[-1]
+    if name.endswith('_per_sec'):
+        return 1
+    if name.endswith(('_ms', '_mb')) or name in ('errors', 'warmup_errors'):
+        return -1
+    return 0
+
+
+def workload_differences(baseline: Dict, current: Dict) -> List[str]:
+    old = baseline.get('meta', {}).get('args', {})
+    new = current.get('meta', {}).get('args', {})
+    return [
+        f'{key}: {old.get(key)} -> {new.get(key)}'
+        for key in WORKLOAD_ARGS
+        if old.get(key) != new.get(key)
+    ]
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 10.0) -> List[Dict]:
+    """Các metric có trong cả 2 report, với % thay đổi và cờ regression"""
+    old, new = flatten(baseline), flatten(current)
+    rows = []
+    for path in sorted(old.keys() & new.keys()):
+        sign = direction(path)
+        if not sign:
+            continue
+        before, after = old[path], new[path]
+        change_pct = (after - before) / before * 100 if before else (0.0 if after == before else float('inf'))
+        # Phần trăm tệ đi theo chiều của metric
+        worse_pct = -change_pct * sign
+        regression = (
+            path.rsplit('.', 1)[-1] not in REPORT_ONLY
+            and (worse_pct > tolerance if before else after * sign < before * sign)
+        )
+        rows.append({
+            'metric': path,
+            'baseline': before,
+            'current': after,
+            'change_pct': round(change_pct, 2),
+            'regression': regression
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict], file=sys.stdout):
+    width = max((len(row['metric']) for row in rows), default=10)
+    for row in rows:
+        flag = '❌' if row['regression'] else '  '
+        print(f"{flag} {row['metric']:<{width}}  {row['baseline']:>12}  {row['current']:>12}  "
+              f"{row['change_pct']:>+8.1f}%", file=file)
+    regressions = sum(row['regression'] for row in rows)
+    print(f'\n{regressions} regression / {len(rows)} metrics', file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='So sánh kết quả load_test.py')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='Mức tệ đi cho phép (%%)')
+    args = parser.parse_args()
+    
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    
+    differences = workload_differences(baseline, current)
+    if differences:
+        print('⚠️  Workload khác nhau, kết quả có thể không so được:')
+        for line in differences:
+            print(f'   {line}')
+    
+    rows = compare(baseline, current, args.tolerance)
+    print_comparison(rows)
+    if any(row['regression'] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
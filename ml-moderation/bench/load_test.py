@@ -0,0 +1,483 @@
+"""
+Load test / benchmark tổng hợp của moderation API
+
+Đo trên cùng bộ listing tổng hợp (common.synthetic_properties, theo phân
+phối của scripts/generate_sample_data.py) và ghi kết quả ra 1 file JSON để
+so sánh giữa các lần chạy (bench/compare_results.py):
+
+- inprocess: throughput của ModerationService.moderate() (1 và nhiều
+  threads) và batch_moderate() theo batch size
+- http: latency percentiles của /api/moderate và /api/moderate/batch theo
+  concurrency (mỗi client là 1 process, connection keep-alive). Server là
+  serve.py do script khởi động, hoặc server có sẵn qua --url
+- memory: RSS sau khi import, load models, chạy moderate() đến khi result
+  cache đầy, peak tracemalloc của 1 batch_moderate() (process riêng), và
+  RSS / PSS của server sau load test
+
+Result cache tắt khi đo throughput / latency (cache_size=0,
+MODERATION_CACHE_SIZE=0) để đo đúng chi phí moderation; stage memos và
+micro-batching giữ như production. Mỗi lần đo (và mỗi HTTP client) dùng
+listing chưa gửi lần nào, để inference memo của models không hit lại
+listing của lần đo trước.
+
+Chạy:
+    cd ml-moderation
+    python bench/load_test.py --output results.json
+    python bench/load_test.py --suites http --concurrency 1 8 32 --duration 20
+    python bench/load_test.py --output new.json --baseline results.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import threading
+import subprocess
+import http.client
+import multiprocessing
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+from common import API_DIR, BENCH_DIR, synthetic_properties, fit_synthetic_models, wait_ready
+from compare_results import compare, print_comparison, workload_differences
+
+SUITES = ('inprocess', 'http', 'memory')
+
+
+def latency_stats(latencies_ms) -> Dict:
+    """Percentiles latency (ms)"""
+    latencies_ms = np.asarray(latencies_ms)
+    if not len(latencies_ms):
+        return {}
+    p50, p90, p95, p99 = np.percentile(latencies_ms, [50, 90, 95, 99])
+    return {
+        'mean_ms': round(float(latencies_ms.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p90_ms': round(float(p90), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(latencies_ms.max()), 3)
+    }
+
+
+def make_service(models_dir: Optional[str], cache_size: int = 0):
+    """ModerationService với models thật (models_dir) hoặc models train trên dữ liệu tổng hợp"""
+    from moderation_service import ModerationService
+    
+    if models_dir:
+        return ModerationService(models_dir=models_dir, cache_size=cache_size)
+    service = ModerationService(models_dir='__no_models__', cache_size=cache_size)
+    fit_synthetic_models(service.ml_predictor)
+    return service
+
+
+# ==================== In-process ====================
+
+def run_moderate(service, properties: List[Dict], threads: int) -> Dict:
+    """moderate() từng property, chia đều cho `threads` threads"""
+    latencies = [[] for _ in range(threads)]
+    
+    def worker(i):
+        perf_counter = time.perf_counter
+        out = latencies[i]
+        for prop in properties[i::threads]:
+            start = perf_counter()
+            service.moderate(prop)
+            out.append((perf_counter() - start) * 1000)
+    
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    return {
+        'threads': threads,
+        'requests': len(properties),
+        'requests_per_sec': round(len(properties) / elapsed, 1),
+        **latency_stats(np.concatenate([np.asarray(l) for l in latencies]))
+    }
+
+
+def run_batch_moderate(service, properties: List[Dict], batch_size: int) -> Dict:
+    batches = [properties[i:i + batch_size] for i in range(0, len(properties), batch_size)]
+    latencies = []
+    start = time.perf_counter()
+    for batch in batches:
+        t0 = time.perf_counter()
+        service.batch_moderate(batch)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    
+    return {
+        'batch_size': batch_size,
+        'batches': len(batches),
+        'properties_per_sec': round(len(properties) / elapsed, 1),
+        **latency_stats(latencies)
+    }
+
+
+def inprocess_suite(args) -> Dict:
+    service = make_service(args.models_dir)
+    datasets = itertools.count(1)
+    
+    def fresh_properties() -> List[Dict]:
+        seed = args.seed * 1000 + next(datasets)
+        return synthetic_properties(args.requests, seed=seed, bad_ratio=args.bad_ratio)
+    
+    # Warm-up (lazy threads, stage memos, code paths của models) và phân bố
+    # decision của workload
+    warmup = fresh_properties()[:1000]
+    report = {
+        'decisions': dict(Counter(service.moderate(p)['decision'] for p in warmup)),
+        'moderate': {},
+        'batch_moderate': {}
+    }
+    for threads in args.threads:
+        run = run_moderate(service, fresh_properties(), threads)
+        report['moderate'][f'threads_{threads}'] = run
+        print(f"  moderate        threads={threads:<3} {run['requests_per_sec']:>9.1f} req/s    "
+              f"p50={run['p50_ms']:.3f}ms  p99={run['p99_ms']:.3f}ms", file=sys.stderr)
+    for batch_size in args.batch_sizes:
+        run = run_batch_moderate(service, fresh_properties(), batch_size)
+        report['batch_moderate'][f'batch_{batch_size}'] = run
+        print(f"  batch_moderate  batch={batch_size:<5} {run['properties_per_sec']:>9.1f} props/s  "
+              f"p50={run['p50_ms']:.3f}ms  p99={run['p99_ms']:.3f}ms", file=sys.stderr)
+    return report
+
+
+# ==================== HTTP ====================
+
+def _request_bodies(batch_size: int, seed: int, bad_ratio: float):
+    """Body JSON cho từng request, tạo dần theo từng lô listing mới (không lặp lại)"""
+    chunk = max(500, batch_size * 20)
+    for k in itertools.count():
+        properties = synthetic_properties(chunk, seed=seed * 100_000 + k, bad_ratio=bad_ratio)
+        if batch_size:
+            for i in range(0, chunk - batch_size + 1, batch_size):
+                yield json.dumps({'properties': properties[i:i + batch_size]}).encode('utf-8')
+        else:
+            for prop in properties:
+                yield json.dumps({'property': prop}).encode('utf-8')
+
+
+def _http_client(host: str, port: int, path: str, batch_size: int, seed: int, bad_ratio: float,
+                 warmup: float, duration: float, queue):
+    """
+    1 client: gửi request tuần tự trên 1 connection keep-alive. Latency chỉ
+    tính request thành công sau warm-up; lỗi lúc warm-up đếm riêng
+    """
+    bodies = _request_bodies(batch_size, seed, bad_ratio)
+    headers = {'Content-Type': 'application/json'}
+    
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    latencies = []
+    errors = warmup_errors = 0
+    measure_from = time.monotonic() + warmup
+    deadline = measure_from + duration
+    while True:
+        body = next(bodies)
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        start = time.perf_counter()
+        try:
+            conn.request('POST', path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+        if now < measure_from:
+            warmup_errors += not ok
+        elif ok:
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            errors += 1
+    queue.put((latencies, errors, warmup_errors))
+
+
+def run_http(host: str, port: int, path: str, batch_size: int, concurrency: int, args) -> Dict:
+    queue = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(
+            target=_http_client,
+            args=(host, port, path, batch_size, args.seed + i, args.bad_ratio,
+                  args.warmup, args.duration, queue)
+        )
+        for i in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+    results = [queue.get() for _ in clients]
+    for client in clients:
+        client.join()
+    
+    # requests / latency: chỉ các request thành công
+    latencies = np.array([lat for lats, _, _ in results for lat in lats])
+    run = {
+        'concurrency': concurrency,
+        'requests': int(len(latencies)),
+        'errors': int(sum(errors for _, errors, _ in results)),
+        'warmup_errors': int(sum(warmup_errors for _, _, warmup_errors in results)),
+        'requests_per_sec': round(len(latencies) / args.duration, 1)
+    }
+    if batch_size:
+        run['batch_size'] = batch_size
+        run['properties_per_sec'] = round(len(latencies) * batch_size / args.duration, 1)
+    run.update(latency_stats(latencies))
+    return run
+
+
+def _get_json(host: str, port: int, path: str) -> Dict:
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request('GET', path)
+    return json.loads(conn.getresponse().read())
+
+
+def http_suite(args) -> Dict:
+    server = None
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        env = dict(
+            os.environ,
+            ML_WORKERS=str(args.workers),
+            ML_THREADS=str(args.server_threads),
+            ML_PORT=str(port),
+            MODERATION_CACHE_SIZE='0'
+        )
+        server = subprocess.Popen(
+            [sys.executable, 'serve.py'], cwd=API_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    
+    try:
+        wait_ready(port, host=host)
+        health = _get_json(host, port, '/api/health')
+        report = {
+            'server': {
+                'url': args.url or f'http://{host}:{port}',
+                'workers': None if args.url else args.workers,
+                'threads': None if args.url else args.server_threads,
+                'models_loaded': health.get('models_loaded'),
+                'model_version': health.get('models', {}).get('version')
+            },
+            'moderate': {},
+            'batch': {}
+        }
+        
+        for concurrency in args.concurrency:
+            run = run_http(host, port, '/api/moderate', 0, concurrency, args)
+            report['moderate'][f'concurrency_{concurrency}'] = run
+            print(f"  /api/moderate        c={concurrency:<3} {run['requests_per_sec']:>8.1f} req/s  "
+                  f"p50={run.get('p50_ms', np.nan):.2f}ms  p99={run.get('p99_ms', np.nan):.2f}ms  "
+                  f"errors={run['errors']} (warm-up {run['warmup_errors']})",
+                  file=sys.stderr)
+        
+        for concurrency in args.concurrency:
+            run = run_http(host, port, '/api/moderate/batch', args.http_batch_size, concurrency, args)
+            report['batch'][f'concurrency_{concurrency}'] = run
+            print(f"  /api/moderate/batch  c={concurrency:<3} {run['properties_per_sec']:>8.1f} props/s  "
+                  f"p50={run.get('p50_ms', np.nan):.2f}ms  p99={run.get('p99_ms', np.nan):.2f}ms  "
+                  f"errors={run['errors']} (warm-up {run['warmup_errors']})",
+                  file=sys.stderr)
+        
+        if server is not None:
+            report['server_memory'] = process_tree_memory(server.pid)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=60)
+    return report
+
+
+# ==================== Memory ====================
+
+def current_rss_mb() -> float:
+    """RSS hiện tại của process (MB); ngoài Linux dùng peak RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss: KB trên Linux, bytes trên macOS
+        return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+def process_tree_memory(pid: int) -> Optional[Dict]:
+    """
+    RSS và PSS (MB) của process và các process con (gunicorn master +
+    workers). RSS tính trùng các page dùng chung sau fork, PSS chia đều
+    chúng cho các process. Chỉ có trên Linux.
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Field 4 (ppid) nằm sau tên process trong ngoặc
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack.extend(children.get(current, []))
+    
+    rss_kb = pss_kb = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Rss:'):
+                        rss_kb += int(line.split()[1])
+                    elif line.startswith('Pss:'):
+                        pss_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return {
+        'processes': len(pids),
+        'rss_mb': round(rss_kb / 1024, 1),
+        'pss_mb': round(pss_kb / 1024, 1)
+    }
+
+
+def _memory_probe(args, queue):
+    """Chạy trong process mới (spawn) để RSS không lẫn với các suite khác"""
+    import tracemalloc
+    
+    report = {'python_numpy_rss_mb': current_rss_mb()}
+    import moderation_service  # noqa: F401 (sklearn / xgboost / api modules)
+    report['imports_rss_mb'] = current_rss_mb()
+    
+    # Result cache theo mặc định production để đo cả memory của cache đầy
+    service = make_service(args.models_dir, cache_size=args.cache_size)
+    report['models_rss_mb'] = current_rss_mb()
+    
+    properties = synthetic_properties(
+        max(args.cache_size * 2, 2000), seed=args.seed, bad_ratio=args.bad_ratio
+    )
+    for prop in properties:
+        service.moderate(prop)
+    report['cache_entries'] = service.result_cache.stats().get('size')
+    report['after_moderate_rss_mb'] = current_rss_mb()
+    
+    batch_size = max(args.batch_sizes)
+    tracemalloc.start()
+    service.batch_moderate(properties[:batch_size])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report[f'batch_{batch_size}_peak_alloc_mb'] = round(peak / 2**20, 2)
+    report['final_rss_mb'] = current_rss_mb()
+    queue.put(report)
+
+
+def memory_suite(args) -> Dict:
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    probe = ctx.Process(target=_memory_probe, args=(args, queue))
+    probe.start()
+    report = queue.get()
+    probe.join()
+    for key, value in report.items():
+        print(f'  {key:<32} {value}', file=sys.stderr)
+    return report
+
+
+# ==================== Main ====================
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test và benchmark latency của moderation API')
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--bad-ratio', type=float, default=0.1,
+                        help='Tỉ lệ listing bị làm hỏng (spam, giá lệch, thiếu ảnh)')
+    parser.add_argument('--models-dir', help='Dùng models đã train thay vì models tổng hợp (inprocess, memory)')
+    # inprocess
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 100])
+    # http
+    parser.add_argument('--url', help='Test server có sẵn (vd http://127.0.0.1:5000) thay vì khởi động serve.py')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--server-threads', type=int, default=1)
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--duration', type=float, default=10.0, help='Giây đo cho mỗi endpoint / concurrency')
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--http-batch-size', type=int, default=20)
+    # memory
+    parser.add_argument('--cache-size', type=int, default=1024)
+    # output
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    parser.add_argument('--baseline', help='File kết quả trước đó để so sánh (exit 1 nếu có regression)')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='Mức tệ đi cho phép (%%)')
+    args = parser.parse_args()
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'args': vars(args)
+        }
+    }
+    for suite, run in (('inprocess', inprocess_suite), ('http', http_suite), ('memory', memory_suite)):
+        if suite in args.suites:
+            print(f'[{suite}]', file=sys.stderr)
+            report[suite] = run(args)
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for line in workload_differences(baseline, report):
+            print(f'⚠️  Workload khác baseline: {line}', file=sys.stderr)
+        rows = compare(baseline, report, args.tolerance)
+        print_comparison(rows, file=sys.stderr)
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
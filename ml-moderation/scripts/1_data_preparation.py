@@ -1,27 +1,83 @@
 """
 Data Preparation Script
 Kết nối MongoDB và chuẩn bị dữ liệu training cho ML models
+
+Chạy theo luồng (bộ nhớ không tăng theo số properties):
+- Đọc MongoDB bằng cursor theo batch, chỉ lấy các field features cần (projection)
+- Extract features theo cột cho từng chunk, ghi vào feature store
+  (data/feature_store/, xem feature_store.py)
+- Từ feature store: bỏ outliers (IQR, chỉ đọc cột price để tính ngưỡng) rồi
+  ghi dataset training data/training_data/ (nhiều part-*.parquet)
+
+--incremental: chỉ đọc documents mới/đổi từ lần chạy trước (high-water mark
+theo updatedAt/_id), upsert vào feature store, tombstone properties bị xoá
+hoặc không còn được duyệt. Properties bị xoá được lấy từ change stream (event
+delete từ resume token của lần trước); quét toàn bộ _id chỉ khi
+--full-delete-scan. Thời gian đọc MongoDB + extract tỉ lệ với số documents
+thay đổi thay vì cả collection; training_data/ chỉ ghi lại các bucket đổi.
+
+Chạy:
+    python 1_data_preparation.py [--batch-size 5000]
+    python 1_data_preparation.py --incremental
+    python 1_data_preparation.py --incremental --full-delete-scan  (MongoDB standalone)
+    python 1_data_preparation.py --from-json properties.json  (JSON array / mongoexport)
 """
 
 import os
 import sys
 import json
+import shutil
+import argparse
+import itertools
+from collections import Counter
 import pandas as pd
 import numpy as np
-from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime, timedelta
+from bson import json_util
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from feature_schema import FEATURE_SCHEMA, PREP_COLUMNS, SCHEMA_VERSION
+from feature_store import FeatureStore, KEY
+
+PREP_EXTRACTOR = FEATURE_SCHEMA.compile(PREP_COLUMNS)
+
+# Schema cố định cho mọi part file (chunk nào cũng cùng kiểu cột)
+ARROW_SCHEMA = pa.schema([
+    (name, pa.float64() if FEATURE_SCHEMA.features[name].numeric else pa.string())
+    for name in PREP_COLUMNS
+])
+
+# Thông tin từng part của training_data/ (pd.read_parquet bỏ qua file bắt đầu bằng '_')
+PARTS_FILE = '_parts.json'
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+DATASET_DIR = os.path.join(DATA_DIR, 'training_data')
+STORE_DIR = os.path.join(DATA_DIR, 'feature_store')
+
+# Properties dùng để train: đã duyệt và có giá
+PROPERTY_QUERY = {
+    'status': {'$in': ['available', 'rented']},  # Chỉ lấy properties đã approved
+    'price': {'$gt': 0}
+}
+
+# Change stream chỉ lấy event xoá property (tombstone khi --incremental)
+DELETE_EVENTS = [{'$match': {'operationType': 'delete'}}]
+
+# Incremental: đọc lùi lại từ high-water mark để không sót documents được
+# ghi trong lúc lần chạy trước đang đọc (upsert lại cùng document không sao)
+HWM_LOOKBACK = timedelta(minutes=10)
+
 # Load environment variables
 load_dotenv()
 
 # MongoDB connection
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/QLChoThueTro')
 
-print("=" * 80)
-print("DATA PREPARATION FOR ML MODERATION")
-print("=" * 80)
-
 def connect_mongodb():
     """Kết nối MongoDB"""
     try:
@@ -33,184 +89,478 @@ def connect_mongodb():
         print(f"\n✗ Lỗi kết nối MongoDB: {e}")
         sys.exit(1)
 
-def fetch_properties(db):
-    """Lấy dữ liệu properties từ MongoDB"""
+def _chunks(documents, size):
+    """Chia iterator documents thành các list tối đa size phần tử"""
+    iterator = iter(documents)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def is_trainable(doc):
+    """Document thoả PROPERTY_QUERY (đã duyệt, có giá)"""
+    price = doc.get('price')
+    return (
+        doc.get('status') in PROPERTY_QUERY['status']['$in']
+        and isinstance(price, (int, float)) and price > 0
+    )
+
+def delta_query(high_water_mark):
+    """
+    Documents mới hoặc đã đổi kể từ high-water mark: updatedAt >= mốc
+    (lùi HWM_LOOKBACK), documents không có updatedAt thì theo _id
+    """
+    clauses = []
+    if high_water_mark.get('updated_at') is not None:
+        clauses.append({'updatedAt': {'$gte': high_water_mark['updated_at'] - HWM_LOOKBACK}})
+    if high_water_mark.get('id') is not None:
+        clauses.append({'updatedAt': None, '_id': {'$gt': high_water_mark['id']}})
+    return {'$or': clauses} if clauses else {}
+
+def advance_high_water_mark(high_water_mark, properties):
+    """Cập nhật mốc (updatedAt, _id) lớn nhất đã đọc"""
+    for doc in properties:
+        updated_at = doc.get('updatedAt')
+        if isinstance(updated_at, datetime):
+            current = high_water_mark.get('updated_at')
+            if current is None or updated_at > current:
+                high_water_mark['updated_at'] = updated_at
+        doc_id = doc.get('_id')
+        current = high_water_mark.get('id')
+        if doc_id is not None and (current is None or (type(doc_id) is type(current) and doc_id > current)):
+            high_water_mark['id'] = doc_id
+
+def fetch_properties(db, batch_size=5000, query=PROPERTY_QUERY):
+    """
+    Đọc properties từ MongoDB theo từng chunk batch_size documents
+    
+    Cursor lấy batch_size documents mỗi lần round-trip và chỉ trả về các
+    field mà PREP_COLUMNS cần (+ status/updatedAt), không giữ cả collection
+    trong bộ nhớ.
+    """
+    projection = {path: 1 for path in PREP_EXTRACTOR.source_paths() + ['status', 'updatedAt']}
+    cursor = db.properties.find(query, projection, batch_size=batch_size)
+    try:
+        yield from _chunks(cursor, batch_size)
+    finally:
+        cursor.close()
+
+def fetch_deleted_ids(db, store, batch_size=5000):
+    """
+    property_id còn trong feature store nhưng đã bị xoá khỏi MongoDB
+    (so tập _id, cursor chỉ đọc _id; tỉ lệ với cả collection)
+    """
+    cursor = db.properties.find({}, {'_id': 1}, batch_size=batch_size)
     try:
-        properties = list(db.properties.find({
-            'status': {'$in': ['available', 'rented']},  # Chỉ lấy properties đã approved
-            'price': {'$gt': 0}
-        }))
-        print(f"✓ Đã lấy {len(properties)} properties từ database")
-        return properties
-    except Exception as e:
-        print(f"✗ Lỗi lấy dữ liệu: {e}")
+        mongo_ids = {str(doc['_id']) for doc in cursor}
+    finally:
+        cursor.close()
+    deleted = []
+    for df in store.iter_buckets(columns=[KEY]):
+        deleted.extend(key for key in df[KEY] if key not in mongo_ids)
+    return deleted
+
+def delete_stream_token(db):
+    """
+    Resume token hiện tại của change stream các event xoá, None nếu MongoDB
+    không có change stream (standalone, không phải replica set)
+    """
+    try:
+        with db.properties.watch(DELETE_EVENTS) as stream:
+            return stream.resume_token
+    except OperationFailure as e:
+        print(f"  ⚠️ Không mở được change stream: {e}")
+        return None
+
+def fetch_deleted_ids_since(db, resume_token, max_await_ms=1000):
+    """
+    property_id bị xoá từ resume_token (đọc event delete của change stream,
+    tỉ lệ với số lần xoá) và resume token mới
+    
+    Raises:
+        OperationFailure: token không dùng được nữa (event đã ra khỏi oplog)
+    """
+    deleted = []
+    with db.properties.watch(DELETE_EVENTS, resume_after=resume_token, max_await_time_ms=max_await_ms) as stream:
+        while True:
+            change = stream.try_next()
+            if change is None:
+                return deleted, stream.resume_token
+            deleted.append(str(change['documentKey']['_id']))
+
+def find_deleted_ids(db, store, high_water_mark, batch_size=5000, full_scan=False):
+    """
+    property_id bị xoá khỏi MongoDB từ lần chạy trước, cập nhật
+    high_water_mark['delete_token']
+    
+    Mặc định đọc change stream từ token đã lưu. Quét toàn bộ _id khi
+    full_scan, hoặc 1 lần khi chưa có token / token đã hết hạn. MongoDB
+    standalone (không có change stream) chỉ phát hiện được khi full_scan.
+    """
+    token = high_water_mark.get('delete_token')
+    if token is not None and not full_scan:
+        try:
+            deleted, high_water_mark['delete_token'] = fetch_deleted_ids_since(db, token)
+            return deleted
+        except OperationFailure as e:
+            print(f"  ⚠️ Không đọc được change stream từ token đã lưu ({e}), quét toàn bộ _id 1 lần")
+    
+    # Token mới lấy trước khi quét: xoá trong lúc quét sẽ có ở lần chạy sau
+    high_water_mark['delete_token'] = delete_stream_token(db)
+    if high_water_mark['delete_token'] is None and not full_scan:
+        print("  ⚠️ Không phát hiện được properties bị xoá (cần replica set), "
+              "chạy --full-delete-scan định kỳ")
         return []
+    return fetch_deleted_ids(db, store, batch_size)
+
+def fetch_properties_json(path, batch_size=5000):
+    """
+    Đọc properties từ file JSON (array) hoặc JSON lines (mongoexport),
+    lọc giống PROPERTY_QUERY. Dùng để chạy thử không cần MongoDB.
+    """
+    def documents():
+        with open(path, encoding='utf-8') as f:
+            first = f.read(1)
+            while first.isspace():
+                first = f.read(1)
+            f.seek(0)
+            if first == '[':
+                yield from json_util.loads(f.read())
+            else:
+                yield from (json_util.loads(line) for line in f if line.strip())
+    
+    yield from _chunks((doc for doc in documents() if is_trainable(doc)), batch_size)
 
 def extract_features(properties):
-    """Extract features từ properties"""
-    data = []
+    """
+    Extract features từ 1 chunk properties
     
+    Cách tính từng cột khai báo trong api/feature_schema.py (dùng chung với API)
+    """
+    try:
+        return PREP_EXTRACTOR.frame(properties)
+    except Exception:
+        pass
+    
+    # Có document lỗi: extract từng document để bỏ qua document đó
+    frames = []
     for prop in properties:
         try:
-            # Location - hỗ trợ cả schema cũ và mới
-            address = prop.get('address', {})
-            province = address.get('city', prop.get('location', {}).get('province', ''))
-            district = address.get('district', prop.get('location', {}).get('district', ''))
-            
-            # Simple encoding (nên dùng LabelEncoder trong production)
-            province_map = {
-                'Hồ Chí Minh': 1, 'Hà Nội': 2, 'Đà Nẵng': 3,
-                'Cần Thơ': 4, 'Hải Phòng': 5, 'Bình Dương': 6,
-                'Đồng Nai': 7, 'Khánh Hòa': 8, 'Lâm Đồng': 9, 'Quảng Nam': 10
-            }
-            province_encoded = province_map.get(province, 0)
-            district_encoded = hash(district) % 100  # Temporary encoding
-            
-            # Amenities - hỗ trợ cả schema cũ và mới
-            amenities = prop.get('amenities', {})
-            
-            features = {
-                # ID
-                'property_id': str(prop.get('_id')),
-                
-                # Price (target)
-                'price': prop.get('price', 0),
-                
-                # Location
-                'province': province,
-                'district': district,
-                'province_encoded': province_encoded,
-                'district_encoded': district_encoded,
-                
-                # Property details
-                'area': prop.get('area', 0),
-                'bedrooms': prop.get('bedrooms', 1),
-                'bathrooms': prop.get('bathrooms', 1),
-                'floor': prop.get('floor', 1),
-                
-                # Amenities (binary) - hỗ trợ cả tên cũ và mới
-                'has_wifi': 1 if amenities.get('wifi', amenities.get('hasWifi')) else 0,
-                'has_parking': 1 if amenities.get('parking', amenities.get('hasParking')) else 0,
-                'has_air_conditioner': 1 if amenities.get('ac', amenities.get('hasAirConditioner')) else 0,
-                'has_water_heater': 1 if amenities.get('water', amenities.get('hasWaterHeater')) else 0,
-                'has_kitchen': 1 if amenities.get('kitchen', amenities.get('hasKitchen')) else 0,
-                'has_fridge': 1 if amenities.get('fridge', amenities.get('hasFridge')) else 0,
-                'has_washing_machine': 1 if amenities.get('washing', amenities.get('hasWashingMachine')) else 0,
-                'has_tv': 1 if amenities.get('tv', amenities.get('hasTV')) else 0,
-                'has_bed': 1 if amenities.get('bed', amenities.get('hasBed')) else 0,
-                'has_wardrobe': 1 if amenities.get('wardrobe', amenities.get('hasWardrobe')) else 0,
-            }
-            
-            data.append(features)
-            
+            frames.append(PREP_EXTRACTOR.frame([prop]))
         except Exception as e:
             print(f"  Warning: Lỗi xử lý property {prop.get('_id')}: {e}")
-            continue
-    
-    return pd.DataFrame(data)
+    if not frames:
+        return pd.DataFrame(columns=PREP_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
 
-def clean_data(df):
-    """Làm sạch dữ liệu"""
-    print(f"\nBước 1: Dữ liệu ban đầu: {len(df)} records")
-    
-    # Remove missing values
-    df = df.dropna(subset=['price', 'area', 'bedrooms'])
-    print(f"Bước 2: Sau khi bỏ missing values: {len(df)} records")
-    
-    # Remove outliers (IQR method)
-    Q1 = df['price'].quantile(0.25)
-    Q3 = df['price'].quantile(0.75)
+def drop_missing(df):
+    """Bỏ records thiếu price/area/bedrooms (lọc được theo từng chunk)"""
+    return df.dropna(subset=['price', 'area', 'bedrooms'])
+
+def price_bounds(prices):
+    """Khoảng giá hợp lệ theo IQR trên toàn bộ dữ liệu"""
+    Q1, Q3 = np.quantile(prices, [0.25, 0.75])
     IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+def clean_data(df, lower_bound, upper_bound):
+    """Bỏ outliers (IQR) và giá trị không hợp lệ của 1 chunk"""
     df = df[(df['price'] >= lower_bound) & (df['price'] <= upper_bound)]
-    print(f"Bước 3: Sau khi bỏ outliers: {len(df)} records")
+    outlier_count = len(df)
     
-    # Remove invalid values
     df = df[df['area'] > 0]
     df = df[df['price'] > 0]
     df = df[df['bedrooms'] > 0]
-    print(f"Bước 4: Sau khi bỏ invalid values: {len(df)} records")
+    return df, outlier_count
+
+def part_path(directory, index):
+    return os.path.join(directory, f'part-{index:05d}.parquet')
+
+def write_part(df, directory, index):
+    """Ghi 1 chunk thành 1 part file của dataset"""
+    table = pa.Table.from_pandas(df[PREP_COLUMNS], schema=ARROW_SCHEMA, preserve_index=False)
+    path = part_path(directory, index)
+    pq.write_table(table, path)
+    return path
+
+def part_stats(df, after_outliers):
+    """Thống kê của 1 part (lưu trong PARTS_FILE để dùng lại khi part không đổi)"""
+    stats = {'after_outliers': after_outliers, 'records': len(df)}
+    if len(df):
+        stats.update({
+            'area_sum': float(df['area'].sum()),
+            'area_min': float(df['area'].min()),
+            'area_max': float(df['area'].max()),
+            'provinces': {str(name): int(count) for name, count in df['province'].value_counts().items()}
+        })
+    return stats
+
+def load_parts(directory):
+    """PARTS_FILE của dataset cũ, {} nếu không có (dataset cũ hơn / chưa có)"""
+    try:
+        with open(os.path.join(directory, PARTS_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def same_rows_kept(prices, old_bounds, new_bounds):
+    """Các giá trong prices được giữ / bỏ (IQR) như nhau theo ngưỡng cũ và mới"""
+    (old_lo, old_hi), (new_lo, new_hi) = old_bounds, new_bounds
+    return np.array_equal((prices >= old_lo) & (prices <= old_hi), (prices >= new_lo) & (prices <= new_hi))
+
+def reuse_part(previous_dir, output_dir, index):
+    """Đưa part không đổi của dataset cũ sang dataset mới (hard link, không ghi lại)"""
+    source, target = part_path(previous_dir, index), part_path(output_dir, index)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+    return target
+
+def load_into_store(chunks, store, high_water_mark):
+    """
+    Extract từng chunk và ghi vào feature store: property hợp lệ -> upsert,
+    property không còn được duyệt / thiếu price, area, bedrooms / lỗi
+    extract -> tombstone (xoá bản cũ trong store nếu có)
     
-    return df
+    Returns:
+        (số properties đã đọc, số upserts, số tombstones)
+    """
+    fetched = upserted = deleted = 0
+    for index, properties in enumerate(chunks):
+        df = drop_missing(extract_features([doc for doc in properties if is_trainable(doc)]))
+        keys = {str(doc['_id']) for doc in properties if doc.get('_id') is not None}
+        tombstones = sorted(keys - set(df[KEY]))
+        store.write(df, tombstones)
+        advance_high_water_mark(high_water_mark, properties)
+        
+        fetched += len(properties)
+        upserted += len(df)
+        deleted += len(tombstones)
+        print(f"  Chunk {index + 1}: {len(properties)} properties → {len(df)} upserts, {len(tombstones)} tombstones")
+    return fetched, upserted, deleted
 
-def save_data(df):
-    """Lưu dữ liệu"""
-    # Create output directory
-    output_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
-    os.makedirs(output_dir, exist_ok=True)
+def finalize_dataset(store, output_dir, previous_dir=None):
+    """
+    Từ feature store: bỏ outliers theo IQR của toàn bộ giá (lượt 1 chỉ đọc
+    cột price) và giá trị không hợp lệ, ghi mỗi bucket thành 1 part của
+    output_dir
+    
+    previous_dir (incremental): dataset cũ. Bucket không có file mới trong
+    store và không có giá nào đổi giữ / bỏ theo ngưỡng IQR mới thì dùng lại
+    part cũ thay vì đọc cả bucket và ghi lại.
     
-    # Save CSV
-    csv_path = os.path.join(output_dir, 'training_data.csv')
-    df.to_csv(csv_path, index=False)
-    print(f"\n✓ Đã lưu CSV: {csv_path}")
+    Returns:
+        Dict thống kê dataset cuối cùng
+    """
+    os.makedirs(output_dir)
+    bucket_prices = [df['price'].to_numpy(dtype=float) for df in store.iter_buckets(columns=['price'])]
+    prices = np.concatenate(bucket_prices)
+    stats = {
+        'store_records': len(prices), 'after_outliers': 0, 'records': 0,
+        'area_sum': 0.0, 'area_min': np.inf, 'area_max': -np.inf
+    }
+    if not len(prices):
+        stats['prices'] = pd.Series(prices)
+        stats['provinces'] = Counter()
+        return stats
+    lower_bound, upper_bound = price_bounds(prices)
+    del prices
     
-    # Save summary
+    previous = load_parts(previous_dir) if previous_dir else {}
+    parts = {'bounds': [lower_bound, upper_bound], 'buckets': {}}
+    kept_prices = []
+    provinces = Counter()
+    reused = 0
+    for index in range(store.buckets):
+        signature = store.bucket_signature(index)
+        old = previous.get('buckets', {}).get(str(index))
+        if (old is not None and old['signature'] == signature
+                and same_rows_kept(bucket_prices[index], previous['bounds'], (lower_bound, upper_bound))):
+            part = old['stats']
+            if part['records']:
+                path = reuse_part(previous_dir, output_dir, index)
+                kept_prices.append(pq.read_table(path, columns=['price']).column('price').to_numpy())
+            reused += 1
+        else:
+            df, after_outliers = clean_data(store.read_bucket(index), lower_bound, upper_bound)
+            part = part_stats(df, after_outliers)
+            if len(df):
+                write_part(df, output_dir, index)
+                kept_prices.append(df['price'].to_numpy())
+        parts['buckets'][str(index)] = {'signature': signature, 'stats': part}
+        
+        stats['after_outliers'] += part['after_outliers']
+        if not part['records']:
+            continue
+        stats['records'] += part['records']
+        stats['area_sum'] += part['area_sum']
+        stats['area_min'] = min(stats['area_min'], part['area_min'])
+        stats['area_max'] = max(stats['area_max'], part['area_max'])
+        provinces.update(part['provinces'])
+    
+    with open(os.path.join(output_dir, PARTS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(parts, f, ensure_ascii=False)
+    if previous_dir:
+        print(f"  Dùng lại {reused}/{store.buckets} parts của dataset cũ")
+    
+    prices = np.concatenate(kept_prices) if kept_prices else np.array([])
+    stats['prices'] = pd.Series(prices)
+    stats['provinces'] = provinces
+    return stats
+
+def replace_dataset(new_dir, dataset_dir):
+    """Thay dataset cũ bằng dataset mới (đổi tên thư mục, xoá bản cũ sau cùng)"""
+    old_dir = dataset_dir + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(dataset_dir):
+        os.rename(dataset_dir, old_dir)
+    os.rename(new_dir, dataset_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def save_summary(stats):
+    """Lưu thống kê của dataset"""
+    prices = stats['prices']
     summary = {
-        'total_records': len(df),
-        'features': df.columns.tolist(),
+        'total_records': stats['records'],
+        'features': list(PREP_COLUMNS),
+        'format': 'parquet',
+        'schema_version': SCHEMA_VERSION,
         'price_stats': {
-            'mean': float(df['price'].mean()),
-            'median': float(df['price'].median()),
-            'min': float(df['price'].min()),
-            'max': float(df['price'].max()),
-            'std': float(df['price'].std())
+            'mean': float(prices.mean()),
+            'median': float(prices.median()),
+            'min': float(prices.min()),
+            'max': float(prices.max()),
+            'std': float(prices.std())
         },
         'created_at': datetime.now().isoformat()
     }
     
-    summary_path = os.path.join(output_dir, 'data_summary.json')
+    summary_path = os.path.join(DATA_DIR, 'data_summary.json')
     with open(summary_path, 'w', encoding='utf-8') as f:
         json.dump(summary, f, indent=2, ensure_ascii=False)
     print(f"✓ Đã lưu summary: {summary_path}")
-    
-    return csv_path
 
-def main():
-    print("\n[1/4] Kết nối MongoDB...")
-    db = connect_mongodb()
+def prepare_dataset(batch_size=5000, incremental=False, skip_delete_check=False, from_json=None,
+                    full_delete_scan=False):
+    """
+    Chạy toàn bộ data preparation: MongoDB (hoặc file JSON) -> feature store
+    -> data/training_data/
+    
+    Returns:
+        Dict thống kê dataset (xem finalize_dataset)
+    """
+    store = FeatureStore(STORE_DIR, ARROW_SCHEMA, SCHEMA_VERSION)
+    if incremental and from_json:
+        print("\n✗ --incremental cần MongoDB (không dùng với --from-json)")
+        sys.exit(1)
+    if incremental and not store.exists:
+        print("\n⚠️ Chưa có feature store, chạy full rebuild")
+        incremental = False
+    elif incremental and store.state['schema_version'] != SCHEMA_VERSION:
+        print(f"\n⚠️ Feature store dùng feature schema v{store.state['schema_version']}, "
+              f"hiện tại là v{SCHEMA_VERSION}: chạy full rebuild")
+        incremental = False
     
-    print("\n[2/4] Lấy dữ liệu properties...")
-    properties = fetch_properties(db)
+    if from_json:
+        print(f"\n[1/4] Đọc properties từ {from_json}")
+        chunks = fetch_properties_json(from_json, batch_size)
+    else:
+        print("\n[1/4] Kết nối MongoDB...")
+        db = connect_mongodb()
+        if incremental:
+            high_water_mark = dict(store.high_water_mark)
+            print(f"✓ Incremental từ high-water mark: {high_water_mark}")
+            chunks = fetch_properties(db, batch_size, query=delta_query(high_water_mark))
+        else:
+            chunks = fetch_properties(db, batch_size)
+    if not incremental:
+        store.reset()
+        high_water_mark = {}
+        if not from_json:
+            # Mốc của change stream trước khi đọc: xoá trong lúc đọc có ở lần incremental sau
+            high_water_mark['delete_token'] = delete_stream_token(db)
     
-    if len(properties) == 0:
+    print(f"\n[2/4] Extract features theo chunk ({batch_size} properties)...")
+    run = store.begin()
+    fetched, upserted, deleted = load_into_store(chunks, store, high_water_mark)
+    if incremental and not skip_delete_check:
+        deleted_ids = find_deleted_ids(db, store, high_water_mark, batch_size, full_delete_scan)
+        store.write(pd.DataFrame(columns=PREP_COLUMNS), deleted_ids)
+        deleted += len(deleted_ids)
+        print(f"  Đã xoá khỏi MongoDB: {len(deleted_ids)} properties")
+    store.commit(high_water_mark)
+    print(f"✓ Run {run} ({'incremental' if incremental else 'full'}): {fetched} properties, "
+          f"{upserted} upserts, {deleted} tombstones")
+    
+    print("\n[3/4] Clean features...")
+    os.makedirs(DATA_DIR, exist_ok=True)
+    new_dir = DATASET_DIR + '.new'
+    shutil.rmtree(new_dir, ignore_errors=True)
+    stats = finalize_dataset(store, new_dir, DATASET_DIR if incremental else None)
+    
+    print(f"\nBước 1: Feature store: {stats['store_records']} records")
+    print(f"Bước 2: Sau khi bỏ outliers: {stats['after_outliers']} records")
+    print(f"Bước 3: Sau khi bỏ invalid values: {stats['records']} records")
+    if stats['records'] == 0:
+        shutil.rmtree(new_dir, ignore_errors=True)
         print("\n✗ Không có dữ liệu để xử lý!")
         sys.exit(1)
     
-    print("\n[3/4] Extract và clean features...")
-    df = extract_features(properties)
-    print(f"✓ Đã extract {len(df)} records")
-    print(f"✓ Số features: {len(df.columns)}")
+    print("\n[4/4] Lưu dữ liệu...")
+    replace_dataset(new_dir, DATASET_DIR)
+    print(f"\n✓ Đã lưu dataset: {DATASET_DIR}")
+    save_summary(stats)
+    return stats
+
+def main():
+    print("=" * 80)
+    print("DATA PREPARATION FOR ML MODERATION")
+    print("=" * 80)
     
-    df = clean_data(df)
+    parser = argparse.ArgumentParser(description='Chuẩn bị dữ liệu training')
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help='Số documents mỗi batch cursor / chunk extract')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Chỉ xử lý documents mới/đổi từ lần chạy trước')
+    parser.add_argument('--skip-delete-check', action='store_true',
+                        help='Incremental: không tìm properties đã bị xoá khỏi MongoDB')
+    parser.add_argument('--full-delete-scan', action='store_true',
+                        help='Incremental: tìm properties bị xoá bằng cách so toàn bộ _id '
+                             '(thay cho change stream, dùng với MongoDB standalone)')
+    parser.add_argument('--from-json', metavar='PATH',
+                        help='Đọc properties từ file JSON thay vì MongoDB (full rebuild)')
+    args = parser.parse_args()
     
-    print("\n[4/4] Lưu dữ liệu...")
-    csv_path = save_data(df)
+    stats = prepare_dataset(args.batch_size, args.incremental, args.skip_delete_check, args.from_json,
+                            args.full_delete_scan)
     
     # Display statistics
+    prices = stats['prices']
     print("\n" + "=" * 80)
     print("THỐNG KÊ DỮ LIỆU")
     print("=" * 80)
-    print(f"\nTổng số records: {len(df)}")
-    print(f"Số features: {len(df.columns)}")
+    print(f"\nTổng số records: {stats['records']}")
+    print(f"Số features: {len(PREP_COLUMNS)}")
     print(f"\nGiá thuê:")
-    print(f"  - Trung bình: {df['price'].mean():,.0f} VNĐ")
-    print(f"  - Trung vị: {df['price'].median():,.0f} VNĐ")
-    print(f"  - Min: {df['price'].min():,.0f} VNĐ")
-    print(f"  - Max: {df['price'].max():,.0f} VNĐ")
+    print(f"  - Trung bình: {prices.mean():,.0f} VNĐ")
+    print(f"  - Trung vị: {prices.median():,.0f} VNĐ")
+    print(f"  - Min: {prices.min():,.0f} VNĐ")
+    print(f"  - Max: {prices.max():,.0f} VNĐ")
     
     print(f"\nDiện tích:")
-    print(f"  - Trung bình: {df['area'].mean():.1f} m²")
-    print(f"  - Min: {df['area'].min():.0f} m²")
-    print(f"  - Max: {df['area'].max():.0f} m²")
+    print(f"  - Trung bình: {stats['area_sum'] / stats['records']:.1f} m²")
+    print(f"  - Min: {stats['area_min']:.0f} m²")
+    print(f"  - Max: {stats['area_max']:.0f} m²")
     
     print(f"\nTop 5 tỉnh/thành:")
-    print(df['province'].value_counts().head())
+    for province, count in stats['provinces'].most_common(5):
+        print(f"  - {province}: {count}")
     
     print("\n" + "=" * 80)
     print(f"✓ HOÀN TẤT! Dữ liệu đã được lưu tại:")
-    print(f"  {csv_path}")
+    print(f"  {DATASET_DIR}")
     print("=" * 80)
     print("\n→ Bước tiếp theo: Chạy script 2_train_price_model.py")
 
@@ -6,74 +6,64 @@ Train XGBoost model để dự đoán giá thuê
 import os
 import sys
 import json
+import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
-from sklearn.model_selection import train_test_split, GridSearchCV, cross_val_score
+from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import xgboost as xgb
 import joblib
 
-# Cấu hình
-plt.style.use('ggplot')
-sns.set_palette('husl')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from model_bundle import save_bundle
+from feature_schema import FEATURE_SCHEMA, PRICE_FEATURES, SCHEMA_VERSION
+from price_tuning import TUNING_STRATEGIES, MAX_ROUNDS, EARLY_STOPPING_ROUNDS, tune
+from run_cache import RunCache, fingerprint
+from reports import REPORT_MODES, run_report
 
-print("=" * 80)
-print("PRICE PREDICTION MODEL TRAINING (XGBoost)")
-print("=" * 80)
+PRICE_EXTRACTOR = FEATURE_SCHEMA.compile(PRICE_FEATURES)
 
 def load_data():
     """Load training data"""
-    data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'training_data.csv')
+    data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'training_data')
     
     if not os.path.exists(data_path):
-        print(f"\n✗ Không tìm thấy file: {data_path}")
+        print(f"\n✗ Không tìm thấy dataset: {data_path}")
         print("→ Chạy script 1_data_preparation.py trước!")
         sys.exit(1)
     
-    df = pd.read_csv(data_path)
+    df = pd.read_parquet(data_path)
     print(f"\n✓ Đã load {len(df)} records từ {data_path}")
+    
+    # training_data phải được tạo bằng cùng feature schema (encodings)
+    summary_path = os.path.join(os.path.dirname(data_path), 'data_summary.json')
+    schema_version = None
+    if os.path.exists(summary_path):
+        with open(summary_path, encoding='utf-8') as f:
+            schema_version = json.load(f).get('schema_version')
+    if schema_version != SCHEMA_VERSION:
+        print(f"\n✗ training_data được tạo bằng feature schema v{schema_version}, "
+              f"hiện tại là v{SCHEMA_VERSION}")
+        print("→ Chạy lại script 1_data_preparation.py!")
+        sys.exit(1)
     return df
 
 def feature_engineering(df):
-    """Tạo thêm features"""
+    """Tạo thêm features (derived features của api/feature_schema.py)"""
     print("\n[Feature Engineering]")
     
-    # Price per sqm
-    df['price_per_sqm'] = df['price'] / df['area']
-    
-    # Total amenities
-    amenity_cols = [
-        'has_wifi', 'has_parking', 'has_air_conditioner', 'has_water_heater',
-        'has_kitchen', 'has_fridge', 'has_washing_machine', 'has_tv',
-        'has_bed', 'has_wardrobe'
-    ]
-    df['total_amenities'] = df[amenity_cols].sum(axis=1)
-    df['amenity_score'] = df['total_amenities'] / len(amenity_cols)
-    
-    # Interaction features
-    df['area_rooms'] = df['area'] * df['bedrooms']
-    df['area_amenities'] = df['area'] * df['amenity_score']
+    columns = PRICE_EXTRACTOR.frame_columns(df)
+    new_features = [name for name in PRICE_FEATURES if name not in df.columns]
+    for name in PRICE_FEATURES:
+        df[name] = columns[name]
     
-    print(f"✓ Đã tạo thêm 5 features mới")
+    print(f"✓ Đã tạo thêm {len(new_features)} features mới")
     return df
 
 def prepare_train_test(df):
     """Chuẩn bị train/test sets"""
-    feature_columns = [
-        # Location
-        'province_encoded', 'district_encoded',
-        # Property
-        'area', 'bedrooms', 'bathrooms', 'floor',
-        # Amenities
-        'has_wifi', 'has_parking', 'has_air_conditioner', 'has_water_heater',
-        'has_kitchen', 'has_fridge', 'has_washing_machine', 'has_tv',
-        'has_bed', 'has_wardrobe',
-        # Engineered features
-        'total_amenities', 'amenity_score', 'area_rooms', 'area_amenities'
-    ]
+    feature_columns = list(PRICE_FEATURES)
     
     X = df[feature_columns]
     y = df['price']
@@ -88,20 +78,22 @@ def prepare_train_test(df):
     
     return X_train, X_test, y_train, y_test, feature_columns
 
-def train_baseline_model(X_train, y_train, X_test, y_test):
+def train_baseline_model(X_train, y_train, X_test, y_test, cache, data_hash):
     """Train baseline model"""
     print("\n[Training Baseline Model]")
     
-    model = xgb.XGBRegressor(
-        n_estimators=100,
-        learning_rate=0.1,
-        max_depth=5,
-        random_state=42,
-        n_jobs=-1
+    params = {
+        'n_estimators': 100,
+        'learning_rate': 0.1,
+        'max_depth': 5,
+        'random_state': 42
+    }
+    model = cache.get_or_compute(
+        'baseline',
+        {'data': data_hash, 'features': list(X_train.columns), 'params': params},
+        lambda: xgb.XGBRegressor(n_jobs=-1, **params).fit(X_train, y_train)
     )
     
-    model.fit(X_train, y_train)
-    
     # Evaluate
     y_pred_train = model.predict(X_train)
     y_pred_test = model.predict(X_test)
@@ -114,41 +106,41 @@ def train_baseline_model(X_train, y_train, X_test, y_test):
     
     return model
 
-def tune_hyperparameters(X_train, y_train):
-    """Hyperparameter tuning"""
+def tune_hyperparameters(X_train, y_train, cache, data_hash, strategy='halving', budget_s=600,
+                         workers=None, n_candidates=64):
+    """Hyperparameter tuning (xem price_tuning.py)"""
     print("\n[Hyperparameter Tuning]")
-    print("Đang tìm kiếm hyperparameters tốt nhất...")
-    print("(Có thể mất vài phút)")
-    
-    param_grid = {
-        'n_estimators': [100, 200, 300],
-        'learning_rate': [0.01, 0.05, 0.1],
-        'max_depth': [3, 5, 7],
-        'min_child_weight': [1, 3, 5],
-        'subsample': [0.8, 0.9, 1.0],
-        'colsample_bytree': [0.8, 0.9, 1.0]
+    print(f"Đang tìm kiếm hyperparameters tốt nhất ({strategy})...")
+    if strategy == 'halving':
+        print(f"(Time budget {budget_s:.0f}s, {n_candidates} candidates)")
+    else:
+        print("(Có thể mất vài phút)")
+    
+    # workers chỉ ảnh hưởng kết quả khi hết time budget nên không nằm trong key
+    parts = {
+        'data': data_hash,
+        'features': list(X_train.columns),
+        'strategy': strategy,
+        'budget_s': budget_s,
+        'n_candidates': n_candidates,
+        'max_rounds': MAX_ROUNDS,
+        'early_stopping_rounds': EARLY_STOPPING_ROUNDS
     }
-    
-    xgb_model = xgb.XGBRegressor(random_state=42, n_jobs=-1)
-    
-    grid_search = GridSearchCV(
-        estimator=xgb_model,
-        param_grid=param_grid,
-        cv=5,
-        scoring='neg_mean_absolute_error',
-        verbose=1,
-        n_jobs=-1
-    )
-    
-    grid_search.fit(X_train, y_train)
+    best_model, report = cache.get_or_compute('tuning', parts, lambda: tune(
+        X_train, y_train, strategy=strategy, budget_s=budget_s,
+        workers=workers, n_candidates=n_candidates
+    ))
     
     print("\n✓ Best Hyperparameters:")
-    for param, value in grid_search.best_params_.items():
+    for param, value in report['best_params'].items():
         print(f"  {param}: {value}")
+    print(f"✓ {report['fits']} fits trong {report['wall_clock_s']:.1f}s "
+          f"({report['workers']} processes × {report['threads_per_worker']} threads), "
+          f"CV MAE: {report['cv_mae']:,.0f} VNĐ")
     
-    return grid_search.best_estimator_
+    return best_model, report
 
-def evaluate_model(model, X_train, y_train, X_test, y_test):
+def evaluate_model(model, X_train, y_train, X_test, y_test, cache, data_hash):
     """Đánh giá model chi tiết"""
     print("\n" + "=" * 80)
     print("MODEL EVALUATION")
@@ -184,8 +176,12 @@ def evaluate_model(model, X_train, y_train, X_test, y_test):
     
     # Cross-validation
     print("\n[Cross-Validation (5-fold)]")
-    cv_scores = cross_val_score(model, X_train, y_train, 
-                                 cv=5, scoring='neg_mean_absolute_error')
+    params = {name: value for name, value in model.get_params().items() if name != 'n_jobs'}
+    cv_scores = cache.get_or_compute(
+        'cv',
+        {'data': data_hash, 'features': list(X_train.columns), 'params': params, 'cv': 5},
+        lambda: cross_val_score(model, X_train, y_train, cv=5, scoring='neg_mean_absolute_error')
+    )
     print(f"  CV MAE: {-cv_scores.mean():,.0f} ± {cv_scores.std():,.0f} VNĐ")
     
     return {
@@ -195,63 +191,25 @@ def evaluate_model(model, X_train, y_train, X_test, y_test):
         'test_mape': test_mape
     }
 
-def plot_results(model, X_test, y_test, feature_columns):
-    """Visualize kết quả"""
-    print("\n[Generating Visualizations]")
-    
-    y_pred_test = model.predict(X_test)
-    
-    # Create output directory
-    output_dir = os.path.join(os.path.dirname(__file__), '..', 'outputs')
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 1. Actual vs Predicted
-    fig, axes = plt.subplots(1, 2, figsize=(15, 5))
-    
-    axes[0].scatter(y_test, y_pred_test, alpha=0.5)
-    axes[0].plot([y_test.min(), y_test.max()], 
-                 [y_test.min(), y_test.max()], 
-                 'r--', lw=2)
-    axes[0].set_xlabel('Giá thực tế (VNĐ)')
-    axes[0].set_ylabel('Giá dự đoán (VNĐ)')
-    axes[0].set_title('Actual vs Predicted Price')
-    
-    # 2. Residuals
-    residuals = y_test - y_pred_test
-    axes[1].scatter(y_pred_test, residuals, alpha=0.5)
-    axes[1].axhline(y=0, color='r', linestyle='--', lw=2)
-    axes[1].set_xlabel('Giá dự đoán (VNĐ)')
-    axes[1].set_ylabel('Residuals (VNĐ)')
-    axes[1].set_title('Residual Plot')
-    
-    plt.tight_layout()
-    plot_path = os.path.join(output_dir, 'price_prediction.png')
-    plt.savefig(plot_path, dpi=300, bbox_inches='tight')
-    print(f"✓ Saved: {plot_path}")
-    plt.close()
-    
-    # 3. Feature Importance
-    feature_importance = pd.DataFrame({
+def compute_feature_importance(model, feature_columns):
+    """Feature importance của model, giảm dần"""
+    return pd.DataFrame({
         'feature': feature_columns,
         'importance': model.feature_importances_
     }).sort_values('importance', ascending=False)
+
+def plot_results(model, X_test, y_test, feature_columns, mode='inline'):
+    """Visualize kết quả (reports.py, mode: inline / background / off)"""
+    print("\n[Generating Visualizations]")
     
-    plt.figure(figsize=(10, 8))
-    plt.barh(feature_importance['feature'][:15], 
-             feature_importance['importance'][:15])
-    plt.xlabel('Importance')
-    plt.title('Top 15 Most Important Features')
-    plt.gca().invert_yaxis()
-    plt.tight_layout()
-    
-    importance_path = os.path.join(output_dir, 'feature_importance.png')
-    plt.savefig(importance_path, dpi=300, bbox_inches='tight')
-    print(f"✓ Saved: {importance_path}")
-    plt.close()
-    
-    return feature_importance
+    inputs = {
+        'y_test': y_test,
+        'y_pred_test': model.predict(X_test),
+        'feature_importance': compute_feature_importance(model, feature_columns)
+    }
+    return run_report('price', inputs, mode)
 
-def save_model(model, feature_columns, metrics, feature_importance):
+def save_model(model, feature_columns, metrics, feature_importance, tuning_report=None):
     """Lưu model và metadata"""
     print("\n[Saving Model]")
     
@@ -265,6 +223,7 @@ def save_model(model, feature_columns, metrics, feature_importance):
         'feature_columns': feature_columns,
         'metrics': metrics,
         'feature_importance': feature_importance.to_dict('records'),
+        'schema_version': SCHEMA_VERSION,
         'created_at': datetime.now().isoformat()
     }
     
@@ -272,12 +231,24 @@ def save_model(model, feature_columns, metrics, feature_importance):
     joblib.dump(model_data, model_path)
     print(f"✓ Model saved: {model_path}")
     
+    # Bundle cho API (XGBoost native format, load nhanh, không cần pickle)
+    manifest = save_bundle(
+        os.path.join(models_dir, 'bundle'),
+        price_model=model,
+        feature_names=feature_columns,
+        component_features={'price_model': feature_columns},
+        metadata={'price_model': {'metrics': metrics, 'created_at': model_data['created_at']}}
+    )
+    print(f"✓ Bundle saved: {os.path.join(models_dir, 'bundle')} (version {manifest['version']})")
+    
     # Save metadata
     metadata = {
         'model_type': 'XGBoost Regressor',
         'n_features': len(feature_columns),
         'features': feature_columns,
+        'schema_version': SCHEMA_VERSION,
         'metrics': metrics,
+        'tuning': tuning_report,
         'top_features': feature_importance.head(10).to_dict('records'),
         'created_at': datetime.now().isoformat()
     }
@@ -296,40 +267,53 @@ def test_sample(model, feature_columns):
     print("=" * 80)
     
     sample = {
-        'province_encoded': 1,  # Hồ Chí Minh
-        'district_encoded': 5,
         'area': 25,
         'bedrooms': 1,
         'bathrooms': 1,
         'floor': 2,
-        'has_wifi': 1,
-        'has_parking': 1,
-        'has_air_conditioner': 1,
-        'has_water_heater': 1,
-        'has_kitchen': 1,
-        'has_fridge': 1,
-        'has_washing_machine': 0,
-        'has_tv': 1,
-        'has_bed': 1,
-        'has_wardrobe': 1,
-        'total_amenities': 9,
-        'amenity_score': 0.9,
-        'area_rooms': 25,
-        'area_amenities': 22.5
+        'address': {'district': 'Quận 5', 'city': 'TP. Hồ Chí Minh'},
+        'amenities': {
+            'wifi': True, 'parking': True, 'ac': True, 'water': True, 'kitchen': True,
+            'fridge': True, 'washing': False, 'tv': True, 'bed': True, 'wardrobe': True
+        }
     }
     
-    sample_df = pd.DataFrame([sample])
+    # Extract giống hệt API (feature_schema)
+    extractor = FEATURE_SCHEMA.compile(feature_columns)
+    sample_df = pd.DataFrame(extractor.transform([sample]), columns=feature_columns)
     predicted_price = model.predict(sample_df)[0]
+    total_amenities = int(sample_df['total_amenities'][0])
     
     print("\nThông tin property:")
     print(f"  - Địa điểm: Hồ Chí Minh")
     print(f"  - Diện tích: {sample['area']} m²")
     print(f"  - Phòng ngủ: {sample['bedrooms']}")
     print(f"  - Phòng tắm: {sample['bathrooms']}")
-    print(f"  - Tiện nghi: {sample['total_amenities']}/10")
+    print(f"  - Tiện nghi: {total_amenities}/10")
     print(f"\n✓ Giá dự đoán: {predicted_price:,.0f} VNĐ/tháng")
 
 def main():
+    print("=" * 80)
+    print("PRICE PREDICTION MODEL TRAINING (XGBoost)")
+    print("=" * 80)
+    
+    parser = argparse.ArgumentParser(description='Train price model (XGBoost)')
+    parser.add_argument('--tune', choices=TUNING_STRATEGIES, default='halving',
+                        help='halving: random search + successive halving + early stopping; '
+                             'grid: GridSearchCV 729 tổ hợp như trước')
+    parser.add_argument('--tune-budget', type=float, default=600,
+                        help='Time budget (giây) cho halving')
+    parser.add_argument('--tune-workers', type=int, default=None,
+                        help='Số process song song (mặc định: số CPU)')
+    parser.add_argument('--tune-candidates', type=int, default=64,
+                        help='Số candidate random của halving')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Train lại mọi bước, không dùng cache trong .cache/training')
+    parser.add_argument('--report', choices=REPORT_MODES, default='background',
+                        help='Plots: vẽ ở process nền sau khi lưu model (mặc định), vẽ ngay, hoặc bỏ qua')
+    args = parser.parse_args()
+    cache = RunCache(enabled=not args.no_cache)
+    
     print("\n[1/7] Load dữ liệu...")
     df = load_data()
     
@@ -338,19 +322,24 @@ def main():
     
     print("\n[3/7] Chuẩn bị train/test sets...")
     X_train, X_test, y_train, y_test, feature_columns = prepare_train_test(df)
+    data_hash = fingerprint(X_train, X_test, y_train, y_test)
     
     print("\n[4/7] Train baseline model...")
-    baseline_model = train_baseline_model(X_train, y_train, X_test, y_test)
+    baseline_model = train_baseline_model(X_train, y_train, X_test, y_test, cache, data_hash)
     
     print("\n[5/7] Hyperparameter tuning...")
-    best_model = tune_hyperparameters(X_train, y_train)
+    best_model, tuning_report = tune_hyperparameters(
+        X_train, y_train, cache, data_hash, strategy=args.tune, budget_s=args.tune_budget,
+        workers=args.tune_workers, n_candidates=args.tune_candidates
+    )
     
     print("\n[6/7] Evaluate final model...")
-    metrics = evaluate_model(best_model, X_train, y_train, X_test, y_test)
+    metrics = evaluate_model(best_model, X_train, y_train, X_test, y_test, cache, data_hash)
     
     print("\n[7/7] Save model và visualizations...")
-    feature_importance = plot_results(best_model, X_test, y_test, feature_columns)
-    model_path = save_model(best_model, feature_columns, metrics, feature_importance)
+    feature_importance = compute_feature_importance(best_model, feature_columns)
+    model_path = save_model(best_model, feature_columns, metrics, feature_importance, tuning_report)
+    plot_results(best_model, X_test, y_test, feature_columns, mode=args.report)
     
     # Test
     test_sample(best_model, feature_columns)
@@ -366,6 +355,8 @@ def main():
     print(f"  Test RMSE: {metrics['test_rmse']:,.0f} VNĐ")
     print(f"  Test R²: {metrics['test_r2']:.4f}")
     print(f"  Test MAPE: {metrics['test_mape']:.2f}%")
+    print(f"\nTuning ({tuning_report['strategy']}): {tuning_report['wall_clock_s']:.1f}s, "
+          f"{tuning_report['fits']} fits, CV MAE {tuning_report['cv_mae']:,.0f} VNĐ")
     print("\n→ Bước tiếp theo: Chạy script 3_train_anomaly_model.py")
     print("=" * 80)
 
@@ -6,34 +6,31 @@ Train Isolation Forest để phát hiện giá bất thường
 import os
 import sys
 import json
+import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import joblib
 
-# Cấu hình
-plt.style.use('ggplot')
-sns.set_palette('husl')
-
-print("=" * 80)
-print("ANOMALY DETECTION MODEL TRAINING (Isolation Forest)")
-print("=" * 80)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from model_bundle import save_bundle
+from feature_schema import FEATURE_SCHEMA, ANOMALY_FEATURES, PREP_COLUMNS, SCHEMA_VERSION
+from run_cache import RunCache, fingerprint
+from reports import REPORT_MODES, run_report
 
 def load_data_and_model():
     """Load training data và price model"""
-    # Load CSV
-    data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'training_data.csv')
+    # Load dataset (data/training_data/part-*.parquet)
+    data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'training_data')
     if not os.path.exists(data_path):
-        print(f"\n✗ Không tìm thấy file: {data_path}")
+        print(f"\n✗ Không tìm thấy dataset: {data_path}")
         print("→ Chạy script 1_data_preparation.py trước!")
         sys.exit(1)
     
-    df = pd.read_csv(data_path)
-    print(f"\n✓ Đã load {len(df)} records từ CSV")
+    df = pd.read_parquet(data_path)
+    print(f"\n✓ Đã load {len(df)} records từ Parquet dataset")
     
     # Load price model
     model_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'price_model.pkl')
@@ -53,72 +50,57 @@ def load_data_and_model():
     return df, price_model, feature_columns
 
 def create_anomaly_features(df, price_model, feature_columns):
-    """Tạo features cho anomaly detection"""
-    print("\n[Creating Anomaly Features]")
+    """
+    Tạo features cho anomaly detection (api/feature_schema.py)
     
-    # Recreate engineered features
-    amenity_cols = [
-        'has_wifi', 'has_parking', 'has_air_conditioner', 'has_water_heater',
-        'has_kitchen', 'has_fridge', 'has_washing_machine', 'has_tv',
-        'has_bed', 'has_wardrobe'
-    ]
-    df['total_amenities'] = df[amenity_cols].sum(axis=1)
-    df['amenity_score'] = df['total_amenities'] / len(amenity_cols)
-    df['area_rooms'] = df['area'] * df['bedrooms']
-    df['area_amenities'] = df['area'] * df['amenity_score']
-    
-    # Predict prices
-    X = df[feature_columns]
-    df['predicted_price'] = price_model.predict(X)
+    Returns:
+        (df, feature_stats): feature_stats là mean/std của price_diff trên
+        training data, API cần nó để tính price_diff_zscore
+    """
+    print("\n[Creating Anomaly Features]")
     
-    # Price differences
-    df['price_diff'] = df['price'] - df['predicted_price']
-    df['price_diff_percent'] = (df['price_diff'] / df['predicted_price']) * 100
+    # Recreate engineered features + predict prices
+    price_columns = FEATURE_SCHEMA.compile(feature_columns).frame_columns(df)
+    for name in feature_columns:
+        df[name] = price_columns[name]
+    inputs = {'predicted_price': price_model.predict(df[feature_columns])}
     
-    # Price per sqm
-    df['price_per_sqm'] = df['price'] / df['area']
-    df['predicted_price_per_sqm'] = df['predicted_price'] / df['area']
+    # Stats cho z-score
+    price_diff = FEATURE_SCHEMA.compile(['price_diff']).frame_columns(df, inputs)['price_diff']
+    feature_stats = {'price_diff': {'mean': float(price_diff.mean()), 'std': float(price_diff.std(ddof=1))}}
     
-    # Z-score
-    df['price_diff_zscore'] = (df['price_diff'] - df['price_diff'].mean()) / df['price_diff'].std()
+    # Price differences, price per sqm, z-score (cột tính thêm dạng float32)
+    columns = FEATURE_SCHEMA.compile(ANOMALY_FEATURES, stats=feature_stats).frame_columns(df, inputs)
+    for name in ANOMALY_FEATURES:
+        if name not in PREP_COLUMNS:
+            df[name] = columns[name].astype(np.float32)
     
+    diff_percent = np.abs(columns['price_diff_percent'])
     print(f"✓ Đã tạo anomaly features")
     print(f"\nPrice Prediction Statistics:")
-    print(f"  Mean difference: {df['price_diff'].mean():,.0f} VNĐ")
-    print(f"  Std difference: {df['price_diff'].std():,.0f} VNĐ")
-    print(f"  Mean difference %: {df['price_diff_percent'].mean():.2f}%")
+    print(f"  Mean difference: {feature_stats['price_diff']['mean']:,.0f} VNĐ")
+    print(f"  Std difference: {feature_stats['price_diff']['std']:,.0f} VNĐ")
+    print(f"  Mean difference %: {columns['price_diff_percent'].mean():.2f}%")
     print(f"\nProperties với giá lệch:")
-    print(f"  > 50%: {len(df[abs(df['price_diff_percent']) > 50])} properties")
-    print(f"  > 100%: {len(df[abs(df['price_diff_percent']) > 100])} properties")
+    print(f"  > 50%: {np.count_nonzero(diff_percent > 50)} properties")
+    print(f"  > 100%: {np.count_nonzero(diff_percent > 100)} properties")
     
-    return df
+    return df, feature_stats
+
+def anomaly_matrix(df, anomaly_features):
+    """Ma trận float32 (n_rows, n_features) của anomaly features"""
+    X = np.empty((len(df), len(anomaly_features)), dtype=np.float32)
+    for i, name in enumerate(anomaly_features):
+        X[:, i] = df[name].to_numpy()
+    return X
 
 def prepare_features(df):
     """Chuẩn bị features cho Isolation Forest"""
-    anomaly_features = [
-        # Price-related
-        'price',
-        'predicted_price',
-        'price_diff',
-        'price_diff_percent',
-        'price_per_sqm',
-        'predicted_price_per_sqm',
-        'price_diff_zscore',
-        # Property features
-        'area',
-        'bedrooms',
-        'bathrooms',
-        # Location
-        'province_encoded',
-        'district_encoded',
-        # Amenities
-        'total_amenities',
-        'amenity_score'
-    ]
+    anomaly_features = list(ANOMALY_FEATURES)
     
-    X_anomaly = df[anomaly_features]
+    X_anomaly = anomaly_matrix(df, anomaly_features)
     
-    # Standardize
+    # Standardize (giữ float32)
     scaler = StandardScaler()
     X_anomaly_scaled = scaler.fit_transform(X_anomaly)
     
@@ -127,59 +109,89 @@ def prepare_features(df):
     
     return X_anomaly_scaled, scaler, anomaly_features
 
-def train_isolation_forest(X_anomaly_scaled):
-    """Train Isolation Forest"""
+def train_isolation_forest(X_anomaly_scaled, cache):
+    """
+    Train Isolation Forest
+    
+    Returns:
+        (iso_forest, scores): scores = score_samples trên X_anomaly_scaled,
+        None nếu model lấy từ cache
+    """
     print("\n[Training Isolation Forest]")
     
-    iso_forest = IsolationForest(
-        n_estimators=100,
-        contamination=0.1,  # 10% outliers
-        max_samples='auto',
-        random_state=42,
-        n_jobs=-1,
-        verbose=1
+    params = {
+        'n_estimators': 100,
+        'contamination': 0.1,  # 10% outliers
+        'max_samples': 'auto',
+        'random_state': 42
+    }
+    scores = []
+    
+    def fit():
+        # fit với contamination cố định sẽ score cả X để tính offset_, rồi
+        # evaluate_model lại score lần nữa: fit 'auto' rồi tự tính offset_
+        # (cùng percentile như sklearn) từ scores dùng lại cho evaluate_model
+        iso_forest = IsolationForest(n_jobs=-1, verbose=1, **dict(params, contamination='auto'))
+        iso_forest.fit(X_anomaly_scaled)
+        scores.append(iso_forest.score_samples(X_anomaly_scaled))
+        iso_forest.set_params(contamination=params['contamination'])
+        iso_forest.offset_ = np.percentile(scores[0], 100.0 * params['contamination'])
+        return iso_forest
+    
+    iso_forest = cache.get_or_compute(
+        'isolation_forest',
+        {'data': fingerprint(X_anomaly_scaled), 'features': list(ANOMALY_FEATURES), 'params': params},
+        fit
     )
     
-    iso_forest.fit(X_anomaly_scaled)
-    
     print("✓ Training hoàn tất!")
-    return iso_forest
+    return iso_forest, (scores[0] if scores else None)
 
-def evaluate_model(iso_forest, X_anomaly_scaled, df):
-    """Đánh giá model"""
+def evaluate_model(iso_forest, X_anomaly_scaled, df, scores=None):
+    """Đánh giá model (scores: score_samples đã tính lúc train, nếu có)"""
     print("\n" + "=" * 80)
     print("MODEL EVALUATION")
     print("=" * 80)
     
-    # Predict
-    df['anomaly_label'] = iso_forest.predict(X_anomaly_scaled)
-    df['anomaly_score'] = iso_forest.score_samples(X_anomaly_scaled)
+    # Predict: score 1 lần, nhãn giống IsolationForest.predict (decision_function < 0)
+    if scores is None:
+        scores = iso_forest.score_samples(X_anomaly_scaled)
+    is_anomaly = scores - iso_forest.offset_ < 0
+    df['anomaly_label'] = np.where(is_anomaly, -1, 1).astype(np.int8)
+    df['anomaly_score'] = scores
     
     # Statistics
-    n_anomalies = len(df[df['anomaly_label'] == -1])
-    n_normal = len(df[df['anomaly_label'] == 1])
+    n_anomalies = int(np.count_nonzero(is_anomaly))
+    n_normal = len(df) - n_anomalies
     
     print(f"\n[Results]")
     print(f"  Normal: {n_normal} ({n_normal/len(df)*100:.1f}%)")
     print(f"  Anomalies: {n_anomalies} ({n_anomalies/len(df)*100:.1f}%)")
     print(f"\n[Anomaly Scores]")
-    print(f"  Range: [{df['anomaly_score'].min():.4f}, {df['anomaly_score'].max():.4f}]")
-    print(f"  Mean (normal): {df[df['anomaly_label'] == 1]['anomaly_score'].mean():.4f}")
-    print(f"  Mean (anomaly): {df[df['anomaly_label'] == -1]['anomaly_score'].mean():.4f}")
+    print(f"  Range: [{scores.min():.4f}, {scores.max():.4f}]")
+    print(f"  Mean (normal): {scores[~is_anomaly].mean() if n_normal else np.nan:.4f}")
+    print(f"  Mean (anomaly): {scores[is_anomaly].mean() if n_anomalies else np.nan:.4f}")
     
     return df, n_anomalies, n_normal
 
 def analyze_thresholds(df):
-    """Phân tích thresholds"""
+    """
+    Phân tích thresholds trên mảng score đã sort: quantile nội suy tuyến
+    tính (như pandas), số properties <= ngưỡng bằng searchsorted
+    """
     print("\n[Threshold Analysis]")
     
+    scores = np.sort(df['anomaly_score'].to_numpy())
+    
+    def count_at_most(threshold):
+        return int(np.searchsorted(scores, threshold, side='right'))
+    
     quantiles = [0.01, 0.05, 0.1, 0.15, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
-    score_quantiles = df['anomaly_score'].quantile(quantiles)
+    score_quantiles = dict(zip(quantiles, np.quantile(scores, quantiles)))
     
     print("\nAnomaly Score Quantiles:")
     for q, score in score_quantiles.items():
-        count = len(df[df['anomaly_score'] <= score])
-        print(f"  {q*100:>5.1f}% quantile: {score:>8.4f} ({count:>4} properties)")
+        print(f"  {q*100:>5.1f}% quantile: {score:>8.4f} ({count_at_most(score):>4} properties)")
     
     thresholds = {
         'strict': float(score_quantiles[0.05]),
@@ -190,76 +202,36 @@ def analyze_thresholds(df):
     print("\n[Recommended Thresholds]")
     print(f"\n  Strict (top 5% most anomalous):")
     print(f"    threshold = {thresholds['strict']:.4f}")
-    print(f"    → {len(df[df['anomaly_score'] <= thresholds['strict']])} properties rejected")
+    print(f"    → {count_at_most(thresholds['strict'])} properties rejected")
     
     print(f"\n  Moderate (top 10% most anomalous):")
     print(f"    threshold = {thresholds['moderate']:.4f}")
-    print(f"    → {len(df[df['anomaly_score'] <= thresholds['moderate']])} properties rejected")
+    print(f"    → {count_at_most(thresholds['moderate'])} properties rejected")
     
     print(f"\n  Lenient (top 15% most anomalous):")
     print(f"    threshold = {thresholds['lenient']:.4f}")
-    print(f"    → {len(df[df['anomaly_score'] <= thresholds['lenient']])} properties rejected")
+    print(f"    → {count_at_most(thresholds['lenient'])} properties rejected")
     
     return thresholds
 
-def plot_results(df):
-    """Visualize kết quả"""
+def plot_results(df, mode='inline'):
+    """Visualize kết quả (reports.py, mode: inline / background / off)"""
     print("\n[Generating Visualizations]")
     
-    output_dir = os.path.join(os.path.dirname(__file__), '..', 'outputs')
-    os.makedirs(output_dir, exist_ok=True)
-    
-    fig, axes = plt.subplots(2, 2, figsize=(15, 10))
-    
-    # 1. Histogram of anomaly scores
-    axes[0, 0].hist(df[df['anomaly_label'] == 1]['anomaly_score'], 
-                    bins=30, alpha=0.7, label='Normal', color='blue')
-    axes[0, 0].hist(df[df['anomaly_label'] == -1]['anomaly_score'], 
-                    bins=30, alpha=0.7, label='Anomaly', color='red')
-    axes[0, 0].set_xlabel('Anomaly Score')
-    axes[0, 0].set_ylabel('Count')
-    axes[0, 0].set_title('Distribution of Anomaly Scores')
-    axes[0, 0].legend()
-    
-    # 2. Anomaly score vs price difference
-    axes[0, 1].scatter(df[df['anomaly_label'] == 1]['anomaly_score'],
-                       df[df['anomaly_label'] == 1]['price_diff_percent'],
-                       alpha=0.5, label='Normal', s=20)
-    axes[0, 1].scatter(df[df['anomaly_label'] == -1]['anomaly_score'],
-                       df[df['anomaly_label'] == -1]['price_diff_percent'],
-                       alpha=0.7, label='Anomaly', s=50, color='red')
-    axes[0, 1].set_xlabel('Anomaly Score')
-    axes[0, 1].set_ylabel('Price Difference (%)')
-    axes[0, 1].set_title('Anomaly Score vs Price Difference')
-    axes[0, 1].legend()
-    
-    # 3. Price distribution
-    axes[1, 0].boxplot([df[df['anomaly_label'] == 1]['price'],
-                         df[df['anomaly_label'] == -1]['price']],
-                        labels=['Normal', 'Anomaly'])
-    axes[1, 0].set_ylabel('Price (VNĐ)')
-    axes[1, 0].set_title('Price Distribution by Label')
-    
-    # 4. Price diff % distribution
-    axes[1, 1].boxplot([df[df['anomaly_label'] == 1]['price_diff_percent'],
-                         df[df['anomaly_label'] == -1]['price_diff_percent']],
-                        labels=['Normal', 'Anomaly'])
-    axes[1, 1].set_ylabel('Price Difference (%)')
-    axes[1, 1].set_title('Price Difference by Label')
-    
-    plt.tight_layout()
-    plot_path = os.path.join(output_dir, 'anomaly_detection.png')
-    plt.savefig(plot_path, dpi=300, bbox_inches='tight')
-    print(f"✓ Saved: {plot_path}")
-    plt.close()
+    columns = ['anomaly_label', 'anomaly_score', 'price', 'price_diff_percent']
+    return run_report('anomaly', {'df': df[columns]}, mode)
 
 def analyze_anomalies(df):
     """Phân tích các anomalies"""
     print("\n[Top 10 Most Anomalous Properties]")
     
-    anomalies = df[df['anomaly_label'] == -1].sort_values('anomaly_score')
+    # 10 score thấp nhất (argpartition thay vì lọc + sort cả DataFrame)
+    scores = df['anomaly_score'].to_numpy()
+    top = np.argpartition(scores, 10)[:10] if len(scores) > 10 else np.arange(len(scores))
+    top = top[np.argsort(scores[top], kind='stable')]
+    top = top[df['anomaly_label'].to_numpy()[top] == -1]
     
-    for i, (idx, row) in enumerate(anomalies.head(10).iterrows(), 1):
+    for i, (idx, row) in enumerate(df.iloc[top].iterrows(), 1):
         print(f"\n{i}. Property #{idx}:")
         print(f"   Actual price: {row['price']:,.0f} VNĐ")
         print(f"   Predicted price: {row['predicted_price']:,.0f} VNĐ")
@@ -268,7 +240,7 @@ def analyze_anomalies(df):
         print(f"   Area: {row['area']} m², Bedrooms: {int(row['bedrooms'])}")
         print(f"   Price/m²: {row['price_per_sqm']:,.0f} VNĐ")
 
-def save_model(iso_forest, scaler, anomaly_features, thresholds, n_anomalies, df):
+def save_model(iso_forest, scaler, anomaly_features, feature_stats, thresholds, n_anomalies, df):
     """Lưu model"""
     print("\n[Saving Model]")
     
@@ -280,6 +252,8 @@ def save_model(iso_forest, scaler, anomaly_features, thresholds, n_anomalies, df
         'model': iso_forest,
         'scaler': scaler,
         'anomaly_features': anomaly_features,
+        'feature_stats': feature_stats,
+        'schema_version': SCHEMA_VERSION,
         'thresholds': thresholds,
         'statistics': {
             'n_anomalies': int(n_anomalies),
@@ -294,11 +268,28 @@ def save_model(iso_forest, scaler, anomaly_features, thresholds, n_anomalies, df
     joblib.dump(anomaly_model_data, model_path)
     print(f"✓ Model saved: {model_path}")
     
+    # Bundle cho API (trees dạng mảng NumPy, mmap được, không cần pickle)
+    manifest = save_bundle(
+        os.path.join(models_dir, 'bundle'),
+        anomaly_model=iso_forest,
+        anomaly_scaler=scaler,
+        component_features={'anomaly_model': anomaly_features, 'anomaly_scaler': anomaly_features},
+        feature_stats={'anomaly_model': feature_stats},
+        metadata={'anomaly_model': {
+            'thresholds': thresholds,
+            'statistics': anomaly_model_data['statistics'],
+            'created_at': anomaly_model_data['created_at']
+        }}
+    )
+    print(f"✓ Bundle saved: {os.path.join(models_dir, 'bundle')} (version {manifest['version']})")
+    
     # Save metadata
     metadata = {
         'model_type': 'Isolation Forest',
         'n_features': len(anomaly_features),
         'features': anomaly_features,
+        'schema_version': SCHEMA_VERSION,
+        'feature_stats': feature_stats,
         'thresholds': thresholds,
         'statistics': anomaly_model_data['statistics'],
         'created_at': datetime.now().isoformat()
@@ -311,70 +302,46 @@ def save_model(iso_forest, scaler, anomaly_features, thresholds, n_anomalies, df
     
     return model_path
 
-def test_samples(iso_forest, scaler, anomaly_features, price_model, price_feature_columns, thresholds):
+def test_samples(iso_forest, scaler, anomaly_features, feature_stats, price_model, price_feature_columns, thresholds):
     """Test với các trường hợp mẫu"""
     print("\n" + "=" * 80)
     print("TESTING WITH SAMPLE PROPERTIES")
     print("=" * 80)
     
-    def test_property(name, area, bedrooms, bathrooms, amenities_count, price):
-        # Create features
-        total_amenities = amenities_count
-        amenity_score = amenities_count / 10.0
-        
-        price_features = {
-            'province_encoded': 1,
-            'district_encoded': 5,
-            'area': area,
-            'bedrooms': bedrooms,
-            'bathrooms': bathrooms,
-            'floor': 2,
-            'has_wifi': 1 if amenities_count >= 1 else 0,
-            'has_parking': 1 if amenities_count >= 2 else 0,
-            'has_air_conditioner': 1 if amenities_count >= 3 else 0,
-            'has_water_heater': 1 if amenities_count >= 4 else 0,
-            'has_kitchen': 1 if amenities_count >= 5 else 0,
-            'has_fridge': 1 if amenities_count >= 6 else 0,
-            'has_washing_machine': 1 if amenities_count >= 7 else 0,
-            'has_tv': 1 if amenities_count >= 8 else 0,
-            'has_bed': 1 if amenities_count >= 9 else 0,
-            'has_wardrobe': 1 if amenities_count >= 10 else 0,
-            'total_amenities': total_amenities,
-            'amenity_score': amenity_score,
-            'area_rooms': area * bedrooms,
-            'area_amenities': area * amenity_score
-        }
-        
-        # Predict price
-        X_price = pd.DataFrame([price_features])
-        predicted_price = price_model.predict(X_price)[0]
-        
-        # Create anomaly features
-        price_diff = price - predicted_price
-        price_diff_percent = (price_diff / predicted_price) * 100
-        
-        anomaly_data = {
+    amenity_keys = ['wifi', 'parking', 'ac', 'water', 'kitchen', 'fridge', 'washing', 'tv', 'bed', 'wardrobe']
+    price_extractor = FEATURE_SCHEMA.compile(price_feature_columns)
+    anomaly_extractor = FEATURE_SCHEMA.compile(anomaly_features, stats=feature_stats)
+    
+    def make_property(area, bedrooms, bathrooms, amenities_count, price):
+        # Property document như API nhận
+        return {
             'price': price,
-            'predicted_price': predicted_price,
-            'price_diff': price_diff,
-            'price_diff_percent': price_diff_percent,
-            'price_per_sqm': price / area,
-            'predicted_price_per_sqm': predicted_price / area,
-            'price_diff_zscore': 0,  # Simplified
             'area': area,
             'bedrooms': bedrooms,
             'bathrooms': bathrooms,
-            'province_encoded': 1,
-            'district_encoded': 5,
-            'total_amenities': total_amenities,
-            'amenity_score': amenity_score
+            'floor': 2,
+            'address': {'district': 'Quận 5', 'city': 'TP. Hồ Chí Minh'},
+            'amenities': {key: i < amenities_count for i, key in enumerate(amenity_keys)}
         }
-        
-        # Predict anomaly
-        X_anomaly = pd.DataFrame([anomaly_data])[anomaly_features]
-        X_anomaly_scaled = scaler.transform(X_anomaly)
-        anomaly_score = iso_forest.score_samples(X_anomaly_scaled)[0]
-        
+    
+    # Test cases: (tên, area, bedrooms, bathrooms, amenities, price)
+    cases = [
+        ("Normal Property", 25, 1, 1, 8, 3000000),
+        ("Overpriced (giá quá cao)", 20, 1, 1, 3, 8000000),
+        ("Underpriced (giá quá thấp)", 50, 2, 2, 10, 1500000),
+        ("Luxury Property", 80, 3, 2, 10, 15000000)
+    ]
+    props = [make_property(*case[1:]) for case in cases]
+    
+    # Chấm điểm cả batch 1 lần: predict price -> anomaly features -> score
+    X_price = pd.DataFrame(price_extractor.transform(props), columns=price_feature_columns)
+    predicted_prices = price_model.predict(X_price)
+    X_anomaly = anomaly_extractor.transform(props, inputs={'predicted_price': predicted_prices})
+    anomaly_scores = iso_forest.score_samples(scaler.transform(X_anomaly.astype(np.float32)))
+    
+    for (name, area, bedrooms, _, amenities_count, price), predicted_price, anomaly_score in zip(
+            cases, predicted_prices, anomaly_scores):
+        price_diff_percent = (price - predicted_price) / predicted_price * 100
         is_anomaly = anomaly_score < thresholds['moderate']
         
         print(f"\n{name}:")
@@ -388,41 +355,47 @@ def test_samples(iso_forest, scaler, anomaly_features, price_model, price_featur
             print(f"  ⚠️  CẢNH BÁO: Giá bất thường - cần review!")
         else:
             print(f"  ✓ OK: Giá hợp lý")
-    
-    # Test cases
-    test_property("Normal Property", 25, 1, 1, 8, 3000000)
-    test_property("Overpriced (giá quá cao)", 20, 1, 1, 3, 8000000)
-    test_property("Underpriced (giá quá thấp)", 50, 2, 2, 10, 1500000)
-    test_property("Luxury Property", 80, 3, 2, 10, 15000000)
 
 def main():
+    print("=" * 80)
+    print("ANOMALY DETECTION MODEL TRAINING (Isolation Forest)")
+    print("=" * 80)
+    
+    parser = argparse.ArgumentParser(description='Train anomaly model (Isolation Forest)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Train lại Isolation Forest, không dùng cache trong .cache/training')
+    parser.add_argument('--report', choices=REPORT_MODES, default='background',
+                        help='Plots: vẽ ở process nền sau khi lưu model (mặc định), vẽ ngay, hoặc bỏ qua')
+    args = parser.parse_args()
+    cache = RunCache(enabled=not args.no_cache)
+    
     print("\n[1/8] Load dữ liệu và price model...")
     df, price_model, price_feature_columns = load_data_and_model()
     
     print("\n[2/8] Tạo anomaly features...")
-    df = create_anomaly_features(df, price_model, price_feature_columns)
+    df, feature_stats = create_anomaly_features(df, price_model, price_feature_columns)
     
     print("\n[3/8] Chuẩn bị features cho Isolation Forest...")
     X_anomaly_scaled, scaler, anomaly_features = prepare_features(df)
     
     print("\n[4/8] Train Isolation Forest...")
-    iso_forest = train_isolation_forest(X_anomaly_scaled)
+    iso_forest, train_scores = train_isolation_forest(X_anomaly_scaled, cache)
     
     print("\n[5/8] Evaluate model...")
-    df, n_anomalies, n_normal = evaluate_model(iso_forest, X_anomaly_scaled, df)
+    df, n_anomalies, n_normal = evaluate_model(iso_forest, X_anomaly_scaled, df, train_scores)
     
     print("\n[6/8] Analyze thresholds...")
     thresholds = analyze_thresholds(df)
     
-    print("\n[7/8] Visualize và analyze...")
-    plot_results(df)
+    print("\n[7/8] Analyze anomalies...")
     analyze_anomalies(df)
     
-    print("\n[8/8] Save model...")
-    model_path = save_model(iso_forest, scaler, anomaly_features, thresholds, n_anomalies, df)
+    print("\n[8/8] Save model và visualizations...")
+    model_path = save_model(iso_forest, scaler, anomaly_features, feature_stats, thresholds, n_anomalies, df)
+    plot_results(df, mode=args.report)
     
     # Test
-    test_samples(iso_forest, scaler, anomaly_features, price_model, price_feature_columns, thresholds)
+    test_samples(iso_forest, scaler, anomaly_features, feature_stats, price_model, price_feature_columns, thresholds)
     
     # Summary
     print("\n" + "=" * 80)
@@ -0,0 +1,203 @@
+"""
+Feature store cho data preparation incremental
+
+Lưu features của từng property (đã extract, chưa bỏ outliers) dạng Parquet,
+chia theo bucket của property_id:
+
+    feature_store/
+    ├── _state.json                      # run, high-water mark, schema version
+    ├── bucket=00/run-000001-00000.parquet
+    ├── bucket=00/run-000002-00000.parquet
+    └── ...
+
+Mỗi lần chạy chỉ ghi thêm file mới (run-<số run>-*): row upsert và
+tombstone (_deleted = True) cho property bị xoá / không còn được duyệt.
+Đọc 1 bucket = ghép các file theo thứ tự run, giữ row cuối cùng của mỗi
+property_id, bỏ tombstone. Bucket có quá nhiều file được compact lại
+thành 1 file chỉ gồm rows còn sống.
+"""
+
+import os
+import zlib
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import json_util
+
+KEY = 'property_id'
+DELETED = '_deleted'
+RUN = '_run'
+STATE_FILE = '_state.json'
+
+
+def bucket_of(key: str, buckets: int) -> int:
+    """Bucket ổn định của 1 property_id (crc32, không phụ thuộc process)"""
+    return zlib.crc32(key.encode('utf-8')) % buckets
+
+
+class FeatureStore:
+    """
+    Feature store trong 1 thư mục
+    
+    Args:
+        root: thư mục của store
+        schema: Arrow schema của các cột features (phải có property_id)
+        schema_version: SCHEMA_VERSION của feature schema tạo ra features
+        buckets: số bucket (chỉ dùng khi tạo store mới)
+        max_files_per_bucket: quá số file này thì compact bucket
+    """
+    
+    def __init__(self, root: str, schema: pa.Schema, schema_version: int,
+                 buckets: int = 16, max_files_per_bucket: int = 8):
+        self.root = root
+        self.schema = schema.append(pa.field(DELETED, pa.bool_())).append(pa.field(RUN, pa.int64()))
+        self.columns = list(schema.names)
+        self.schema_version = schema_version
+        self.max_files_per_bucket = max_files_per_bucket
+        self.state = {
+            'schema_version': schema_version,
+            'buckets': buckets,
+            'run': 0,
+            'high_water_mark': {},
+            'updated_at': None
+        }
+        state_path = os.path.join(root, STATE_FILE)
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                self.state = json_util.loads(f.read())
+            self._discard_uncommitted()
+    
+    @property
+    def exists(self) -> bool:
+        return self.state['run'] > 0
+    
+    @property
+    def buckets(self) -> int:
+        return self.state['buckets']
+    
+    @property
+    def high_water_mark(self) -> dict:
+        return self.state['high_water_mark']
+    
+    def _bucket_dir(self, bucket: int) -> str:
+        return os.path.join(self.root, f'bucket={bucket:02d}')
+    
+    def _files(self, bucket: int):
+        directory = self._bucket_dir(bucket)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.parquet')
+        )
+    
+    def bucket_signature(self, bucket: int) -> list:
+        """[tên file, size] các file của bucket: file không bị sửa sau khi ghi, nên bucket có dữ liệu mới thì signature đổi"""
+        return [[os.path.basename(path), os.path.getsize(path)] for path in self._files(bucket)]
+    
+    @staticmethod
+    def _run_of(path: str) -> int:
+        return int(os.path.basename(path).split('-')[1])
+    
+    def _discard_uncommitted(self):
+        """Xoá file của run bị dừng giữa chừng (chưa commit vào _state.json)"""
+        for bucket in range(self.buckets):
+            for path in self._files(bucket):
+                if self._run_of(path) > self.state['run']:
+                    os.remove(path)
+    
+    def begin(self) -> int:
+        """Bắt đầu 1 run ghi mới, trả về số run"""
+        self._next_run = self.state['run'] + 1
+        self._next_part = 0
+        return self._next_run
+    
+    def write(self, upserts: pd.DataFrame, deleted_keys=()):
+        """
+        Ghi 1 chunk của run hiện tại: upserts (cột theo schema) và
+        tombstone cho deleted_keys. Mỗi bucket bị đụng tới được thêm 1 file.
+        """
+        frames = []
+        if len(upserts):
+            frames.append(upserts[self.columns].assign(**{DELETED: False}))
+        deleted_keys = [key for key in deleted_keys if key]
+        if deleted_keys:
+            frames.append(pd.DataFrame({KEY: deleted_keys, DELETED: True}))
+        if not frames:
+            return
+        
+        rows = pd.concat(frames, ignore_index=True).reindex(columns=self.schema.names)
+        rows[RUN] = self._next_run
+        rows[DELETED] = rows[DELETED].astype(bool)
+        buckets = np.array([bucket_of(key, self.buckets) for key in rows[KEY]])
+        for bucket in np.unique(buckets):
+            directory = self._bucket_dir(bucket)
+            os.makedirs(directory, exist_ok=True)
+            table = pa.Table.from_pandas(rows[buckets == bucket], schema=self.schema, preserve_index=False)
+            pq.write_table(table, os.path.join(directory, f'run-{self._next_run:06d}-{self._next_part:05d}.parquet'))
+        self._next_part += 1
+    
+    def commit(self, high_water_mark: dict):
+        """
+        Kết thúc run: ghi _state.json (atomic), sau đó compact các bucket
+        nhiều file. File compact thuộc run đã commit và đứng sau các file cũ,
+        nên dừng giữa lúc compact vẫn đọc ra đúng dữ liệu.
+        """
+        self.state.update({
+            'run': self._next_run,
+            'high_water_mark': high_water_mark,
+            'updated_at': datetime.now().isoformat()
+        })
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, STATE_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json_util.dumps(self.state, indent=2))
+        os.replace(tmp_path, os.path.join(self.root, STATE_FILE))
+        
+        for bucket in range(self.buckets):
+            if len(self._files(bucket)) > self.max_files_per_bucket:
+                self.compact(bucket, run=self._next_run)
+    
+    def _read(self, files, columns=None) -> pd.DataFrame:
+        if not files:
+            return pd.DataFrame({name: pd.Series(dtype=object) for name in columns or self.schema.names})
+        read_columns = None if columns is None else list(dict.fromkeys([*columns, KEY, DELETED]))
+        return pd.concat([pq.read_table(path, columns=read_columns).to_pandas() for path in files],
+                         ignore_index=True)
+    
+    def read_bucket(self, bucket: int, columns=None) -> pd.DataFrame:
+        """Rows còn sống của bucket: bản mới nhất của mỗi property_id, không có tombstone"""
+        df = self._read(self._files(bucket), columns)
+        df = df.drop_duplicates(subset=KEY, keep='last')
+        df = df[~df[DELETED].astype(bool)]
+        return df[columns or self.columns].reset_index(drop=True)
+    
+    def iter_buckets(self, columns=None):
+        for bucket in range(self.buckets):
+            yield self.read_bucket(bucket, columns)
+    
+    def compact(self, bucket: int, run: int):
+        """Gộp các file của bucket thành 1 file (chỉ rows còn sống)"""
+        files = self._files(bucket)
+        live = self.read_bucket(bucket, columns=self.columns).assign(**{DELETED: False, RUN: run})
+        path = os.path.join(self._bucket_dir(bucket), f'run-{run:06d}-compact.parquet')
+        pq.write_table(pa.Table.from_pandas(live, schema=self.schema, preserve_index=False), path + '.tmp')
+        os.replace(path + '.tmp', path)
+        for old in files:
+            if old != path:
+                os.remove(old)
+    
+    def reset(self):
+        """Xoá toàn bộ store (full rebuild)"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        buckets = self.state['buckets']
+        self.state = {
+            'schema_version': self.schema_version,
+            'buckets': buckets,
+            'run': 0,
+            'high_water_mark': {},
+            'updated_at': None
+        }
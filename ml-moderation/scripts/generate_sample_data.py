@@ -1,24 +1,15 @@
 """
 Generate Sample Properties Data
 Tạo dữ liệu mẫu properties thực tế để train ML models
+
+generate_property() import được mà không cần MongoDB (bench/ dùng để tạo
+listing tổng hợp cho load test).
 """
 
 import os
 import sys
 import random
 from datetime import datetime, timedelta
-from pymongo import MongoClient
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# MongoDB connection
-MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/QLChoThueTro')
-
-print("=" * 80)
-print("GENERATE SAMPLE PROPERTIES DATA")
-print("=" * 80)
 
 # Real images from Unsplash (rental properties, rooms, apartments)
 SAMPLE_IMAGES = [
@@ -106,7 +97,7 @@ DESCRIPTIONS = [
     'Căn hộ cao cấp, nội thất sang trọng. Phù hợp gia đình, người đi làm.'
 ]
 
-def generate_realistic_price(area, bedrooms, province, has_amenities):
+def generate_realistic_price(area, bedrooms, province, has_amenities, rnd=random):
     """Tạo giá thuê thực tế dựa trên các yếu tố"""
     # Base price theo tỉnh/thành
     base_prices = {
@@ -125,7 +116,7 @@ def generate_realistic_price(area, bedrooms, province, has_amenities):
     base = base_prices.get(province, 2000000)
     
     # Tính giá theo diện tích (80,000 - 120,000 VNĐ/m²)
-    price_per_sqm = random.randint(80000, 120000)
+    price_per_sqm = rnd.randint(80000, 120000)
     price = base + (area * price_per_sqm)
     
     # Điều chỉnh theo số phòng ngủ
@@ -136,7 +127,7 @@ def generate_realistic_price(area, bedrooms, province, has_amenities):
     price += amenity_count * 200000
     
     # Random variation ±15%
-    variation = random.uniform(0.85, 1.15)
+    variation = rnd.uniform(0.85, 1.15)
     price = int(price * variation)
     
     # Round to nearest 100,000
@@ -144,41 +135,46 @@ def generate_realistic_price(area, bedrooms, province, has_amenities):
     
     return max(1000000, min(50000000, price))  # Min 1M, Max 50M
 
-def generate_property():
-    """Tạo một property thực tế"""
-    province = random.choice(PROVINCES)
+def generate_property(rnd=random):
+    """
+    Tạo một property thực tế
+    
+    Args:
+        rnd: nguồn random (truyền random.Random(seed) để tạo lại đúng dữ liệu)
+    """
+    province = rnd.choice(PROVINCES)
     
     if province == 'Hồ Chí Minh':
-        district = random.choice(DISTRICTS_HCM)
+        district = rnd.choice(DISTRICTS_HCM)
     elif province == 'Hà Nội':
-        district = random.choice(DISTRICTS_HN)
+        district = rnd.choice(DISTRICTS_HN)
     else:
-        district = f'Quận {random.randint(1, 5)}'
+        district = f'Quận {rnd.randint(1, 5)}'
     
     # Random property attributes
-    area = random.choice([15, 18, 20, 22, 25, 28, 30, 35, 40, 45, 50, 60, 70, 80, 100, 120])
-    bedrooms = random.choices([1, 2, 3, 4], weights=[50, 30, 15, 5])[0]
-    bathrooms = random.choices([1, 2, 3], weights=[70, 25, 5])[0]
-    floor = random.randint(1, 10)
+    area = rnd.choice([15, 18, 20, 22, 25, 28, 30, 35, 40, 45, 50, 60, 70, 80, 100, 120])
+    bedrooms = rnd.choices([1, 2, 3, 4], weights=[50, 30, 15, 5])[0]
+    bathrooms = rnd.choices([1, 2, 3], weights=[70, 25, 5])[0]
+    floor = rnd.randint(1, 10)
     
     # Amenities (realistic probabilities)
     amenities = {
-        'hasWifi': random.random() > 0.2,  # 80% có wifi
-        'hasParking': random.random() > 0.4,  # 60% có chỗ đậu xe
-        'hasAirConditioner': random.random() > 0.3,  # 70% có máy lạnh
-        'hasWaterHeater': random.random() > 0.2,  # 80% có nóng lạnh
-        'hasKitchen': random.random() > 0.5,  # 50% có bếp
-        'hasFridge': random.random() > 0.4,  # 60% có tủ lạnh
-        'hasWashingMachine': random.random() > 0.6,  # 40% có máy giặt
-        'hasTV': random.random() > 0.5,  # 50% có TV
-        'hasBed': random.random() > 0.1,  # 90% có giường
-        'hasWardrobe': random.random() > 0.2,  # 80% có tủ quần áo
-        'hasElevator': floor > 3 and random.random() > 0.6,  # 40% có thang máy nếu > tầng 3
-        'hasBalcony': random.random() > 0.5  # 50% có ban công
+        'hasWifi': rnd.random() > 0.2,  # 80% có wifi
+        'hasParking': rnd.random() > 0.4,  # 60% có chỗ đậu xe
+        'hasAirConditioner': rnd.random() > 0.3,  # 70% có máy lạnh
+        'hasWaterHeater': rnd.random() > 0.2,  # 80% có nóng lạnh
+        'hasKitchen': rnd.random() > 0.5,  # 50% có bếp
+        'hasFridge': rnd.random() > 0.4,  # 60% có tủ lạnh
+        'hasWashingMachine': rnd.random() > 0.6,  # 40% có máy giặt
+        'hasTV': rnd.random() > 0.5,  # 50% có TV
+        'hasBed': rnd.random() > 0.1,  # 90% có giường
+        'hasWardrobe': rnd.random() > 0.2,  # 80% có tủ quần áo
+        'hasElevator': floor > 3 and rnd.random() > 0.6,  # 40% có thang máy nếu > tầng 3
+        'hasBalcony': rnd.random() > 0.5  # 50% có ban công
     }
     
     # Generate realistic price
-    price = generate_realistic_price(area, bedrooms, province, amenities)
+    price = generate_realistic_price(area, bedrooms, province, amenities, rnd)
     
     # Map property type to schema values
     property_type_map = {
@@ -206,29 +202,29 @@ def generate_property():
     
     # GeoJSON coordinates [longitude, latitude]
     if province == 'Hồ Chí Minh':
-        longitude = 106.7 + random.uniform(-0.3, 0.3)
-        latitude = 10.7 + random.uniform(-0.3, 0.3)
+        longitude = 106.7 + rnd.uniform(-0.3, 0.3)
+        latitude = 10.7 + rnd.uniform(-0.3, 0.3)
     elif province == 'Hà Nội':
-        longitude = 105.8 + random.uniform(-0.2, 0.2)
-        latitude = 21.0 + random.uniform(-0.2, 0.2)
+        longitude = 105.8 + rnd.uniform(-0.2, 0.2)
+        latitude = 21.0 + rnd.uniform(-0.2, 0.2)
     else:
-        longitude = 106.0 + random.uniform(-1, 1)
-        latitude = 16.0 + random.uniform(-5, 5)
+        longitude = 106.0 + rnd.uniform(-1, 1)
+        latitude = 16.0 + rnd.uniform(-5, 5)
     
     # Create property document matching schema
     property_doc = {
-        'title': f"{random.choice(TITLES)} {area}m² tại {district}",
-        'description': random.choice(DESCRIPTIONS),
-        'propertyType': property_type_map[random.choice(PROPERTY_TYPES)],
+        'title': f"{rnd.choice(TITLES)} {area}m² tại {district}",
+        'description': rnd.choice(DESCRIPTIONS),
+        'propertyType': property_type_map[rnd.choice(PROPERTY_TYPES)],
         'price': price,
         'deposit': price,  # Đặt cọc bằng 1 tháng
         'area': area,
         'address': {
-            'street': f'{random.randint(1, 200)} Đường số {random.randint(1, 50)}',
-            'ward': f'Phường {random.randint(1, 15)}',
+            'street': f'{rnd.randint(1, 200)} Đường số {rnd.randint(1, 50)}',
+            'ward': f'Phường {rnd.randint(1, 15)}',
             'district': district,
             'city': province,
-            'full': f'{random.randint(1, 200)} Đường số {random.randint(1, 50)}, {district}, {province}'
+            'full': f'{rnd.randint(1, 200)} Đường số {rnd.randint(1, 50)}, {district}, {province}'
         },
         'location': {
             'type': 'Point',
@@ -238,19 +234,32 @@ def generate_property():
         'bathrooms': bathrooms,
         'kitchen': 1 if amenities['hasKitchen'] else 0,
         'amenities': amenities_mapped,
-        'images': random.sample(SAMPLE_IMAGES, k=random.randint(3, 6)),  # 3-6 ảnh thực từ Unsplash
-        'status': random.choices(
+        'images': rnd.sample(SAMPLE_IMAGES, k=rnd.randint(3, 6)),  # 3-6 ảnh thực từ Unsplash
+        'status': rnd.choices(
             ['available', 'rented', 'pending'],
             weights=[70, 20, 10]
         )[0],
-        'availableFrom': datetime.now() + timedelta(days=random.randint(0, 30)),
-        'createdAt': datetime.now() - timedelta(days=random.randint(1, 90)),
-        'updatedAt': datetime.now() - timedelta(days=random.randint(0, 30))
+        'availableFrom': datetime.now() + timedelta(days=rnd.randint(0, 30)),
+        'createdAt': datetime.now() - timedelta(days=rnd.randint(1, 90)),
+        'updatedAt': datetime.now() - timedelta(days=rnd.randint(0, 30))
     }
     
     return property_doc
 
 def main():
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+    
+    # Load environment variables
+    load_dotenv()
+    
+    # MongoDB connection
+    MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/QLChoThueTro')
+    
+    print("=" * 80)
+    print("GENERATE SAMPLE PROPERTIES DATA")
+    print("=" * 80)
+    
     try:
         # Connect to MongoDB
         print("\n[1/3] Kết nối MongoDB...")
@@ -334,7 +343,7 @@ def main():
         print("→ Bước tiếp theo: Chạy lại scripts để train models với dữ liệu mới")
         print("   python 1_data_preparation.py")
         print("=" * 80)
-        
+    
     except Exception as e:
         print(f"\n✗ Lỗi: {e}")
         sys.exit(1)
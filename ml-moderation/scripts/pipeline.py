@@ -0,0 +1,248 @@
+"""
+DAG runner cho training pipeline (chạy trong 1 process)
+
+Mỗi Step khai báo artifacts đầu vào / đầu ra (theo tên, giữ trong bộ nhớ và
+kiểm tra kiểu), runner chạy song song các step không phụ thuộc nhau trong
+thread pool và đo thời gian từng step vào run report.
+
+Key của mỗi step là hash của tên step, params và hash các artifacts đầu vào:
+- source: luôn chạy, hash output theo nội dung (artifact.fingerprint())
+- cache: outputs được lưu bằng RunCache, key không đổi thì không chạy lại
+- files: step ghi file (plots, models); key không đổi và file còn thì bỏ qua
+- còn lại: luôn chạy (step rẻ), hash output = hash của key
+
+isolated: step chạy trong process riêng (vd. matplotlib.pyplot không an toàn
+khi nhiều thread cùng vẽ).
+
+heavy: step tự dùng hết CPU (XGBoost n_jobs=-1, process pool của tuning);
+các step heavy chạy lần lượt, không song song với nhau để khỏi
+oversubscribe CPU. Step thường vẫn chạy song song với chúng.
+
+optional: step phụ (vd. vẽ plots), lỗi chỉ cảnh báo, không tính vào `ok`
+của run report.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from joblib.externals.loky import ProcessPoolExecutor
+
+from run_cache import RunCache
+
+
+@dataclass
+class Step:
+    name: str
+    fn: Callable
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    params: Dict[str, Any] = field(default_factory=dict)
+    after: Tuple[str, ...] = ()  # chỉ ràng buộc thứ tự, không truyền artifact
+    source: bool = False
+    cache: bool = False
+    files: Tuple[str, ...] = ()
+    isolated: bool = False
+    heavy: bool = False
+    optional: bool = False
+
+
+class Pipeline:
+    """
+    Args:
+        steps: danh sách Step
+        artifacts: tên artifact -> kiểu (kiểm tra output của step)
+        cache: RunCache lưu outputs của các step cache=True
+        jobs: số step chạy song song
+        state_path: file JSON lưu key của các step ghi file
+    """
+    
+    def __init__(self, steps: List[Step], artifacts: Dict[str, type], cache: RunCache,
+                 jobs: Optional[int] = None, state_path: Optional[str] = None):
+        self.steps = {step.name: step for step in steps}
+        self.artifacts = artifacts
+        self.cache = cache
+        self.jobs = jobs or os.cpu_count() or 1
+        self.state_path = state_path or os.path.join(cache.root, 'pipeline_state.json')
+        
+        if len(self.steps) != len(steps):
+            raise ValueError('Duplicate step names')
+        self.producer = {}
+        for step in steps:
+            for name in step.outputs:
+                if name not in artifacts:
+                    raise ValueError(f'{step.name}: unknown artifact {name!r}')
+                if name in self.producer:
+                    raise ValueError(f'Artifact {name!r} produced by {self.producer[name]} and {step.name}')
+                self.producer[name] = step.name
+        self.deps = {}
+        for step in steps:
+            missing = [name for name in step.inputs if name not in self.producer]
+            missing += [name for name in step.after if name not in self.steps]
+            if missing:
+                raise ValueError(f'{step.name}: unknown inputs / steps {missing}')
+            self.deps[step.name] = {self.producer[name] for name in step.inputs} | set(step.after)
+        self.order = self._topological_order()
+    
+    def _topological_order(self) -> List[str]:
+        order, visiting, done = [], set(), set()
+        
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f'Cycle through step {name!r}')
+            visiting.add(name)
+            for dep in sorted(self.deps[name]):
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+        
+        for name in self.steps:
+            visit(name)
+        return order
+    
+    # ============================================================
+    # Chạy 1 step
+    # ============================================================
+    
+    def _call(self, step: Step, args: list):
+        if step.isolated:
+            with self._lock:
+                if self._processes is None:
+                    self._processes = ProcessPoolExecutor(max_workers=self.jobs)
+            result = self._processes.submit(step.fn, *args, **step.params).result()
+        else:
+            result = step.fn(*args, **step.params)
+        if len(step.outputs) == 1:
+            result = (result,)
+        elif not step.outputs:
+            result = ()
+        outputs = dict(zip(step.outputs, result))
+        for name, value in outputs.items():
+            expected = self.artifacts[name]
+            if not isinstance(value, expected):
+                raise TypeError(f'{step.name}: artifact {name!r} is {type(value).__name__}, '
+                                f'expected {expected.__name__}')
+        return outputs
+    
+    def _run_step(self, step: Step):
+        """Returns: (status, outputs, output hashes, key)"""
+        parts = {'inputs': {name: self.hashes[name] for name in step.inputs}, 'params': step.params}
+        key = RunCache.key(f'step-{step.name}', parts)
+        args = [self.values[name] for name in step.inputs]
+        
+        if step.files and self.cache.enabled and self.state.get(step.name) == key \
+                and all(os.path.exists(path) for path in step.files):
+            return 'up-to-date', {}, {}, key
+        
+        ran = []
+        
+        def compute():
+            ran.append(True)
+            return self._call(step, args)
+        
+        if step.cache:
+            outputs = self.cache.get_or_compute(f'step-{step.name}', parts, compute)
+        else:
+            outputs = compute()
+        
+        if step.source:
+            hashes = {name: value.fingerprint() for name, value in outputs.items()}
+        else:
+            hashes = {name: hashlib.sha256(f'{key}:{name}'.encode('utf-8')).hexdigest() for name in outputs}
+        if step.files:
+            with self._lock:
+                self.state[step.name] = key
+        return ('ran' if ran else 'cached'), outputs, hashes, key
+    
+    # ============================================================
+    # Chạy cả DAG
+    # ============================================================
+    
+    def _load_state(self) -> dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+    
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(self.state_path + '.tmp', self.state_path)
+    
+    def run(self) -> Dict:
+        """
+        Chạy pipeline, trả về run report. Step lỗi thì các step phụ thuộc
+        vào nó bị bỏ qua (status 'blocked'), các nhánh khác vẫn chạy.
+        """
+        started_at = datetime.now().isoformat()
+        start = time.perf_counter()
+        self.values, self.hashes = {}, {}
+        self.state = self._load_state()
+        self._lock = threading.Lock()
+        records = {name: {'step': name, 'status': 'pending', 'seconds': 0.0} for name in self.order}
+        remaining = list(self.order)
+        running = {}
+        
+        def timed(step):
+            step_start = time.perf_counter()
+            result = self._run_step(step)
+            return result, time.perf_counter() - step_start
+        
+        self._processes = None
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as threads:
+                while remaining or running:
+                    for name in list(remaining):
+                        statuses = [records[dep]['status'] for dep in self.deps[name]]
+                        if any(status in ('failed', 'blocked') for status in statuses):
+                            records[name]['status'] = 'blocked'
+                            remaining.remove(name)
+                        elif all(status in ('ran', 'cached', 'up-to-date') for status in statuses):
+                            if self.steps[name].heavy and any(self.steps[other].heavy for other in running.values()):
+                                continue
+                            remaining.remove(name)
+                            records[name]['status'] = 'running'
+                            running[threads.submit(timed, self.steps[name])] = name
+                    if not running:
+                        continue
+                    
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            (status, outputs, hashes, key), seconds = future.result()
+                        except BaseException as e:  # kể cả sys.exit() của các script
+                            records[name].update(status='failed', error=f'{type(e).__name__}: {e}')
+                            if self.steps[name].optional:
+                                print(f"\n⚠️ Step {name} (optional) lỗi: {type(e).__name__}: {e}")
+                            else:
+                                print(f"\n✗ Step {name} lỗi: {type(e).__name__}: {e}")
+                            continue
+                        self.values.update(outputs)
+                        self.hashes.update(hashes)
+                        records[name].update(status=status, seconds=round(seconds, 2), key=key[:12])
+        finally:
+            if self._processes is not None:
+                self._processes.shutdown(wait=True)
+            self._save_state()
+        
+        report = {
+            'started_at': started_at,
+            'wall_clock_s': round(time.perf_counter() - start, 2),
+            'ok': all(record['status'] in ('ran', 'cached', 'up-to-date')
+                      for name, record in records.items() if not self.steps[name].optional),
+            'warnings': [name for name, record in records.items()
+                         if self.steps[name].optional and record['status'] in ('failed', 'blocked')],
+            'steps': [records[name] for name in self.order]
+        }
+        return report
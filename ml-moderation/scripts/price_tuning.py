@@ -0,0 +1,231 @@
+"""
+Hyperparameter search cho price model (XGBoost)
+
+- halving: random search + successive halving, resource là số fold CV.
+  Mọi candidate chạy trên 1 fold, 1/eta tốt nhất chạy thêm fold, ... tới
+  đủ cv folds. Mỗi lần fit dùng early stopping trên một phần của training
+  fold (thay cho n_estimators cố định), điểm là MAE trên validation fold.
+- grid: GridSearchCV trên PARAM_GRID như trước (để so sánh)
+
+Các lần fit chạy song song trong process pool (loky), mỗi process
+threads_per_worker threads, tổng threads không vượt số CPU. Mỗi lần gọi
+halving_search tạo pool riêng (initargs chứa dữ liệu của lần gọi đó).
+halving dừng khi hết time budget (kill các fit đang chạy) và chọn
+candidate tốt nhất trong các candidate đã chạy nhiều fold nhất.
+"""
+
+import os
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+import xgboost as xgb
+from joblib.externals.loky import ProcessPoolExecutor
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import GridSearchCV, KFold, train_test_split
+
+TUNING_STRATEGIES = ('halving', 'grid')
+
+PARAM_GRID = {
+    'n_estimators': [100, 200, 300],
+    'learning_rate': [0.01, 0.05, 0.1],
+    'max_depth': [3, 5, 7],
+    'min_child_weight': [1, 3, 5],
+    'subsample': [0.8, 0.9, 1.0],
+    'colsample_bytree': [0.8, 0.9, 1.0]
+}
+
+# Không gian random search (n_estimators do early stopping quyết định)
+MAX_ROUNDS = 2000
+EARLY_STOPPING_ROUNDS = 50
+EARLY_STOPPING_FRACTION = 0.1
+
+
+def sample_params(rng: np.random.Generator) -> dict:
+    return {
+        'learning_rate': float(np.exp(rng.uniform(np.log(0.01), np.log(0.3)))),
+        'max_depth': int(rng.integers(3, 9)),
+        'min_child_weight': float(np.exp(rng.uniform(0, np.log(10)))),
+        'subsample': float(rng.uniform(0.6, 1.0)),
+        'colsample_bytree': float(rng.uniform(0.6, 1.0))
+    }
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+# ============================================================
+# Worker (chạy trong process của pool)
+# ============================================================
+
+_DATA = {}
+
+
+def _init_worker(X, y, folds, threads, seed):
+    _DATA.update(X=X, y=y, folds=folds, threads=threads, seed=seed)
+
+
+def _fit_fold(params: dict, fold: int):
+    """Fit 1 candidate trên 1 fold, trả về (MAE validation, số rounds tốt nhất, giây)"""
+    start = time.perf_counter()
+    X, y, seed = _DATA['X'], _DATA['y'], _DATA['seed']
+    train_idx, valid_idx = _DATA['folds'][fold]
+    fit_idx, stop_idx = train_test_split(train_idx, test_size=EARLY_STOPPING_FRACTION, random_state=seed)
+    model = xgb.XGBRegressor(
+        n_estimators=MAX_ROUNDS, early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        random_state=seed, n_jobs=_DATA['threads'], **params
+    )
+    model.fit(X[fit_idx], y[fit_idx], eval_set=[(X[stop_idx], y[stop_idx])], verbose=False)
+    mae = mean_absolute_error(y[valid_idx], model.predict(X[valid_idx]))
+    return float(mae), model.best_iteration + 1, time.perf_counter() - start
+
+
+# ============================================================
+# Search
+# ============================================================
+
+def halving_search(X, y, budget_s: float = 600, workers: int = None, n_candidates: int = 64,
+                   eta: int = 3, cv: int = 5, seed: int = 42, verbose: bool = True):
+    """
+    Random search + successive halving theo số fold
+    
+    Returns:
+        (model đã refit trên toàn bộ X, y; report dict)
+    """
+    start = time.perf_counter()
+    deadline = start + budget_s
+    workers = max(1, min(workers or default_workers(), n_candidates))
+    threads = max(1, default_workers() // workers)
+    X_fit, y_fit = X, y
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float64)
+    folds = list(KFold(n_splits=cv, shuffle=True, random_state=seed).split(X))
+    
+    rng = np.random.default_rng(seed)
+    candidates = [sample_params(rng) for _ in range(n_candidates)]
+    scores = {i: [] for i in range(n_candidates)}
+    rounds = {i: [] for i in range(n_candidates)}
+    
+    # Số fold mỗi rung: 1, eta, eta^2... tới cv
+    rung_folds = []
+    folds_needed = 1
+    while folds_needed < cv:
+        rung_folds.append(folds_needed)
+        folds_needed *= eta
+    rung_folds.append(cv)
+    
+    # Pool riêng cho lần gọi này: get_reusable_executor so sánh initargs
+    # (numpy arrays) với pool cũ và lỗi ở lần gọi thứ 2
+    executor = ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(X, y, folds, threads, seed)
+    )
+    fits = 0
+    timed_out = False
+    alive = list(range(n_candidates))
+    try:
+        for rung, n_folds in enumerate(rung_folds):
+            if rung > 0:
+                keep = max(1, math.ceil(len(alive) / eta))
+                alive = sorted(alive, key=lambda i: np.mean(scores[i]))[:keep]
+            todo = [(i, fold) for i in alive for fold in range(len(scores[i]), n_folds)]
+            todo.reverse()
+            pending = {}
+            while todo or pending:
+                # Chỉ submit tối đa workers fit cùng lúc: khi hết budget không
+                # còn fit nào xếp hàng trong pool, chỉ kill các fit đang chạy
+                while todo and len(pending) < workers:
+                    i, fold = todo.pop()
+                    pending[executor.submit(_fit_fold, candidates[i], fold)] = i
+                done, _ = wait(pending, timeout=max(0.0, deadline - time.perf_counter()),
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    timed_out = True
+                    break
+                for future in done:
+                    i = pending.pop(future)
+                    mae, best_rounds, _ = future.result()
+                    scores[i].append(mae)
+                    rounds[i].append(best_rounds)
+                    fits += 1
+            if verbose:
+                print(f"  Rung {rung + 1}/{len(rung_folds)}: {len(alive)} candidates × {n_folds} folds "
+                      f"({time.perf_counter() - start:.0f}s)")
+            if timed_out:
+                print(f"  ⚠️ Hết time budget ({budget_s:.0f}s), dừng ở rung {rung + 1}")
+                break
+    finally:
+        # Hết budget: không chờ các fit đang chạy dở
+        executor.shutdown(wait=not timed_out, kill_workers=timed_out)
+    
+    evaluated = [i for i in range(n_candidates) if scores[i]]
+    if not evaluated:
+        raise RuntimeError(f'No candidate finished within the {budget_s:.0f}s budget')
+    most_folds = max(len(scores[i]) for i in evaluated)
+    best = min((i for i in evaluated if len(scores[i]) == most_folds), key=lambda i: np.mean(scores[i]))
+    best_params = dict(candidates[best], n_estimators=int(round(np.mean(rounds[best]))))
+    
+    # Refit trên toàn bộ dữ liệu (giữ tên cột nếu X là DataFrame)
+    model = xgb.XGBRegressor(random_state=seed, n_jobs=-1, **best_params)
+    model.fit(X_fit, y_fit)
+    report = {
+        'strategy': 'halving',
+        'wall_clock_s': round(time.perf_counter() - start, 1),
+        'fits': fits,
+        'candidates': n_candidates,
+        'workers': workers,
+        'threads_per_worker': threads,
+        'budget_s': budget_s,
+        'timed_out': timed_out,
+        'cv_folds': most_folds,
+        'cv_mae': float(np.mean(scores[best])),
+        'best_params': best_params
+    }
+    return model, report
+
+
+def grid_search(X, y, workers: int = None, cv: int = 5, seed: int = 42, verbose: bool = True):
+    """
+    GridSearchCV trên PARAM_GRID: workers process song song, mỗi XGBoost
+    1 thread (không oversubscribe)
+    """
+    start = time.perf_counter()
+    workers = workers or default_workers()
+    search = GridSearchCV(
+        estimator=xgb.XGBRegressor(random_state=seed, n_jobs=1),
+        param_grid=PARAM_GRID,
+        cv=cv,
+        scoring='neg_mean_absolute_error',
+        verbose=1 if verbose else 0,
+        n_jobs=workers
+    )
+    search.fit(X, y)
+    report = {
+        'strategy': 'grid',
+        'wall_clock_s': round(time.perf_counter() - start, 1),
+        'fits': len(search.cv_results_['params']) * cv,
+        'candidates': len(search.cv_results_['params']),
+        'workers': workers,
+        'threads_per_worker': 1,
+        'cv_folds': cv,
+        'cv_mae': float(-search.best_score_),
+        'best_params': search.best_params_
+    }
+    return search.best_estimator_, report
+
+
+def tune(X, y, strategy: str = 'halving', budget_s: float = 600, workers: int = None,
+         n_candidates: int = 64, verbose: bool = True):
+    """
+    Chạy hyperparameter search theo strategy
+    
+    Raises:
+        ValueError: strategy không hợp lệ
+    """
+    if strategy == 'halving':
+        return halving_search(X, y, budget_s=budget_s, workers=workers,
+                              n_candidates=n_candidates, verbose=verbose)
+    if strategy == 'grid':
+        return grid_search(X, y, workers=workers, verbose=verbose)
+    raise ValueError(f'Unknown tuning strategy {strategy!r}, expected one of {TUNING_STRATEGIES}')
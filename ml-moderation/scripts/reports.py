@@ -0,0 +1,239 @@
+"""
+Report (plots PNG) của các training scripts
+
+matplotlib / seaborn chỉ được import khi thật sự vẽ (backend Agg, không cần
+màn hình), nên không làm chậm lúc khởi động scripts. Mỗi report được key
+theo hash của dữ liệu đầu vào (dự đoán trên test set, feature importance,
+anomaly scores...): key không đổi và file PNG còn thì không vẽ lại.
+
+Chế độ (--report của 2_train / 3_train):
+- inline: vẽ ngay trong process
+- background: ghi input ra file rồi vẽ trong process riêng, script không
+  phải chờ (log ở outputs/.reports/<report>.log)
+- off: không vẽ
+
+Chạy report đang chờ bằng tay:
+    python reports.py <report> <input.joblib>
+"""
+
+import os
+import sys
+import subprocess
+
+import joblib
+
+from run_cache import RunCache, fingerprint
+
+REPORT_MODES = ('background', 'inline', 'off')
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'outputs')
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
+    plt.style.use('ggplot')
+    sns.set_palette('husl')
+    return plt
+
+
+# ============================================================
+# Reports
+# ============================================================
+
+def price_report(y_test, y_pred_test, feature_importance, output_dir=OUTPUT_DIR):
+    """Actual vs Predicted, residuals và feature importance của price model"""
+    plt = _pyplot()
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # 1. Actual vs Predicted
+    fig, axes = plt.subplots(1, 2, figsize=(15, 5))
+    
+    axes[0].scatter(y_test, y_pred_test, alpha=0.5)
+    axes[0].plot([y_test.min(), y_test.max()],
+                 [y_test.min(), y_test.max()],
+                 'r--', lw=2)
+    axes[0].set_xlabel('Giá thực tế (VNĐ)')
+    axes[0].set_ylabel('Giá dự đoán (VNĐ)')
+    axes[0].set_title('Actual vs Predicted Price')
+    
+    # 2. Residuals
+    residuals = y_test - y_pred_test
+    axes[1].scatter(y_pred_test, residuals, alpha=0.5)
+    axes[1].axhline(y=0, color='r', linestyle='--', lw=2)
+    axes[1].set_xlabel('Giá dự đoán (VNĐ)')
+    axes[1].set_ylabel('Residuals (VNĐ)')
+    axes[1].set_title('Residual Plot')
+    
+    plt.tight_layout()
+    plot_path = os.path.join(output_dir, 'price_prediction.png')
+    plt.savefig(plot_path, dpi=300, bbox_inches='tight')
+    print(f"✓ Saved: {plot_path}")
+    plt.close()
+    
+    # 3. Feature Importance
+    plt.figure(figsize=(10, 8))
+    plt.barh(feature_importance['feature'][:15],
+             feature_importance['importance'][:15])
+    plt.xlabel('Importance')
+    plt.title('Top 15 Most Important Features')
+    plt.gca().invert_yaxis()
+    plt.tight_layout()
+    
+    importance_path = os.path.join(output_dir, 'feature_importance.png')
+    plt.savefig(importance_path, dpi=300, bbox_inches='tight')
+    print(f"✓ Saved: {importance_path}")
+    plt.close()
+    return [plot_path, importance_path]
+
+
+def anomaly_report(df, output_dir=OUTPUT_DIR):
+    """
+    Phân bố anomaly score và giá theo nhãn (df cần các cột anomaly_label,
+    anomaly_score, price, price_diff_percent)
+    """
+    plt = _pyplot()
+    os.makedirs(output_dir, exist_ok=True)
+    
+    fig, axes = plt.subplots(2, 2, figsize=(15, 10))
+    
+    # 1. Histogram of anomaly scores
+    axes[0, 0].hist(df[df['anomaly_label'] == 1]['anomaly_score'],
+                    bins=30, alpha=0.7, label='Normal', color='blue')
+    axes[0, 0].hist(df[df['anomaly_label'] == -1]['anomaly_score'],
+                    bins=30, alpha=0.7, label='Anomaly', color='red')
+    axes[0, 0].set_xlabel('Anomaly Score')
+    axes[0, 0].set_ylabel('Count')
+    axes[0, 0].set_title('Distribution of Anomaly Scores')
+    axes[0, 0].legend()
+    
+    # 2. Anomaly score vs price difference
+    axes[0, 1].scatter(df[df['anomaly_label'] == 1]['anomaly_score'],
+                       df[df['anomaly_label'] == 1]['price_diff_percent'],
+                       alpha=0.5, label='Normal', s=20)
+    axes[0, 1].scatter(df[df['anomaly_label'] == -1]['anomaly_score'],
+                       df[df['anomaly_label'] == -1]['price_diff_percent'],
+                       alpha=0.7, label='Anomaly', s=50, color='red')
+    axes[0, 1].set_xlabel('Anomaly Score')
+    axes[0, 1].set_ylabel('Price Difference (%)')
+    axes[0, 1].set_title('Anomaly Score vs Price Difference')
+    axes[0, 1].legend()
+    
+    # 3. Price distribution
+    axes[1, 0].boxplot([df[df['anomaly_label'] == 1]['price'],
+                        df[df['anomaly_label'] == -1]['price']])
+    # set_xticks thay cho boxplot(labels=...) (bị bỏ từ matplotlib 3.11)
+    axes[1, 0].set_xticks([1, 2], ['Normal', 'Anomaly'])
+    axes[1, 0].set_ylabel('Price (VNĐ)')
+    axes[1, 0].set_title('Price Distribution by Label')
+    
+    # 4. Price diff % distribution
+    axes[1, 1].boxplot([df[df['anomaly_label'] == 1]['price_diff_percent'],
+                        df[df['anomaly_label'] == -1]['price_diff_percent']])
+    axes[1, 1].set_xticks([1, 2], ['Normal', 'Anomaly'])
+    axes[1, 1].set_ylabel('Price Difference (%)')
+    axes[1, 1].set_title('Price Difference by Label')
+    
+    plt.tight_layout()
+    plot_path = os.path.join(output_dir, 'anomaly_detection.png')
+    plt.savefig(plot_path, dpi=300, bbox_inches='tight')
+    print(f"✓ Saved: {plot_path}")
+    plt.close()
+    return [plot_path]
+
+
+REPORTS = {
+    'price': (price_report, ['price_prediction.png', 'feature_importance.png']),
+    'anomaly': (anomaly_report, ['anomaly_detection.png'])
+}
+
+
+# ============================================================
+# Chạy report (cache theo key, inline / background)
+# ============================================================
+
+def report_key(name: str, inputs: dict) -> str:
+    parts = {}
+    for arg, value in inputs.items():
+        if hasattr(value, 'shape') or hasattr(value, 'columns'):
+            parts[arg] = fingerprint(value)
+        else:
+            parts[arg] = value
+    return RunCache.key(f'report-{name}', parts)
+
+
+def _key_path(name: str, output_dir: str) -> str:
+    return os.path.join(output_dir, '.reports', f'{name}.key')
+
+
+def is_up_to_date(name: str, key: str, output_dir: str = OUTPUT_DIR) -> bool:
+    key_path = _key_path(name, output_dir)
+    if not os.path.exists(key_path):
+        return False
+    with open(key_path, encoding='utf-8') as f:
+        if f.read().strip() != key:
+            return False
+    return all(os.path.exists(os.path.join(output_dir, filename)) for filename in REPORTS[name][1])
+
+
+def render(name: str, inputs: dict, key: str, output_dir: str = OUTPUT_DIR):
+    """Vẽ report rồi ghi key (sau khi các file PNG đã được ghi xong)"""
+    REPORTS[name][0](output_dir=output_dir, **inputs)
+    key_path = _key_path(name, output_dir)
+    os.makedirs(os.path.dirname(key_path), exist_ok=True)
+    with open(key_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(key)
+    os.replace(key_path + '.tmp', key_path)
+
+
+def run_report(name: str, inputs: dict, mode: str = 'background', output_dir: str = OUTPUT_DIR):
+    """
+    Tạo report name từ inputs theo mode (xem REPORT_MODES)
+    
+    Returns:
+        Popen của process background, hoặc None
+    """
+    if mode not in REPORT_MODES:
+        raise ValueError(f'Unknown report mode {mode!r}, expected one of {REPORT_MODES}')
+    if mode == 'off':
+        print(f"  Report {name}: bỏ qua (--report off)")
+        return None
+    
+    key = report_key(name, inputs)
+    if is_up_to_date(name, key, output_dir):
+        print(f"♻️ Report {name} không đổi, dùng lại: {', '.join(REPORTS[name][1])}")
+        return None
+    
+    if mode == 'inline':
+        render(name, inputs, key, output_dir)
+        return None
+    
+    state_dir = os.path.join(output_dir, '.reports')
+    os.makedirs(state_dir, exist_ok=True)
+    input_path = os.path.join(state_dir, f'{name}-{key[:12]}.joblib')
+    joblib.dump({'inputs': inputs, 'key': key, 'output_dir': output_dir}, input_path)
+    log_path = os.path.join(state_dir, f'{name}.log')
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), name, input_path],
+            stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    print(f"  Report {name} đang được tạo ở background (pid {process.pid}, log: {log_path})")
+    return process
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in REPORTS:
+        print(f"Usage: python reports.py {{{','.join(REPORTS)}}} <input.joblib>")
+        sys.exit(2)
+    name, input_path = sys.argv[1:]
+    job = joblib.load(input_path)
+    render(name, job['inputs'], job['key'], job['output_dir'])
+    os.remove(input_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,83 +1,304 @@
 """
 Run All Training Scripts
 Chạy toàn bộ quy trình training từ đầu đến cuối
+
+Các bước của 1_data_preparation / 2_train_price_model / 3_train_anomaly_model
+chạy trong cùng 1 process dưới dạng DAG (pipeline.py): dữ liệu và models
+truyền giữa các bước trong bộ nhớ, bước có input không đổi được dùng lại
+từ cache, các bước độc lập (plots, threshold analysis...) chạy song song.
+Thời gian từng bước được ghi vào outputs/pipeline_report.json.
+
+Chạy:
+    python run_all.py
+    python run_all.py --skip-prepare          # dùng data/training_data hiện có
+    python run_all.py --incremental --tune-budget 300
 """
 
 import os
 import sys
-import subprocess
-import time
+import json
+import argparse
+import importlib
+from dataclasses import dataclass
 from datetime import datetime
+from functools import partial
 
-print("=" * 80)
-print("ML MODERATION - FULL TRAINING PIPELINE")
-print("=" * 80)
-print(f"\nBắt đầu lúc: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+import pandas as pd
 
-def run_script(script_name, description):
-    """Chạy một Python script"""
-    print("\n" + "=" * 80)
-    print(f"🚀 {description}")
-    print("=" * 80)
-    
-    start_time = time.time()
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, '..', 'api'))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from pipeline import Pipeline, Step
+from price_tuning import TUNING_STRATEGIES
+from run_cache import RunCache, NullCache, fingerprint
+
+prep = importlib.import_module('1_data_preparation')
+price = importlib.import_module('2_train_price_model')
+anomaly = importlib.import_module('3_train_anomaly_model')
+
+MODELS_DIR = os.path.join(SCRIPTS_DIR, '..', 'models')
+OUTPUTS_DIR = os.path.join(SCRIPTS_DIR, '..', 'outputs')
+
+# Các step cache=True đã được pipeline cache, không cache thêm bên trong
+NO_CACHE = NullCache()
+
+# Plots (reports.py), bỏ qua với --no-report
+REPORT_STEPS = ('plot_price', 'plot_anomaly')
+
+
+# ============================================================
+# Artifacts
+# ============================================================
+
+@dataclass
+class TrainingData:
+    df: pd.DataFrame
     
-    try:
-        result = subprocess.run(
-            [sys.executable, script_name],
-            check=True,
-            cwd=os.path.dirname(__file__)
-        )
+    def fingerprint(self) -> str:
+        return fingerprint(self.df)
+
+
+@dataclass
+class PriceSplit:
+    X_train: pd.DataFrame
+    X_test: pd.DataFrame
+    y_train: pd.Series
+    y_test: pd.Series
+    feature_columns: list
+
+
+@dataclass
+class PriceModel:
+    model: object
+    feature_columns: list
+    tuning: dict
+
+
+@dataclass
+class AnomalyData:
+    df: pd.DataFrame
+    feature_stats: dict
+
+
+@dataclass
+class AnomalyModel:
+    model: object
+    scaler: object
+    features: list
+
+
+@dataclass
+class ScoredData:
+    df: pd.DataFrame
+    n_anomalies: int
+
+
+ARTIFACTS = {
+    'training_data': TrainingData,
+    'price_split': PriceSplit,
+    'baseline_model': object,
+    'price_model': PriceModel,
+    'price_metrics': dict,
+    'anomaly_data': AnomalyData,
+    'anomaly_model': AnomalyModel,
+    'scored_data': ScoredData,
+    'thresholds': dict
+}
+
+
+# ============================================================
+# Steps
+# ============================================================
+
+def load_training_data(prepare=True, batch_size=5000, incremental=False, skip_delete_check=False, from_json=None,
+                       full_delete_scan=False):
+    if prepare:
+        prep.prepare_dataset(batch_size, incremental, skip_delete_check, from_json, full_delete_scan)
+    return TrainingData(price.load_data())
+
+
+def split_price_data(data):
+    df = price.feature_engineering(data.df.copy())
+    X_train, X_test, y_train, y_test, feature_columns = price.prepare_train_test(df)
+    return PriceSplit(X_train, X_test, y_train, y_test, feature_columns)
+
+
+def train_baseline(split):
+    return price.train_baseline_model(split.X_train, split.y_train, split.X_test, split.y_test, NO_CACHE, None)
+
+
+def tune_price_model(split, strategy, budget_s, n_candidates, workers=None):
+    model, report = price.tune_hyperparameters(
+        split.X_train, split.y_train, NO_CACHE, None, strategy=strategy, budget_s=budget_s,
+        workers=workers, n_candidates=n_candidates
+    )
+    return PriceModel(model, split.feature_columns, report)
+
+
+def evaluate_price_model(split, price_model):
+    return price.evaluate_model(price_model.model, split.X_train, split.y_train,
+                                split.X_test, split.y_test, NO_CACHE, None)
+
+
+def plot_price_model(split, price_model):
+    price.plot_results(price_model.model, split.X_test, split.y_test, split.feature_columns)
+
+
+def save_price_model(price_model, metrics):
+    importance = price.compute_feature_importance(price_model.model, price_model.feature_columns)
+    price.save_model(price_model.model, price_model.feature_columns, metrics, importance, price_model.tuning)
+
+
+def check_price_sample(price_model):
+    price.test_sample(price_model.model, price_model.feature_columns)
+
+
+def create_anomaly_data(data, price_model):
+    df, feature_stats = anomaly.create_anomaly_features(data.df.copy(), price_model.model,
+                                                        price_model.feature_columns)
+    return AnomalyData(df, feature_stats)
+
+
+def train_anomaly_model(anomaly_data):
+    X_scaled, scaler, features = anomaly.prepare_features(anomaly_data.df)
+    iso_forest, _ = anomaly.train_isolation_forest(X_scaled, NO_CACHE)
+    return AnomalyModel(iso_forest, scaler, features)
+
+
+def score_anomalies(anomaly_data, anomaly_model):
+    X_scaled = anomaly_model.scaler.transform(anomaly.anomaly_matrix(anomaly_data.df, anomaly_model.features))
+    df, n_anomalies, _ = anomaly.evaluate_model(anomaly_model.model, X_scaled, anomaly_data.df.copy())
+    return ScoredData(df, n_anomalies)
+
+
+def analyze_thresholds(scored):
+    return anomaly.analyze_thresholds(scored.df)
+
+
+def plot_anomalies(scored):
+    anomaly.plot_results(scored.df)
+
+
+def report_anomalies(scored):
+    anomaly.analyze_anomalies(scored.df)
+
+
+def save_anomaly_model(anomaly_model, anomaly_data, scored, thresholds):
+    anomaly.save_model(anomaly_model.model, anomaly_model.scaler, anomaly_model.features,
+                       anomaly_data.feature_stats, thresholds, scored.n_anomalies, scored.df)
+
+
+def check_anomaly_samples(anomaly_model, anomaly_data, price_model, thresholds):
+    anomaly.test_samples(anomaly_model.model, anomaly_model.scaler, anomaly_model.features,
+                         anomaly_data.feature_stats, price_model.model, price_model.feature_columns, thresholds)
+
+
+def build_pipeline(args) -> Pipeline:
+    models = partial(os.path.join, MODELS_DIR)
+    outputs = partial(os.path.join, OUTPUTS_DIR)
+    steps = [
+        # Dữ liệu
+        Step('training_data', load_training_data, outputs=('training_data',), source=True, params={
+            'prepare': not args.skip_prepare, 'batch_size': args.batch_size, 'incremental': args.incremental,
+            'skip_delete_check': args.skip_delete_check, 'from_json': args.from_json,
+            'full_delete_scan': args.full_delete_scan
+        }),
         
-        elapsed_time = time.time() - start_time
-        print(f"\n✓ Hoàn thành trong {elapsed_time:.1f}s")
-        return True
+        # Price model
+        Step('price_split', split_price_data, ('training_data',), ('price_split',)),
+        # heavy: dùng hết CPU (fit / predict với n_jobs=-1, process pool) nên
+        # không chạy song song với nhau
+        Step('baseline', train_baseline, ('price_split',), ('baseline_model',), cache=True, heavy=True),
+        Step('tune_price', partial(tune_price_model, workers=args.tune_workers), ('price_split',), ('price_model',),
+             params={'strategy': args.tune, 'budget_s': args.tune_budget, 'n_candidates': args.tune_candidates},
+             cache=True, heavy=True),
+        Step('evaluate_price', evaluate_price_model, ('price_split', 'price_model'), ('price_metrics',), cache=True,
+             heavy=True),
+        Step('plot_price', plot_price_model, ('price_split', 'price_model'), isolated=True, optional=True,
+             files=(outputs('price_prediction.png'), outputs('feature_importance.png'))),
+        Step('save_price', save_price_model, ('price_model', 'price_metrics'),
+             files=(models('price_model.pkl'), models('price_model_metadata.json'), models('bundle'))),
+        Step('check_price_sample', check_price_sample, ('price_model',)),
         
-    except subprocess.CalledProcessError as e:
-        print(f"\n✗ Lỗi khi chạy {script_name}: {e}")
-        return False
-    except Exception as e:
-        print(f"\n✗ Lỗi không xác định: {e}")
-        return False
+        # Anomaly model
+        Step('anomaly_features', create_anomaly_data, ('training_data', 'price_model'), ('anomaly_data',),
+             heavy=True),
+        Step('train_anomaly', train_anomaly_model, ('anomaly_data',), ('anomaly_model',), cache=True, heavy=True),
+        Step('score_anomalies', score_anomalies, ('anomaly_data', 'anomaly_model'), ('scored_data',), heavy=True),
+        Step('thresholds', analyze_thresholds, ('scored_data',), ('thresholds',)),
+        Step('plot_anomaly', plot_anomalies, ('scored_data',), isolated=True, optional=True,
+             files=(outputs('anomaly_detection.png'),)),
+        Step('report_anomalies', report_anomalies, ('scored_data',)),
+        # Cùng ghi models/bundle nên chạy sau save_price
+        Step('save_anomaly', save_anomaly_model, ('anomaly_model', 'anomaly_data', 'scored_data', 'thresholds'),
+             after=('save_price',),
+             files=(models('anomaly_model.pkl'), models('anomaly_model_metadata.json'), models('bundle'))),
+        Step('check_anomaly_samples', check_anomaly_samples,
+             ('anomaly_model', 'anomaly_data', 'price_model', 'thresholds'))
+    ]
+    if args.no_report:
+        steps = [step for step in steps if step.name not in REPORT_STEPS]
+    return Pipeline(steps, ARTIFACTS, RunCache(enabled=not args.no_cache), jobs=args.jobs)
+
+
+def print_report(report):
+    print("\n" + "=" * 80)
+    print("PIPELINE REPORT")
+    print("=" * 80)
+    for record in report['steps']:
+        print(f"  {record['step']:<24} {record['status']:<11} {record['seconds']:>8.2f}s"
+              + (f"  {record['error']}" if 'error' in record else ''))
+
 
 def main():
-    total_start = time.time()
+    print("=" * 80)
+    print("ML MODERATION - FULL TRAINING PIPELINE")
+    print("=" * 80)
+    print(f"\nBắt đầu lúc: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     
-    # Step 1: Data Preparation
-    success = run_script(
-        "1_data_preparation.py",
-        "BƯỚC 1/3: Chuẩn bị dữ liệu từ MongoDB"
-    )
-    if not success:
-        print("\n❌ Training thất bại ở bước 1!")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Chạy toàn bộ training pipeline')
+    parser.add_argument('--skip-prepare', action='store_true',
+                        help='Không chạy data preparation, dùng data/training_data hiện có')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--skip-delete-check', action='store_true')
+    parser.add_argument('--full-delete-scan', action='store_true')
+    parser.add_argument('--from-json', metavar='PATH')
+    parser.add_argument('--tune', choices=TUNING_STRATEGIES, default='halving')
+    parser.add_argument('--tune-budget', type=float, default=600)
+    parser.add_argument('--tune-workers', type=int, default=None)
+    parser.add_argument('--tune-candidates', type=int, default=64)
+    parser.add_argument('--no-report', action='store_true',
+                        help='Không vẽ plots')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Số bước chạy song song (mặc định: số CPU)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Chạy lại mọi bước, không dùng cache / bỏ qua bước đã cập nhật')
+    args = parser.parse_args()
     
-    # Step 2: Train Price Model
-    success = run_script(
-        "2_train_price_model.py",
-        "BƯỚC 2/3: Train XGBoost Price Prediction Model"
-    )
-    if not success:
-        print("\n❌ Training thất bại ở bước 2!")
-        sys.exit(1)
+    report = build_pipeline(args).run()
+    print_report(report)
     
-    # Step 3: Train Anomaly Model
-    success = run_script(
-        "3_train_anomaly_model.py",
-        "BƯỚC 3/3: Train Isolation Forest Anomaly Detection Model"
-    )
-    if not success:
-        print("\n❌ Training thất bại ở bước 3!")
-        sys.exit(1)
+    os.makedirs(OUTPUTS_DIR, exist_ok=True)
+    report_path = os.path.join(OUTPUTS_DIR, 'pipeline_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
     
-    # Summary
-    total_time = time.time() - total_start
+    if not report['ok']:
+        print("\n❌ Training thất bại!")
+        sys.exit(1)
+    if report['warnings']:
+        print(f"\n⚠️ Các bước phụ lỗi (models vẫn được lưu): {', '.join(report['warnings'])}")
     
+    total_time = report['wall_clock_s']
     print("\n" + "=" * 80)
     print("🎉 HOÀN THÀNH TẤT CẢ!")
     print("=" * 80)
     print(f"\nTổng thời gian: {total_time:.1f}s (~{total_time/60:.1f} phút)")
     print(f"Kết thúc lúc: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Run report: {report_path}")
     
     print("\n📁 Models đã được lưu tại:")
     print("  - ml-moderation/models/price_model.pkl")
@@ -0,0 +1,115 @@
+"""
+Cache kết quả các bước training (content-addressed)
+
+Mỗi bước (baseline, tuning, cross-validation, ...) được lưu theo key là hash
+của: tên bước, fingerprint dữ liệu, danh sách features, hyperparameters và
+phiên bản thư viện. Chạy lại script với cùng input thì dùng lại kết quả
+thay vì train lại; đổi dữ liệu / features / params thì key đổi theo.
+
+    .cache/training/
+    ├── baseline/<sha256>.pkl
+    ├── tuning/<sha256>.pkl
+    └── cv/<sha256>.pkl
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+import sklearn
+import xgboost as xgb
+import joblib
+
+# Tăng khi đổi cách tính key / định dạng entry
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.cache', 'training')
+
+
+def fingerprint(*arrays) -> str:
+    """Hash nội dung của DataFrame / Series / ndarray (cả tên cột và dtype)"""
+    digest = hashlib.sha256()
+    for data in arrays:
+        if isinstance(data, (pd.DataFrame, pd.Series)):
+            columns = list(data.columns) if isinstance(data, pd.DataFrame) else [data.name]
+            digest.update(json.dumps([str(c) for c in columns]).encode('utf-8'))
+            digest.update(str(list(np.atleast_1d(data.dtypes))).encode('utf-8'))
+            digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+        else:
+            data = np.ascontiguousarray(data)
+            digest.update(f'{data.dtype}{data.shape}'.encode('utf-8'))
+            digest.update(data.tobytes())
+    return digest.hexdigest()
+
+
+class RunCache:
+    """
+    Cache trên đĩa cho các bước training
+    
+    Args:
+        root: thư mục cache
+        enabled: False thì luôn tính lại (vẫn ghi đè entry mới)
+        max_entries: số entry giữ lại mỗi bước (xoá entry cũ nhất)
+    """
+    
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, enabled: bool = True, max_entries: int = 20):
+        self.root = root
+        self.enabled = enabled
+        self.max_entries = max_entries
+    
+    @staticmethod
+    def key(step: str, parts: dict) -> str:
+        payload = {
+            'cache_version': CACHE_VERSION,
+            'step': step,
+            'xgboost': xgb.__version__,
+            'sklearn': sklearn.__version__,
+            'parts': parts
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    
+    def _path(self, step: str, key: str) -> str:
+        return os.path.join(self.root, step, f'{key}.pkl')
+    
+    def get_or_compute(self, step: str, parts: dict, compute):
+        """
+        Trả về kết quả đã cache của step với parts, không có thì gọi
+        compute() và lưu lại
+        """
+        key = self.key(step, parts)
+        path = self._path(step, key)
+        if self.enabled and os.path.exists(path):
+            try:
+                value = joblib.load(path)
+                os.utime(path)
+                print(f"♻️ Dùng lại cache: {step} ({key[:12]})")
+                return value
+            except Exception as e:
+                print(f"⚠️ Cache {step} ({key[:12]}) lỗi, tính lại: {e}")
+        
+        value = compute()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(value, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        self._prune(step)
+        return value
+    
+    def _prune(self, step: str):
+        directory = os.path.join(self.root, step)
+        entries = sorted(
+            (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.pkl')),
+            key=os.path.getmtime
+        )
+        for path in entries[:-self.max_entries]:
+            os.remove(path)
+
+
+class NullCache:
+    """Không cache (khi bước bao ngoài đã được cache, vd. trong pipeline.py)"""
+    
+    enabled = False
+    
+    def get_or_compute(self, step: str, parts: dict, compute):
+        return compute()